@@ -56,6 +56,20 @@ class SaveReplay(Enum):
     on_loss = auto()
 
 
+class SearchAggregation(Enum):
+    visit_weighted = auto()
+    average_score = auto()
+    robust_max = auto()
+    min_regret = auto()
+
+
+class SearchBackend(Enum):
+    mcts = auto()
+    expectiminimax = auto()
+    # defined last since it shadows `enum.auto` in the class body
+    auto = auto()
+
+
 class BotModes(Enum):
     challenge_user = auto()
     accept_challenge = auto()
@@ -73,6 +87,24 @@ class _FoulPlayConfig:
     smogon_stats: str = None
     search_time_ms: int
     parallelism: int
+    search_reserved_cpus: int = 1
+    search_pin_workers: bool = False
+    use_time_bank: bool = False
+    search_early_stopping: bool = False
+    search_cache_size: int = 1024
+    search_cache_file: Optional[str] = None
+    ponder: bool = False
+    search_workers: list[str] = []
+    search_sample_in_workers: bool = False
+    search_aggregation: SearchAggregation = SearchAggregation.visit_weighted
+    search_backend: SearchBackend = SearchBackend.auto
+    search_focus_moves: int = 0
+    search_belief_particles: int = 0
+    search_telemetry_file: Optional[str] = None
+    search_seed: Optional[int] = None
+    search_iterations: Optional[int] = None
+    lead_cache_size: int = 256
+    lead_cache_file: Optional[str] = None
     run_count: int
     team_name: str
     user_to_challenge: str
@@ -121,8 +153,136 @@ class _FoulPlayConfig:
         parser.add_argument(
             "--search-parallelism",
             type=int,
+            default=0,
+            help="Number of states to search in parallel. "
+            "0 uses every CPU available to this process, including cgroup CPU quotas, "
+            "except the ones in --search-reserved-cpus",
+        )
+        parser.add_argument(
+            "--search-reserved-cpus",
+            type=int,
             default=1,
-            help="Number of states to search in parallel",
+            help="Number of CPUs left for the main process and LLM threads "
+            "when sizing or pinning the search workers",
+        )
+        parser.add_argument(
+            "--search-pin-workers",
+            action="store_true",
+            help="Pin each search worker to its own CPU, "
+            "and the main process to the reserved CPUs",
+        )
+        parser.add_argument(
+            "--search-time-bank",
+            action="store_true",
+            help="Plan each decision's search time from the battle timer instead of --search-time-ms. "
+            "Only has an effect when the battle timer is on",
+        )
+        parser.add_argument(
+            "--search-early-stopping",
+            action="store_true",
+            help="Stop searching the remaining sampled battles once the best move is safely ahead",
+        )
+        parser.add_argument(
+            "--search-cache-size",
+            type=int,
+            default=1024,
+            help="Number of searched states to remember so that repeated states are not searched again. "
+            "0 disables the cache",
+        )
+        parser.add_argument(
+            "--search-cache-file",
+            default=None,
+            help="If set, the search cache is loaded from and saved to this JSON file",
+        )
+        parser.add_argument(
+            "--ponder",
+            action="store_true",
+            help="Search the likely battles of next turn while waiting for the opponent",
+        )
+        parser.add_argument(
+            "--search-workers",
+            type=lambda s: [a.strip() for a in s.split(",") if a.strip()],
+            default=[],
+            help="Comma separated host:port addresses of remote search workers to search on "
+            "instead of this machine, e.g. 10.0.0.2:9000,10.0.0.3:9000. "
+            "Start them with `python -m fp.search.distributed`",
+        )
+        parser.add_argument(
+            "--search-sample-in-workers",
+            action="store_true",
+            help="Sample the battles to search in the search workers instead of the main process. "
+            "Each worker samples, converts and searches its share of the battles, "
+            "so sampling runs on every CPU. Searched states are not cached in this mode. "
+            "Has no effect with --search-workers",
+        )
+        parser.add_argument(
+            "--search-aggregation",
+            default="visit_weighted",
+            choices=[e.name for e in SearchAggregation],
+            help="How the searches of every sampled battle are combined into one move. "
+            "visit_weighted picks randomly among the moves visited nearly as much as the best one, "
+            "the others pick the move with the best average score, worst-case score, "
+            "or worst-case regret across the sampled battles",
+        )
+        parser.add_argument(
+            "--search-backend",
+            default="auto",
+            choices=[e.name for e in SearchBackend],
+            help="How each sampled battle is searched. "
+            "mcts is a Monte Carlo tree search, expectiminimax is an exhaustive "
+            "iterative deepening search that is best when few pokemon are left. "
+            "auto uses expectiminimax in endgames and mcts otherwise",
+        )
+        parser.add_argument(
+            "--search-focus-moves",
+            type=int,
+            default=0,
+            help="If set, half of each decision's search time is spent on a second round "
+            "of battles where only this many of the best moves of the first round can be chosen. "
+            "0 searches every move for the whole time",
+        )
+        parser.add_argument(
+            "--search-belief-particles",
+            type=int,
+            default=0,
+            help="If set, each battle keeps this many sampled opponent teams across turns, "
+            "drops the ones that new information rules out, and draws the battles to search from them. "
+            "0 samples every decision's battles from scratch. Not used with --search-sample-in-workers",
+        )
+        parser.add_argument(
+            "--search-telemetry-file",
+            default=None,
+            help="If set, a JSON line describing where each decision's search time went "
+            "is appended to this file",
+        )
+        parser.add_argument(
+            "--search-seed",
+            type=int,
+            default=None,
+            help="Seed the sampling of battles and the final choice of every decision "
+            "so that the same battle state is sampled and decided the same way every run. "
+            "The engine's search is not seeded",
+        )
+        parser.add_argument(
+            "--search-iterations",
+            type=int,
+            default=None,
+            help="Target number of MCTS iterations per battle instead of --search-time-ms. "
+            "Converted to a time budget using the search throughput calibrated at startup "
+            "and measured during play",
+        )
+        parser.add_argument(
+            "--lead-cache-size",
+            type=int,
+            default=256,
+            help="Number of team previews whose lead choice is remembered, "
+            "so that facing the same team again only needs a short search or none. "
+            "0 disables the cache",
+        )
+        parser.add_argument(
+            "--lead-cache-file",
+            default=None,
+            help="If set, the lead cache is loaded from and saved to this JSON file",
         )
         parser.add_argument(
             "--run-count",
@@ -176,6 +336,24 @@ class _FoulPlayConfig:
         self.smogon_stats = args.smogon_stats_format
         self.search_time_ms = args.search_time_ms
         self.parallelism = args.search_parallelism
+        self.search_reserved_cpus = args.search_reserved_cpus
+        self.search_pin_workers = args.search_pin_workers
+        self.use_time_bank = args.search_time_bank
+        self.search_early_stopping = args.search_early_stopping
+        self.search_cache_size = args.search_cache_size
+        self.search_cache_file = args.search_cache_file
+        self.ponder = args.ponder
+        self.search_workers = args.search_workers
+        self.search_sample_in_workers = args.search_sample_in_workers
+        self.search_aggregation = SearchAggregation[args.search_aggregation]
+        self.search_backend = SearchBackend[args.search_backend]
+        self.search_focus_moves = args.search_focus_moves
+        self.search_belief_particles = args.search_belief_particles
+        self.search_telemetry_file = args.search_telemetry_file
+        self.search_seed = args.search_seed
+        self.search_iterations = args.search_iterations
+        self.lead_cache_size = args.lead_cache_size
+        self.lead_cache_file = args.lead_cache_file
         self.run_count = args.run_count
         self.team_name = args.team_name or self.pokemon_format
         self.user_to_challenge = args.user_to_challenge
@@ -551,6 +551,7 @@ class _SmogonSets(PokemonSets):
         self.current_pkmn_sets_url = ""
         self.raw_pkmn_sets = {}
         self.all_pkmn_counts = {}
+        self.teammate_rates = {}
         self.pkmn_sets = {}
         self.pkmn_mode = "uninitialized"
 
@@ -700,8 +701,25 @@ class _SmogonSets(PokemonSets):
             )[:6]
             final_infos[normalized_name][EFFECTIVENESS] = matchup_effectiveness
 
+        self.teammate_rates = self._get_teammate_rates()
         return final_infos
 
+    def _get_teammate_rates(self) -> dict[str, dict[str, float]]:
+        """
+        For every pokemon, the count of each of its teammates relative to its own count.
+        Only pokemon that have stats of their own are kept as teammates,
+        and a row keeps the order of `all_pkmn_counts`
+        """
+        rates = {}
+        for pkmn_name, counts in self.all_pkmn_counts.items():
+            rates[pkmn_name] = {}
+            if counts[RAW_COUNT] <= 0:
+                continue
+            for teammate_name, teammate_count in counts[TEAMMATES].items():
+                if teammate_name in self.all_pkmn_counts:
+                    rates[pkmn_name][teammate_name] = teammate_count / counts[RAW_COUNT]
+        return rates
+
     def _get_smogon_stats_file_name(self, game_mode, month_delta=1):
         """
         Gets the smogon stats url based on the game mode
@@ -1,5 +1,6 @@
 from collections import defaultdict
 from collections import namedtuple
+from copy import copy
 
 import constants
 import logging
@@ -13,6 +14,8 @@ from fp.helpers import calculate_stats
 
 from fp.helpers import POKEMON_TYPE_INDICES
 
+from fp.search.time_bank import TimeBank
+
 
 logger = logging.getLogger(__name__)
 
@@ -21,7 +24,7 @@ LastUsedMove = namedtuple("LastUsedMove", ["pokemon_name", "move", "turn"])
 DamageDealt = namedtuple(
     "DamageDealt", ["attacker", "defender", "move", "percent_damage", "crit"]
 )
-StatRange = namedtuple("Range", ["min", "max"])
+StatRange = namedtuple("StatRange", ["min", "max"])
 
 
 # Based on the format, this dict controls which pokemon will be replaced during team preview
@@ -86,6 +89,7 @@ class Battle:
         self.pokemon_format = None
         self.generation = None
         self.time_remaining = None
+        self.time_bank = TimeBank()
 
         self.request_json = None
         self.msg_list = []
@@ -125,6 +129,16 @@ class Battle:
         self.started = True
         self.rqid = user_json[constants.RQID]
 
+    def clone(self):
+        """
+        A copy to sample one world from, much cheaper than `deepcopy`.
+        The opponent's side is copied as `deepcopy` would. Everything else,
+        including our side, is shared with this battle and must not be modified
+        """
+        battle = copy(self)
+        battle.opponent = self.opponent.clone()
+        return battle
+
     def mega_evolve_possible(self):
         return (
             any(g in self.generation for g in constants.MEGA_EVOLVE_GENERATIONS)
@@ -184,7 +198,7 @@ class Battler:
     def __init__(self):
         self.active = None
         self.reserve = []
-        self.side_conditions = defaultdict(lambda: 0)
+        self.side_conditions = defaultdict(int)
 
         self.name = None
         self.trapped = False
@@ -204,6 +218,14 @@ class Battler:
         self.last_selected_move = LastUsedMove("", "", 0)
         self.last_used_move = LastUsedMove("", "", 0)
 
+    def clone(self):
+        battler = copy(self)
+        battler.side_conditions = copy(self.side_conditions)
+        if self.active is not None:
+            battler.active = self.active.clone()
+        battler.reserve = [pkmn.clone() for pkmn in self.reserve]
+        return battler
+
     def possible_mega_evolutions(self):
         result = {}
         for pkmn in self.reserve + [self.active]:
@@ -590,8 +612,8 @@ class Pokemon:
         self.moves = []
         self.status = None
         self.volatile_statuses = []
-        self.volatile_status_durations = defaultdict(lambda: 0)
-        self.boosts = defaultdict(lambda: 0)
+        self.volatile_status_durations = defaultdict(int)
+        self.boosts = defaultdict(int)
         self.rest_turns = 0
         self.sleep_turns = 0
         self.knocked_off = False
@@ -773,6 +795,15 @@ class Pokemon:
         p.fainted = True
         return p
 
+    def clone(self):
+        """A copy of this pokemon whose attributes, moves and containers are its own"""
+        pkmn = copy(self)
+        for name, value in vars(self).items():
+            if isinstance(value, (list, dict, set)):
+                setattr(pkmn, name, copy(value))
+        pkmn.moves = [copy(m) for m in self.moves]
+        return pkmn
+
     def __eq__(self, other):
         return self.name == other.name and self.level == other.level
 
@@ -227,14 +227,25 @@ def inactive(battle, split_msg):
             logger.debug("Time left: {}".format(time_left))
         except ValueError:
             logger.warning("{} is not a valid int".format(capture.group(1)))
+            return
         except AttributeError:
             logger.warning(
                 "'{}' does not match the regex '{}'".format(split_msg[2], regex_string)
             )
+            return
+
+        # e.g. '|inactive|Time left: 135 sec this turn | 240 sec total'
+        total_time_left = None
+        if len(split_msg) > 3:
+            total_capture = re.search(r"(\d+) sec total", split_msg[3])
+            if total_capture is not None:
+                total_time_left = int(total_capture.group(1))
+        battle.time_bank.observe(time_left, total_time_left)
 
 
 def inactiveoff(battle, _):
     battle.time_remaining = None
+    battle.time_bank.reset()
 
 
 def user_just_switched_into_zoroark(battle, switch_or_drag):
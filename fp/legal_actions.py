@@ -0,0 +1,89 @@
+from copy import copy, deepcopy
+
+import constants
+from fp.battle import Battle, Battler, Move, Pokemon
+from fp.helpers import normalize_name
+
+
+def _request_move_name(move: dict) -> str:
+    # hidden power's ID is always 'hiddenpower' regardless of the type
+    if move[constants.ID] == constants.HIDDEN_POWER:
+        return Move(normalize_name(move["move"])).name
+    return Move(move[constants.ID]).name
+
+
+def _locked_move_names(battler: Battler) -> set[str]:
+    # `lock_moves` disables moves on the battler's active pokemon in-place
+    battler = copy(battler)
+    battler.active = deepcopy(battler.active)
+    battler.lock_moves()
+    return {m.name for m in battler.active.moves if m.disabled}
+
+
+def legal_moves(battle: Battle) -> list[str]:
+    active_request = battle.request_json[constants.ACTIVE][0]
+    moves = [
+        _request_move_name(m)
+        for m in active_request[constants.MOVES]
+        if not m.get(constants.DISABLED, False)
+    ]
+
+    # the request does not know everything the bot does, e.g. that fakeout will fail
+    # only trust that if it leaves something to choose
+    locked = _locked_move_names(battle.user)
+    if any(m not in locked for m in moves):
+        moves = [m for m in moves if m not in locked]
+
+    if active_request.get(constants.CAN_TERASTALLIZE, False):
+        moves += ["{}-tera".format(m) for m in moves]
+    elif active_request.get(constants.CAN_MEGA_EVO, False):
+        moves += ["{}-mega".format(m) for m in moves]
+
+    return moves
+
+
+def legal_switches(battle: Battle) -> list[str]:
+    side_pokemon = battle.request_json[constants.SIDE][constants.POKEMON]
+    # revival blessing's "switch" chooses a fainted pokemon to revive
+    reviving = any(p.get(constants.REVIVING, False) for p in side_pokemon)
+
+    switches = []
+    for pkmn_dict in side_pokemon:
+        if pkmn_dict[constants.ACTIVE]:
+            continue
+        fainted = pkmn_dict[constants.CONDITION].endswith(constants.FNT)
+        if fainted != reviving:
+            continue
+        name = Pokemon.from_switch_string(pkmn_dict[constants.DETAILS]).name
+        pkmn = battle.user.find_pokemon_in_reserves(name)
+        if pkmn is not None:
+            switches.append("{} {}".format(constants.SWITCH_STRING, pkmn.name))
+    return switches
+
+
+def legal_actions(battle: Battle) -> list[str]:
+    """
+    Every decision the bot can send for `battle.request_json`, in the same
+    format as the search results, e.g. `["thunderbolt", "switch pikachu"]`.
+
+    Empty when there is nothing to decide: no request, team preview,
+    or waiting for the opponent
+    """
+    request_json = battle.request_json
+    if (
+        request_json is None
+        or battle.team_preview
+        or request_json.get(constants.WAIT, False)
+    ):
+        return []
+
+    if request_json.get(constants.FORCE_SWITCH, False):
+        return legal_switches(battle)
+
+    actions = legal_moves(battle)
+    trapped = request_json[constants.ACTIVE][0].get(
+        constants.TRAPPED, False
+    ) or request_json[constants.ACTIVE][0].get(constants.MAYBE_TRAPPED, False)
+    if not trapped:
+        actions += legal_switches(battle)
+    return actions
@@ -3,6 +3,7 @@ import asyncio
 import concurrent.futures
 from copy import deepcopy
 import logging
+import time
 
 from data.pkmn_sets import RandomBattleTeamDatasets, TeamDatasets
 from data.pkmn_sets import SmogonSets
@@ -12,7 +13,9 @@ from config import FoulPlayConfig, SaveReplay
 from fp.battle import LastUsedMove, Pokemon, Battle
 from fp.battle_modifier import async_update_battle, process_battle_updates
 from fp.helpers import normalize_name
+from fp.legal_actions import legal_actions
 from fp.search.main import find_best_move
+from fp.search.ponder import Ponderers
 from fp.llm_battle import async_pick_move_with_llm
 
 from fp.websocket_client import PSWebsocketClient
@@ -79,28 +82,50 @@ def extract_battle_factory_tier_from_msg(msg):
     return normalize_name(tier_name)
 
 
+async def async_search_move(battle_copy, deadline):
+    loop = asyncio.get_event_loop()
+    with concurrent.futures.ThreadPoolExecutor() as pool:
+        return await loop.run_in_executor(pool, find_best_move, battle_copy, deadline)
+
+
 async def async_pick_move(battle):
+    started = time.monotonic()
+
+    battle_copy = deepcopy(battle)
+    if not battle_copy.team_preview:
+        battle_copy.user.update_from_request_json(battle_copy.request_json)
+
+    # nothing to decide, answer without searching
+    actions = legal_actions(battle_copy)
+    if len(actions) == 1:
+        best_move = actions[0]
+        logger.info("Only one legal action: {}".format(best_move))
+        if FoulPlayConfig.ponder:
+            Ponderers.for_battle(battle_copy.battle_tag).cancel()
+
     # Check if LLM is enabled in config
-    if FoulPlayConfig.use_llm:
-        return await async_pick_move_with_llm(
+    elif FoulPlayConfig.use_llm:
+        decision = await async_pick_move_with_llm(
             battle,
             use_llm=True,
             llm_probability=FoulPlayConfig.llm_probability
         )
-    
+        battle.time_bank.record_spent(time.monotonic() - started)
+        return decision
+
     # Original MCTS-only path
-    battle_copy = deepcopy(battle)
-    if not battle_copy.team_preview:
-        battle_copy.user.update_from_request_json(battle_copy.request_json)
+    else:
+        deadline = None
+        if FoulPlayConfig.use_time_bank:
+            deadline = battle.time_bank.deadline(battle, now=started)
+        best_move = await async_search_move(battle_copy, deadline)
 
-    loop = asyncio.get_event_loop()
-    with concurrent.futures.ThreadPoolExecutor() as pool:
-        best_move = await loop.run_in_executor(pool, find_best_move, battle_copy)
     battle.user.last_selected_move = LastUsedMove(
         battle.user.active.name,
         best_move.removesuffix("-tera").removesuffix("-mega"),
         battle.turn,
     )
+    battle.time_bank.record_spent(time.monotonic() - started)
     return format_decision(battle_copy, best_move)
 
 
@@ -337,6 +362,7 @@ async def pokemon_battle(ps_websocket_client, pokemon_battle_type, team_dict):
                 else None
             )
             logger.info("Winner: {}".format(winner))
+            Ponderers.remove(battle.battle_tag)
             await ps_websocket_client.send_message(battle.battle_tag, ["gg"])
             if FoulPlayConfig.save_replay == SaveReplay.always or (
                 FoulPlayConfig.save_replay == SaveReplay.on_loss
@@ -0,0 +1,194 @@
+import logging
+import math
+
+from config import SearchAggregation
+
+logger = logging.getLogger(__name__)
+
+
+# One-sided z-score used to decide if the best move's lead is safe (~95%)
+EARLY_STOPPING_Z_SCORE = 1.645
+
+# Never stop before this many worlds have been searched
+EARLY_STOPPING_MIN_WORLDS = 4
+
+
+def visit_fractions(mcts_result) -> dict[str, float]:
+    return {
+        s1_option.move_choice: s1_option.visits / mcts_result.total_visits
+        for s1_option in mcts_result.side_one
+    }
+
+
+class StreamingPolicy:
+    """
+    The visit-weighted policy of a set of searched worlds, built up one result at a time
+
+    `total_weight` is the sum of the sample chances of every world that was dispatched,
+    including the ones that have not finished yet
+    """
+
+    def __init__(self, total_weight: float):
+        self.total_weight = total_weight
+        self.seen_weight = 0
+        self.policy = {}
+        self.world_policies = []
+
+    def add(self, mcts_result, sample_chance: float):
+        fractions = visit_fractions(mcts_result)
+        for move, fraction in fractions.items():
+            self.policy[move] = self.policy.get(move, 0) + sample_chance * fraction
+        self.world_policies.append((sample_chance, fractions))
+        self.seen_weight += sample_chance
+
+    def best_move(self):
+        return max(self.policy.items(), key=lambda x: x[1])[0]
+
+    def lead_is_safe(self) -> bool:
+        """
+        Whether searching the remaining worlds is unlikely to change the best move.
+
+        Either the lead is larger than the weight of every world not yet seen,
+        so it cannot be overtaken, or the per-world lead over every other move is
+        positive with ~95% confidence using a normal approximation
+        """
+        if len(self.policy) < 2:
+            return len(self.world_policies) > 0
+
+        best_move = self.best_move()
+        best = self.policy[best_move]
+        runner_up = max(v for m, v in self.policy.items() if m != best_move)
+        unseen_weight = max(0, self.total_weight - self.seen_weight)
+        if best - runner_up > unseen_weight:
+            return True
+
+        if len(self.world_policies) < EARLY_STOPPING_MIN_WORLDS:
+            return False
+
+        # effective number of worlds when they are not equally weighted
+        sum_weights = sum(w for w, _ in self.world_policies)
+        sum_squared_weights = sum(w * w for w, _ in self.world_policies)
+        if sum_weights <= 0:
+            return False
+        n_eff = sum_weights**2 / sum_squared_weights
+
+        for move in self.policy:
+            if move == best_move:
+                continue
+            leads = [
+                (w, fractions.get(best_move, 0) - fractions.get(move, 0))
+                for w, fractions in self.world_policies
+            ]
+            mean = sum(w * d for w, d in leads) / sum_weights
+            variance = sum(w * (d - mean) ** 2 for w, d in leads) / sum_weights
+            if mean - EARLY_STOPPING_Z_SCORE * math.sqrt(variance / n_eff) <= 0:
+                return False
+
+        return True
+
+
+class WorldMoveMatrix:
+    """
+    The searches of every sampled world as a worlds x moves matrix.
+
+    `visit_fractions[w][m]` is the fraction of world `w`'s visits that went to move `m`
+    and `scores[w][m]` is its average score, or None if it was not visited in that world
+    """
+
+    def __init__(self, mcts_results):
+        self.moves = []
+        self.weights = []
+        self.visit_fractions = []
+        self.scores = []
+
+        move_indices = {}
+        for mcts_result, sample_chance, _ in mcts_results:
+            if mcts_result.total_visits <= 0:
+                continue
+            for s1_option in mcts_result.side_one:
+                if s1_option.move_choice not in move_indices:
+                    move_indices[s1_option.move_choice] = len(self.moves)
+                    self.moves.append(s1_option.move_choice)
+
+        for mcts_result, sample_chance, _ in mcts_results:
+            if mcts_result.total_visits <= 0:
+                continue
+            fractions = [0.0] * len(self.moves)
+            scores = [None] * len(self.moves)
+            for s1_option in mcts_result.side_one:
+                i = move_indices[s1_option.move_choice]
+                fractions[i] = s1_option.visits / mcts_result.total_visits
+                if s1_option.visits > 0:
+                    scores[i] = s1_option.total_score / s1_option.visits
+            self.weights.append(sample_chance)
+            self.visit_fractions.append(fractions)
+            self.scores.append(scores)
+
+    def filled_scores(self) -> list[list[float]]:
+        """
+        `scores` where a move that was not visited in a world is given the worst
+        score of that world, since the search found it not worth exploring
+        """
+        filled = []
+        for row in self.scores:
+            visited = [score for score in row if score is not None]
+            worst = min(visited) if visited else 0
+            filled.append([worst if score is None else score for score in row])
+        return filled
+
+
+def visit_weighted_policy(matrix: WorldMoveMatrix) -> dict[str, float]:
+    return {
+        move: sum(w * row[i] for w, row in zip(matrix.weights, matrix.visit_fractions))
+        for i, move in enumerate(matrix.moves)
+    }
+
+
+def average_score_policy(matrix: WorldMoveMatrix) -> dict[str, float]:
+    policy = {}
+    for i, move in enumerate(matrix.moves):
+        weighted = [
+            (w, row[i])
+            for w, row in zip(matrix.weights, matrix.scores)
+            if row[i] is not None
+        ]
+        total_weight = sum(w for w, _ in weighted)
+        if total_weight > 0:
+            policy[move] = sum(w * score for w, score in weighted) / total_weight
+    return policy
+
+
+def robust_max_policy(matrix: WorldMoveMatrix) -> dict[str, float]:
+    """The worst average score of each move across every world"""
+    scores = matrix.filled_scores()
+    return {move: min(row[i] for row in scores) for i, move in enumerate(matrix.moves)}
+
+
+def min_regret_policy(matrix: WorldMoveMatrix) -> dict[str, float]:
+    """
+    The negated largest regret of each move across every world, where the regret
+    of a move in a world is how much worse it scored than that world's best move
+    """
+    scores = matrix.filled_scores()
+    best = [max(row) for row in scores]
+    return {
+        move: -max(b - row[i] for b, row in zip(best, scores))
+        for i, move in enumerate(matrix.moves)
+    }
+
+
+AGGREGATION_STRATEGIES = {
+    SearchAggregation.visit_weighted: visit_weighted_policy,
+    SearchAggregation.average_score: average_score_policy,
+    SearchAggregation.robust_max: robust_max_policy,
+    SearchAggregation.min_regret: min_regret_policy,
+}
+
+
+def aggregate_policy(
+    mcts_results, strategy: SearchAggregation = SearchAggregation.visit_weighted
+) -> dict[str, float]:
+    """
+    Combines the searches of every world into one value per move, higher is better
+    """
+    return AGGREGATION_STRATEGIES[strategy](WorldMoveMatrix(mcts_results))
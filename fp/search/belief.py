@@ -0,0 +1,368 @@
+from __future__ import annotations
+
+import logging
+import random
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from typing import Iterator, Optional
+
+import constants
+from config import FoulPlayConfig
+from constants import BattleType
+from data.pkmn_sets import (
+    PokemonMoveset,
+    PokemonSet,
+    PredictedPokemonSet,
+    RandomBattleTeamDatasets,
+    TeamDatasets,
+)
+from fp.battle import Battle, Pokemon
+
+from .helpers import populate_pkmn_from_set
+from .random_battles import iter_random_battles
+from .set_sampler import SetSamplers, WeightedSampler
+from .standard_battles import iter_battles, sample_pokemon
+
+logger = logging.getLogger(__name__)
+
+
+# The particles are resampled once their effective sample size
+# falls below this fraction of how many particles a belief keeps
+RESAMPLE_ESS_FRACTION = 0.5
+
+# How many battles' beliefs are kept, e.g. for concurrent battles
+MAX_BELIEFS = 32
+
+TEAM_SIZE = 6
+
+
+def sampled_pokemon(battle: Battle) -> list[Pokemon]:
+    """The opponent's pokemon that get a sampled set: the active one and alive reserve"""
+    pokemon = [p for p in battle.opponent.reserve if p.is_alive()]
+    if battle.opponent.active is not None:
+        pokemon.append(battle.opponent.active)
+    return pokemon
+
+
+def evidence(pkmn: Pokemon) -> tuple:
+    """Everything that has been observed about `pkmn` that can rule out one of its sets"""
+    return (
+        tuple(sorted(m.name for m in pkmn.moves)),
+        pkmn.item,
+        pkmn.removed_item,
+        pkmn.ability,
+        tuple(pkmn.speed_range),
+        pkmn.terastallized,
+        pkmn.tera_type,
+        pkmn.mega_name,
+        pkmn.can_have_choice_item,
+        tuple(sorted(pkmn.impossible_items)),
+        tuple(sorted(pkmn.impossible_abilities)),
+        tuple(sorted(pkmn.hidden_power_possibilities)),
+    )
+
+
+def pokemon_set(pkmn: Pokemon) -> PredictedPokemonSet:
+    """The set that a sampled pokemon was given"""
+    return PredictedPokemonSet(
+        pkmn_set=PokemonSet(
+            ability=pkmn.ability,
+            item=pkmn.item,
+            nature=pkmn.nature,
+            evs=tuple(pkmn.evs),
+            count=1,
+            level=pkmn.level,
+            tera_type=pkmn.tera_type,
+        ),
+        pkmn_moveset=PokemonMoveset(moves=tuple(m.name for m in pkmn.moves)),
+    )
+
+
+def set_is_possible(
+    pkmn: Pokemon, predicted_set: PredictedPokemonSet, speed_check=True, match_item=True
+) -> bool:
+    moves = predicted_set.pkmn_moveset.moves
+    for mv in pkmn.moves:
+        # only whether the set has hidden power is checked,
+        # its type is named differently by each source of sets
+        if mv.name.startswith(constants.HIDDEN_POWER):
+            if not any(m.startswith(constants.HIDDEN_POWER) for m in moves):
+                return False
+        elif mv.name not in moves:
+            return False
+    return predicted_set.pkmn_set.set_makes_sense(
+        pkmn, match_item=match_item, speed_check=speed_check
+    )
+
+
+def sample_set(
+    battle: Battle, pkmn: Pokemon, rng=random
+) -> Optional[PredictedPokemonSet]:
+    """A set for `pkmn` sampled the same way as when a battle is sampled"""
+    sampled = pkmn.clone()
+    turn_key = (battle.battle_tag, battle.turn)
+    if battle.battle_type == BattleType.STANDARD_BATTLE:
+        sample_pokemon(sampled, rng=rng, turn_key=turn_key)
+        return pokemon_set(sampled)
+
+    if battle.battle_type == BattleType.RANDOM_BATTLE:
+        sets = RandomBattleTeamDatasets.get_all_remaining_sets(sampled)
+    else:
+        sets = TeamDatasets.get_all_remaining_sets(sampled)
+    if not sets:
+        return None
+    sampler = SetSamplers.get(turn_key, pkmn.name, sets, lambda s: s.pkmn_set.count)
+    populate_pkmn_from_set(sampled, sampler.sample(rng))
+    return pokemon_set(sampled)
+
+
+def effective_sample_size(weights: list[float]) -> float:
+    total = sum(weights)
+    squares = sum(w * w for w in weights)
+    if squares <= 0:
+        return 0
+    return total * total / squares
+
+
+@dataclass
+class Particle:
+    """
+    One guess at the opponent's team. Particles are never modified once created,
+    so the same particle can be drawn by several searches at once
+    """
+
+    weight: float
+    # the set of each of the opponent's sampled pokemon, None if it could not be sampled
+    sets: dict[str, Optional[PredictedPokemonSet]]
+    # the pokemon that the opponent has not revealed yet
+    unrevealed: list[Pokemon]
+    # (pokemon name, mega name) if this guess has a pokemon that can mega evolve
+    mega: Optional[tuple[str, str]] = None
+
+    @classmethod
+    def from_battle(cls, sampled: Battle, battle: Battle, weight: float) -> Particle:
+        """The particle that `sampled` is, where `sampled` was sampled from `battle`"""
+        revealed = {
+            p.name: p for p in [battle.opponent.active] + battle.opponent.reserve if p
+        }
+        sampled_names = {p.name for p in sampled_pokemon(battle)}
+
+        sets = {}
+        unrevealed = []
+        mega = None
+        for pkmn in [sampled.opponent.active] + sampled.opponent.reserve:
+            if pkmn is None:
+                continue
+            if pkmn.name not in revealed:
+                unrevealed.append(pkmn)
+            elif pkmn.name in sampled_names:
+                sets[pkmn.name] = pokemon_set(pkmn)
+                if pkmn.mega_name is not None and revealed[pkmn.name].mega_name is None:
+                    mega = (pkmn.name, pkmn.mega_name)
+        return cls(weight, sets, unrevealed, mega)
+
+    def to_battle(self, battle: Battle) -> Battle:
+        """`battle` with the opponent's sets and unrevealed pokemon of this particle"""
+        world = battle.clone()
+        mega_revealed = world.opponent.mega_revealed()
+        for pkmn in sampled_pokemon(world):
+            predicted_set = self.sets.get(pkmn.name)
+            if predicted_set is None:
+                continue
+            if (
+                self.mega is not None
+                and self.mega[0] == pkmn.name
+                and not mega_revealed
+            ):
+                pkmn.item = predicted_set.pkmn_set.item
+                pkmn.mega_name = self.mega[1]
+            populate_pkmn_from_set(pkmn, predicted_set, source="belief")
+
+        for pkmn in self.unrevealed:
+            world.opponent.reserve.append(pkmn.clone())
+        world.opponent.lock_moves()
+        return world
+
+    def observe(self, battle: Battle, changed: list[Pokemon], rng=random) -> Particle:
+        """
+        This particle after new information about the `changed` pokemon.
+        Its weight is 0 if that information rules out one of its sets
+        """
+        sets = self.sets
+        unrevealed = self.unrevealed
+        for pkmn in changed:
+            if pkmn.name not in sets:
+                # a newly revealed pokemon: either this particle guessed it,
+                # or a set is sampled for it and a wrong guess is dropped
+                guess = next((p for p in unrevealed if p.name == pkmn.name), None)
+                if guess is not None:
+                    unrevealed = [p for p in unrevealed if p is not guess]
+                    predicted_set = pokemon_set(guess)
+                else:
+                    predicted_set = sample_set(battle, pkmn, rng=rng)
+                sets = {**sets, pkmn.name: predicted_set}
+
+            predicted_set = sets[pkmn.name]
+            if predicted_set is None:
+                continue
+            unconfirmed_mega = (
+                self.mega is not None
+                and self.mega[0] == pkmn.name
+                and pkmn.mega_name is None
+            )
+            if not set_is_possible(
+                pkmn,
+                predicted_set,
+                speed_check=battle.battle_type != BattleType.RANDOM_BATTLE,
+                match_item=not unconfirmed_mega,
+            ):
+                return replace(self, weight=0)
+
+        num_revealed = len(
+            [p for p in [battle.opponent.active] + battle.opponent.reserve if p]
+        )
+        unrevealed = unrevealed[: max(0, TEAM_SIZE - num_revealed)]
+        return replace(self, sets=sets, unrevealed=unrevealed)
+
+
+class BattleBelief:
+    """
+    Weighted guesses ("particles") at the opponent's sets and unrevealed pokemon,
+    kept across the turns of one battle.
+
+    Whenever battles are drawn, the particles are first checked against what has been
+    observed about the opponent's pokemon since the last time: revealed moves, items,
+    abilities, speed ranges and the items and abilities ruled out by damage rolls.
+    Only the pokemon with new information are checked, and a particle that one of
+    them rules out is dropped. Once the particles' effective sample size gets too low,
+    the survivors are resampled down to that size and topped up with freshly sampled
+    particles, which already reflect everything that is known
+    """
+
+    def __init__(self, num_particles: int):
+        self.num_particles = num_particles
+        self.particles: list[Particle] = []
+        self._evidence = {}
+        self._lock = threading.Lock()
+
+    def effective_sample_size(self) -> float:
+        return effective_sample_size([p.weight for p in self.particles])
+
+    def update(self, battle: Battle, deadline: float = None, rng=random):
+        with self._lock:
+            self._update(battle, deadline=deadline, rng=rng)
+
+    def _update(self, battle: Battle, deadline: float = None, rng=random):
+        pokemon = sampled_pokemon(battle)
+        changed = [p for p in pokemon if self._evidence.get(p.name) != evidence(p)]
+        if changed and self.particles:
+            particles = [p.observe(battle, changed, rng=rng) for p in self.particles]
+            self.particles = [p for p in particles if p.weight > 0]
+            logger.info(
+                "{} of {} particles are still possible after new information on {}".format(
+                    len(self.particles), len(particles), [p.name for p in changed]
+                )
+            )
+        self._evidence = {p.name: evidence(p) for p in pokemon}
+
+        ess = self.effective_sample_size()
+        if ess < RESAMPLE_ESS_FRACTION * self.num_particles:
+            self._resample(battle, int(ess), deadline=deadline, rng=rng)
+
+    def _resample(
+        self, battle: Battle, num_kept: int, deadline: float = None, rng=random
+    ):
+        kept = systematic_resample(self.particles, num_kept, rng=rng)
+        num_sampled = self.num_particles - len(kept)
+        logger.info(
+            "Resampling the belief: keeping {} particles and sampling {} more".format(
+                len(kept), num_sampled
+            )
+        )
+        if battle.battle_type == BattleType.STANDARD_BATTLE:
+            sampled = iter_battles(battle, num_sampled, deadline=deadline, rng=rng)
+        else:
+            sampled = iter_random_battles(
+                battle, num_sampled, deadline=deadline, rng=rng
+            )
+        particles = kept + [Particle.from_battle(b, battle, 1) for b, _ in sampled]
+        self.particles = [replace(p, weight=1 / len(particles)) for p in particles]
+
+    def sample_battles(
+        self, battle: Battle, num_battles: int, deadline: float = None, rng=random
+    ) -> Iterator[tuple[Battle, float]]:
+        """
+        Draws `num_battles` battles from the particles by their weights.
+        The same particle can be drawn more than once
+        """
+        with self._lock:
+            self._update(battle, deadline=deadline, rng=rng)
+            particles = self.particles
+        if not particles:
+            return
+        sampler = WeightedSampler(particles, [p.weight for p in particles])
+        drawn = [sampler.sample(rng) for _ in range(num_battles)]
+
+        for index, particle in enumerate(drawn):
+            if deadline is not None and index > 0 and time.monotonic() > deadline:
+                logger.warning(
+                    "Sampling deadline reached after {} of {} battles".format(
+                        index, num_battles
+                    )
+                )
+                break
+            yield particle.to_battle(battle), 1 / num_battles
+
+
+def systematic_resample(
+    particles: list[Particle], num_particles: int, rng=random
+) -> list[Particle]:
+    """Draws `num_particles` of `particles` by their weights with a single random number"""
+    total = sum(p.weight for p in particles)
+    if num_particles <= 0 or total <= 0:
+        return []
+    step = total / num_particles
+    position = rng.random() * step
+    cumulative = 0
+    resampled = []
+    for particle in particles:
+        cumulative += particle.weight
+        while position < cumulative and len(resampled) < num_particles:
+            resampled.append(particle)
+            position += step
+    return resampled
+
+
+class _Beliefs:
+    """The belief of every battle that is being played, see `BattleBelief`"""
+
+    def __init__(self):
+        self._beliefs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def for_battle(self, battle_tag: str) -> BattleBelief:
+        num_particles = FoulPlayConfig.search_belief_particles
+        with self._lock:
+            belief = self._beliefs.get(battle_tag)
+            if belief is None or belief.num_particles != num_particles:
+                belief = BattleBelief(num_particles)
+                self._beliefs[battle_tag] = belief
+            self._beliefs.move_to_end(battle_tag)
+            while len(self._beliefs) > MAX_BELIEFS:
+                self._beliefs.popitem(last=False)
+            return belief
+
+    def sample_battles(
+        self, battle: Battle, num_battles: int, deadline: float = None, rng=random
+    ) -> Iterator[tuple[Battle, float]]:
+        belief = self.for_battle(battle.battle_tag)
+        return belief.sample_battles(battle, num_battles, deadline=deadline, rng=rng)
+
+    def clear(self):
+        with self._lock:
+            self._beliefs.clear()
+
+
+Beliefs = _Beliefs()
@@ -0,0 +1,123 @@
+import logging
+import math
+import os
+from typing import Optional
+
+from config import FoulPlayConfig
+
+logger = logging.getLogger(__name__)
+
+
+CGROUP_V2_CPU_MAX = "/sys/fs/cgroup/cpu.max"
+CGROUP_V1_CFS_QUOTA = "/sys/fs/cgroup/cpu/cpu.cfs_quota_us"
+CGROUP_V1_CFS_PERIOD = "/sys/fs/cgroup/cpu/cpu.cfs_period_us"
+
+
+_process_cpus = None
+
+
+def process_cpus() -> list[int]:
+    """
+    The CPUs this process was allowed to run on when it started.
+    Remembered on the first call so that pinning the main process
+    does not shrink the CPUs available to the search workers
+    """
+    global _process_cpus
+    if _process_cpus is None:
+        if hasattr(os, "sched_getaffinity"):
+            _process_cpus = sorted(os.sched_getaffinity(0))
+        else:
+            _process_cpus = list(range(os.cpu_count() or 1))
+    return _process_cpus
+
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def cgroup_cpu_limit() -> Optional[float]:
+    """
+    The number of CPUs worth of time the cgroup quota allows, e.g. `docker run --cpus`,
+    or None if there is no quota
+    """
+    cpu_max = _read(CGROUP_V2_CPU_MAX)
+    if cpu_max is not None:
+        quota, _, period = cpu_max.partition(" ")
+        if quota == "max" or not period:
+            return None
+        return int(quota) / int(period)
+
+    quota = _read(CGROUP_V1_CFS_QUOTA)
+    period = _read(CGROUP_V1_CFS_PERIOD)
+    if quota is None or period is None or int(quota) <= 0:
+        return None
+    return int(quota) / int(period)
+
+
+def usable_cpu_count() -> int:
+    num_cpus = len(process_cpus())
+    limit = cgroup_cpu_limit()
+    if limit is not None:
+        num_cpus = min(num_cpus, math.ceil(limit))
+    return max(1, num_cpus)
+
+
+def auto_parallelism(reserved_cpus: int) -> int:
+    """Every usable CPU except the ones reserved for the main process"""
+    return max(1, usable_cpu_count() - reserved_cpus)
+
+
+def reserved_cpus(num_reserved: int) -> list[int]:
+    cpus = process_cpus()
+    if num_reserved >= len(cpus):
+        return cpus
+    return cpus[:num_reserved]
+
+
+def worker_cpus(num_workers: int, num_reserved: int) -> list[int]:
+    """
+    One CPU per search worker, avoiding the CPUs reserved for the main process.
+    CPUs are shared round-robin if there are more workers than CPUs left
+    """
+    cpus = [c for c in process_cpus() if c not in reserved_cpus(num_reserved)]
+    if not cpus:
+        cpus = process_cpus()
+    return [cpus[i % len(cpus)] for i in range(num_workers)]
+
+
+def pin_current_process(cpus: list[int]):
+    if not hasattr(os, "sched_setaffinity"):
+        logger.warning("CPU pinning is not supported on this platform")
+        return
+    try:
+        os.sched_setaffinity(0, cpus)
+    except OSError as e:
+        logger.warning(
+            "Could not pin process {} to CPUs {}: {}".format(os.getpid(), cpus, e)
+        )
+
+
+def configure_search_cpus():
+    """
+    Sizes the search worker pool from the usable CPUs when parallelism is 0,
+    and if workers are pinned, pins this process (the asyncio loop and LLM threads)
+    to the reserved CPUs so it does not compete with them
+    """
+    if FoulPlayConfig.parallelism <= 0:
+        FoulPlayConfig.parallelism = auto_parallelism(
+            FoulPlayConfig.search_reserved_cpus
+        )
+        logger.info(
+            "Search parallelism set to {} from {} usable CPUs".format(
+                FoulPlayConfig.parallelism, usable_cpu_count()
+            )
+        )
+
+    if FoulPlayConfig.search_pin_workers and FoulPlayConfig.search_reserved_cpus > 0:
+        cpus = reserved_cpus(FoulPlayConfig.search_reserved_cpus)
+        logger.info("Pinning the main process to CPUs {}".format(cpus))
+        pin_current_process(cpus)
@@ -0,0 +1,387 @@
+"""
+Searching worlds on other machines.
+
+A search worker is started on every machine with
+    python -m fp.search.distributed --host 0.0.0.0 --port 9000 --parallelism 8
+and the bot is given their addresses with `--search-workers host:9000,...`
+
+Messages are JSON objects sent with a 4-byte big-endian length prefix.
+The coordinator sends `{"id", "state", "search_time_ms"}` or `{"cancel": id}`
+and the worker answers `{"id", "result"}` or `{"id", "error"}`
+"""
+
+import argparse
+import json
+import logging
+import select
+import socket
+import socketserver
+import struct
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import asdict
+from typing import Callable
+
+from config import FoulPlayConfig, init_logging
+
+from .cpus import configure_search_cpus
+from .transposition import MctsMoveSummary, MctsSummary
+from .worker_pool import SearchWorkerPool
+
+logger = logging.getLogger(__name__)
+
+
+HEADER = struct.Struct(">I")
+MAX_MESSAGE_BYTES = 16 * 1024 * 1024
+
+CONNECT_TIMEOUT_SECONDS = 2
+
+# A worker that could not be connected to is not tried again for this long
+RECONNECT_BACKOFF_SECONDS = 10
+
+# A worker that has searches outstanding and sends nothing back for longer than
+# the longest of them plus this long is considered dead and its searches are re-run
+# locally. A live worker answers at least that often since each of its searches
+# finishes within its own search time, and queued ones start as others finish
+READ_TIMEOUT_SLACK_SECONDS = 5
+
+
+def send_message(sock: socket.socket, message: dict):
+    payload = json.dumps(message).encode()
+    sock.sendall(HEADER.pack(len(payload)) + payload)
+
+
+def _receive_exactly(sock: socket.socket, num_bytes: int) -> bytes:
+    buffer = bytearray()
+    while len(buffer) < num_bytes:
+        chunk = sock.recv(num_bytes - len(buffer))
+        if not chunk:
+            raise ConnectionError("Connection closed by peer")
+        buffer += chunk
+    return bytes(buffer)
+
+
+def receive_message(sock: socket.socket) -> dict:
+    (length,) = HEADER.unpack(_receive_exactly(sock, HEADER.size))
+    if length > MAX_MESSAGE_BYTES:
+        raise ConnectionError("Message of {} bytes is too large".format(length))
+    return json.loads(_receive_exactly(sock, length))
+
+
+def summary_from_json(summary: dict) -> MctsSummary:
+    return MctsSummary(
+        side_one=[MctsMoveSummary(**o) for o in summary["side_one"]],
+        side_two=[MctsMoveSummary(**o) for o in summary["side_two"]],
+        total_visits=summary["total_visits"],
+        search_ms=summary.get("search_ms", 0),
+    )
+
+
+def search_locally(state: str, search_time_ms: int, index: int) -> Future:
+    from .main import get_result_from_mcts
+
+    return SearchWorkerPool.submit(get_result_from_mcts, state, search_time_ms, index)
+
+
+def _copy_future(source: Future, target: Future):
+    """
+    Resolves `target` with the outcome of `source`, and cancels `source` if `target` is cancelled
+    """
+
+    def copy(f):
+        if f.cancelled() or not target.set_running_or_notify_cancel():
+            return
+        if f.exception() is not None:
+            target.set_exception(f.exception())
+        else:
+            target.set_result(f.result())
+
+    target.add_done_callback(lambda f: f.cancelled() and source.cancel())
+    source.add_done_callback(copy)
+
+
+class _SearchRequestHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        write_lock = threading.Lock()
+        pending = {}
+
+        def reply(request_id, fut):
+            pending.pop(request_id, None)
+            if fut.cancelled():
+                return
+            if fut.exception() is not None:
+                message = {"id": request_id, "error": repr(fut.exception())}
+            else:
+                message = {"id": request_id, "result": asdict(fut.result())}
+            try:
+                with write_lock:
+                    send_message(self.request, message)
+            except OSError:
+                pass
+
+        while True:
+            try:
+                message = receive_message(self.request)
+            except (OSError, ValueError):
+                break
+
+            if "cancel" in message:
+                fut = pending.pop(message["cancel"], None)
+                if fut is not None:
+                    fut.cancel()
+                continue
+
+            request_id = message["id"]
+            fut = self.server.submit(
+                message["state"], message["search_time_ms"], request_id
+            )
+            pending[request_id] = fut
+            fut.add_done_callback(lambda f, i=request_id: reply(i, f))
+
+        for fut in list(pending.values()):
+            fut.cancel()
+
+
+class SearchWorkerServer(socketserver.ThreadingTCPServer):
+    """
+    Serves searches to a coordinator.
+    `submit(state, search_time_ms, index)` must return a Future of an `MctsSummary`,
+    by default the search is run in this machine's search worker pool
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, submit: Callable[..., Future] = search_locally):
+        super().__init__(address, _SearchRequestHandler)
+        self.submit = submit
+
+
+class _RemoteWorker:
+    def __init__(self, address: str):
+        host, port = address.rsplit(":", 1)
+        self.address = (host, int(port))
+        self._sock = None
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._unreachable_until = 0
+        self._last_heard = 0
+
+    def num_pending(self) -> int:
+        return len(self._pending)
+
+    def is_available(self) -> bool:
+        return time.monotonic() >= self._unreachable_until
+
+    def _connect(self):
+        try:
+            sock = socket.create_connection(
+                self.address, timeout=CONNECT_TIMEOUT_SECONDS
+            )
+        except OSError:
+            self._unreachable_until = time.monotonic() + RECONNECT_BACKOFF_SECONDS
+            raise
+        # only a message that stops halfway times out, waiting for one is done in `_read`
+        sock.settimeout(READ_TIMEOUT_SLACK_SECONDS)
+        self._sock = sock
+        threading.Thread(target=self._read, args=(sock,), daemon=True).start()
+        logger.info("Connected to search worker {}:{}".format(*self.address))
+
+    def submit(self, request_id: int, state: str, search_time_ms: int, fut: Future):
+        """Raises OSError if the worker cannot be reached"""
+        with self._lock:
+            if self._sock is None:
+                self._connect()
+            if not self._pending:
+                self._last_heard = time.monotonic()
+            self._pending[request_id] = (fut, state, search_time_ms)
+            try:
+                send_message(
+                    self._sock,
+                    {
+                        "id": request_id,
+                        "state": state,
+                        "search_time_ms": search_time_ms,
+                    },
+                )
+            except OSError:
+                # the reader thread notices the socket is shut down
+                # and re-runs the other outstanding searches locally
+                self._pending.pop(request_id)
+                try:
+                    self._sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+                raise
+        fut.add_done_callback(lambda f: f.cancelled() and self._cancel(request_id))
+
+    def _cancel(self, request_id):
+        with self._lock:
+            if self._pending.pop(request_id, None) is None or self._sock is None:
+                return
+            try:
+                send_message(self._sock, {"cancel": request_id})
+            except OSError:
+                pass
+
+    def _read_timeout(self) -> float:
+        longest_ms = max((ms for _, _, ms in self._pending.values()), default=0)
+        return longest_ms / 1000 + READ_TIMEOUT_SLACK_SECONDS
+
+    def _read(self, sock):
+        while True:
+            with self._lock:
+                timeout = self._read_timeout()
+                silent_seconds = time.monotonic() - self._last_heard
+                waiting = bool(self._pending)
+            if waiting and silent_seconds > timeout:
+                break
+            try:
+                readable, _, _ = select.select(
+                    [sock], [], [], timeout - silent_seconds if waiting else timeout
+                )
+                if not readable:
+                    continue
+                message = receive_message(sock)
+            except (OSError, ValueError):
+                break
+
+            with self._lock:
+                self._last_heard = time.monotonic()
+                pending = self._pending.pop(message["id"], None)
+            if pending is None:
+                continue
+            fut, state, search_time_ms = pending
+            if "result" in message:
+                if fut.set_running_or_notify_cancel():
+                    fut.set_result(summary_from_json(message["result"]))
+            else:
+                logger.warning(
+                    "Search worker {}:{} failed a search: {}".format(
+                        *self.address, message.get("error")
+                    )
+                )
+                _copy_future(search_locally(state, search_time_ms, message["id"]), fut)
+
+        with self._lock:
+            pending = self._disconnect_locked(sock)
+        if pending:
+            logger.warning(
+                "Lost search worker {}:{}, searching {} states locally".format(
+                    *self.address, len(pending)
+                )
+            )
+        for request_id, (fut, state, search_time_ms) in pending.items():
+            if not fut.done():
+                _copy_future(search_locally(state, search_time_ms, request_id), fut)
+
+    def _disconnect_locked(self, sock) -> dict:
+        try:
+            sock.close()
+        except OSError:
+            pass
+        if self._sock is not sock:
+            return {}
+        self._sock = None
+        pending, self._pending = self._pending, {}
+        return pending
+
+    def close(self):
+        with self._lock:
+            if self._sock is not None:
+                self._disconnect_locked(self._sock)
+
+
+class _SearchCoordinator:
+    """
+    Sends searches to the workers in `FoulPlayConfig.search_workers`,
+    each one to the worker with the fewest searches outstanding.
+
+    Searches that cannot be sent, or that a worker fails, are run in the local pool
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._workers = {}
+        self._next_request_id = 0
+
+    def _get_workers(self) -> list[_RemoteWorker]:
+        with self._lock:
+            for address in FoulPlayConfig.search_workers:
+                if address not in self._workers:
+                    self._workers[address] = _RemoteWorker(address)
+            return [self._workers[a] for a in FoulPlayConfig.search_workers]
+
+    def submit(self, state: str, search_time_ms: int, index: int) -> Future:
+        with self._lock:
+            request_id = self._next_request_id
+            self._next_request_id += 1
+
+        fut = Future()
+        workers = [w for w in self._get_workers() if w.is_available()]
+        for worker in sorted(workers, key=lambda w: w.num_pending()):
+            try:
+                worker.submit(request_id, state, search_time_ms, fut)
+                return fut
+            except OSError as e:
+                logger.warning(
+                    "Could not reach search worker {}:{}: {}".format(*worker.address, e)
+                )
+
+        _copy_future(search_locally(state, search_time_ms, index), fut)
+        return fut
+
+    def shutdown(self):
+        with self._lock:
+            for worker in self._workers.values():
+                worker.close()
+            self._workers = {}
+
+
+SearchCoordinator = _SearchCoordinator()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a remote search worker")
+    parser.add_argument(
+        "--host",
+        default="127.0.0.1",
+        help="Address to listen on. Use 0.0.0.0 to accept searches from other machines, "
+        "only on a trusted network since the searches are not authenticated",
+    )
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument(
+        "--parallelism",
+        type=int,
+        default=0,
+        help="Number of states to search in parallel on this machine. "
+        "0 uses every available CPU except --reserved-cpus",
+    )
+    parser.add_argument("--reserved-cpus", type=int, default=1)
+    parser.add_argument(
+        "--pin-workers",
+        action="store_true",
+        help="Pin each search worker to its own CPU",
+    )
+    parser.add_argument("--log-level", default="INFO", help="Python logging level")
+    args = parser.parse_args()
+
+    init_logging(args.log_level, False)
+    FoulPlayConfig.parallelism = args.parallelism
+    FoulPlayConfig.search_reserved_cpus = args.reserved_cpus
+    FoulPlayConfig.search_pin_workers = args.pin_workers
+    configure_search_cpus()
+    SearchWorkerPool.get_executor()
+
+    with SearchWorkerServer((args.host, args.port)) as server:
+        logger.info("Search worker listening on {}:{}".format(args.host, args.port))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    SearchWorkerPool.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import logging
+import math
+from dataclasses import dataclass
+
+from config import FoulPlayConfig, SearchBackend
+from fp.battle import Battle
+
+from .transposition import _TranspositionTable
+
+logger = logging.getLogger(__name__)
+
+
+# Expectiminimax is used automatically once neither side has more than this many
+# pokemon left, counting the opponent's unrevealed pokemon as alive
+ENDGAME_MAX_POKEMON = 2
+
+TEAM_SIZE = 6
+
+
+@dataclass
+class ExpectiminimaxSummary:
+    """
+    A picklable copy of a `poke_engine.IterativeDeepeningResult`.
+    `matrix` has one row per side one move, and one column per side two move
+    """
+
+    side_one: list[str]
+    side_two: list[str]
+    matrix: list[float]
+    depth_searched: int
+    # wall time spent in the engine by the worker that searched it
+    search_ms: float = 0
+
+    @classmethod
+    def from_result(cls, result, search_ms: float = 0) -> ExpectiminimaxSummary:
+        return cls(
+            side_one=list(result.side_one),
+            side_two=list(result.side_two),
+            matrix=list(result.matrix),
+            depth_searched=result.depth_searched,
+            search_ms=search_ms,
+        )
+
+    def maximin(self) -> dict[str, float]:
+        """
+        The score of each of our moves against the opponent's best reply.
+        Pruned entries are NaN and are skipped. A move whose every entry was pruned
+        gets the worst score of the matrix
+        """
+        num_replies = len(self.side_two)
+        if num_replies == 0:
+            return {move: 0 for move in self.side_one}
+        worst = min((v for v in self.matrix if not math.isnan(v)), default=0)
+        maximin = {}
+        for i, move in enumerate(self.side_one):
+            row = self.matrix[i * num_replies : (i + 1) * num_replies]
+            maximin[move] = min([v for v in row if not math.isnan(v)], default=worst)
+        return maximin
+
+
+def _num_alive(pokemon) -> int:
+    return sum(1 for p in pokemon if p is not None and p.is_alive())
+
+
+def is_endgame(battle: Battle) -> bool:
+    user_alive = _num_alive([battle.user.active] + battle.user.reserve)
+    opponent_revealed = [battle.opponent.active] + battle.opponent.reserve
+    opponent_revealed = [p for p in opponent_revealed if p is not None]
+    opponent_alive = _num_alive(opponent_revealed) + max(
+        0, TEAM_SIZE - len(opponent_revealed)
+    )
+    return user_alive <= ENDGAME_MAX_POKEMON and opponent_alive <= ENDGAME_MAX_POKEMON
+
+
+def search_backend(battle: Battle) -> SearchBackend:
+    """
+    The backend that searches `battle`'s sampled battles.
+    Team preview is always searched with MCTS so that its policy can be cached
+    """
+    backend = FoulPlayConfig.search_backend
+    if battle.team_preview:
+        return SearchBackend.mcts
+    if backend == SearchBackend.auto:
+        if is_endgame(battle):
+            return SearchBackend.expectiminimax
+        return SearchBackend.mcts
+    return backend
+
+
+def endgame_policy(
+    results: list[(ExpectiminimaxSummary, float, int)],
+) -> dict[str, float]:
+    """
+    The maximin score of each move, averaged over the worlds it can be used in
+    weighted by their sample chances
+    """
+    scores = {}
+    weights = {}
+    for summary, sample_chance, _ in results:
+        for move, score in summary.maximin().items():
+            scores[move] = scores.get(move, 0) + sample_chance * score
+            weights[move] = weights.get(move, 0) + sample_chance
+    return {move: scores[move] / weights[move] for move in scores if weights[move] > 0}
+
+
+# Expectiminimax results are kept apart from the MCTS search cache since the two
+# can not be merged. A cached result that searched for less time than asked for is
+# searched again from scratch
+EndgameTable = _TranspositionTable()
@@ -0,0 +1,46 @@
+from copy import deepcopy
+from typing import Optional
+
+import constants
+from config import SearchAggregation
+from fp.battle import Battle
+
+from .aggregation import aggregate_policy
+
+
+def focus_moves(mcts_results, num_moves: int, strategy: SearchAggregation) -> list[str]:
+    """
+    The `num_moves` best moves of the aggregated policy of `mcts_results`,
+    or nothing if there are no more moves than that to choose from
+    """
+    policy = aggregate_policy(mcts_results, strategy)
+    if len(policy) <= num_moves:
+        return []
+    return sorted(policy, key=policy.get, reverse=True)[:num_moves]
+
+
+def _base_move(move: str) -> str:
+    for suffix in ["-tera", "-mega"]:
+        if move.endswith(suffix):
+            return move[: -len(suffix)]
+    return move
+
+
+def focused_battle(battle: Battle, moves: list[str]) -> Optional[Battle]:
+    """
+    A copy of `battle` where our active pokemon can only use `moves`:
+    every other move is disabled, and switching is not possible if no switch is in `moves`.
+    Switches can not be narrowed down further than that, nor can terastallizing.
+    Returns None if this would leave nothing to choose from
+    """
+    battle = deepcopy(battle)
+    allowed = {_base_move(m) for m in moves}
+    for move in battle.user.active.moves:
+        if move.name not in allowed:
+            move.disabled = True
+    if not any(m.startswith(constants.SWITCH_STRING + " ") for m in moves):
+        battle.user.trapped = True
+
+    if battle.user.trapped and all(m.disabled for m in battle.user.active.moves):
+        return None
+    return battle
@@ -0,0 +1,201 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+from config import FoulPlayConfig, SearchAggregation
+from data.pkmn_sets import PWD as PKMN_SETS_DIR
+from data.pkmn_sets import SmogonSets, TeamDatasets
+from fp.battle import Battle
+
+from .throughput import base_search_time_ms
+
+logger = logging.getLogger(__name__)
+
+
+# A cached lead policy is used without searching once this many searches went into it.
+# Until then every team preview against the same team tops it up with a short search
+LEAD_CACHE_SEARCHES_TO_TRUST = 4
+
+# Fraction of the usual team preview search time that a top-up search gets.
+# A team preview usually searches two battles per worker, one after the other
+LEAD_CACHE_TOP_UP_FRACTION = 0.5
+TEAM_PREVIEW_SEARCH_WAVES = 2
+
+
+@dataclass
+class LeadPolicy:
+    policy: dict[str, float]
+    num_searches: int
+    strategy: SearchAggregation
+    data_version: str
+
+    def merge(self, policy: dict[str, float]) -> LeadPolicy:
+        """
+        Averages in the policy of one more search,
+        weighted by the number of searches already in this one
+        """
+        n = self.num_searches
+        merged = {
+            move: (n * self.policy.get(move, 0) + policy.get(move, 0)) / (n + 1)
+            for move in set(self.policy) | set(policy)
+        }
+        return LeadPolicy(merged, n + 1, self.strategy, self.data_version)
+
+    def to_dict(self) -> dict:
+        return {
+            "policy": self.policy,
+            "num_searches": self.num_searches,
+            "strategy": self.strategy.name,
+            "data_version": self.data_version,
+        }
+
+    @classmethod
+    def from_dict(cls, lead: dict) -> LeadPolicy:
+        return cls(
+            policy=lead["policy"],
+            num_searches=lead["num_searches"],
+            strategy=SearchAggregation[lead["strategy"]],
+            data_version=lead["data_version"],
+        )
+
+
+def _pokemon_key(pkmn) -> tuple:
+    return (
+        pkmn.name,
+        pkmn.level,
+        pkmn.item,
+        pkmn.ability,
+        pkmn.tera_type,
+        tuple(sorted(m.name for m in pkmn.moves)),
+    )
+
+
+def lead_key(battle: Battle) -> bytes:
+    """
+    Identifies a team preview by our team, the opponent's previewed pokemon,
+    and the format. The order of either team does not matter
+    """
+    user_team = sorted(_pokemon_key(p) for p in battle.user.reserve)
+    opponent_species = sorted(p.name for p in battle.opponent.reserve)
+    key = repr((user_team, opponent_species, battle.pokemon_format))
+    return hashlib.blake2b(key.encode(), digest_size=16).digest()
+
+
+def data_version() -> str:
+    """
+    Changes whenever the set data used to sample the opponent's team changes:
+    a new month of smogon stats, or a different team datasets file
+    """
+    parts = [SmogonSets.current_pkmn_sets_url, TeamDatasets.pkmn_mode]
+    sets_file = os.path.join(
+        PKMN_SETS_DIR, "pkmn_sets/{}.json".format(TeamDatasets.pkmn_mode)
+    )
+    if os.path.exists(sets_file):
+        stat = os.stat(sets_file)
+        parts += [stat.st_size, stat.st_mtime_ns]
+    return hashlib.blake2b(repr(parts).encode(), digest_size=8).hexdigest()
+
+
+def top_up_deadline(now: float, deadline: Optional[float] = None) -> float:
+    """The `time.monotonic()` time a top-up search must finish by"""
+    full_search_ms = TEAM_PREVIEW_SEARCH_WAVES * base_search_time_ms()
+    top_up = now + LEAD_CACHE_TOP_UP_FRACTION * full_search_ms / 1000
+    if deadline is not None:
+        return min(top_up, deadline)
+    return top_up
+
+
+class _LeadCache:
+    """
+    Remembers the aggregated lead policy of team previews that were searched before,
+    so that a fixed team facing the same opponent team again does not search from scratch
+
+    Entries are kept in least-recently-used order up to `FoulPlayConfig.lead_cache_size`
+    and are dropped when the set data they were searched with changes
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def lookup(self, battle: Battle) -> Optional[LeadPolicy]:
+        if FoulPlayConfig.lead_cache_size <= 0:
+            return None
+        key = lead_key(battle)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if (
+                entry.data_version != data_version()
+                or entry.strategy != FoulPlayConfig.search_aggregation
+            ):
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def store(self, battle: Battle, policy: dict[str, float]) -> LeadPolicy:
+        """Adds the policy of a search to the battle's entry and returns the entry"""
+        entry = self.lookup(battle)
+        if entry is None:
+            entry = LeadPolicy(
+                policy, 1, FoulPlayConfig.search_aggregation, data_version()
+            )
+        else:
+            entry = entry.merge(policy)
+
+        if FoulPlayConfig.lead_cache_size <= 0:
+            return entry
+        with self._lock:
+            self._entries[lead_key(battle)] = entry
+            self._entries.move_to_end(lead_key(battle))
+            while len(self._entries) > FoulPlayConfig.lead_cache_size:
+                self._entries.popitem(last=False)
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def load(self, path: str):
+        if not os.path.exists(path):
+            return
+        try:
+            with open(path) as f:
+                entries = OrderedDict(
+                    (bytes.fromhex(key), LeadPolicy.from_dict(lead))
+                    for key, lead in json.load(f)
+                )
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning("Could not load lead cache from {}: {}".format(path, e))
+            return
+
+        with self._lock:
+            self._entries = entries
+            while len(self._entries) > FoulPlayConfig.lead_cache_size:
+                self._entries.popitem(last=False)
+        logger.info(
+            "Loaded {} lead cache entries from {}".format(len(self._entries), path)
+        )
+
+    def save(self, path: str):
+        with self._lock:
+            entries = [
+                [key.hex(), lead.to_dict()] for key, lead in self._entries.items()
+            ]
+        tmp_path = "{}.tmp".format(path)
+        with open(tmp_path, "w") as f:
+            json.dump(entries, f)
+        os.replace(tmp_path, path)
+        logger.info("Saved {} lead cache entries to {}".format(len(entries), path))
+
+
+LeadCache = _LeadCache()
@@ -1,23 +1,94 @@
+import hashlib
 import logging
+import math
 import random
-from concurrent.futures import ProcessPoolExecutor
+import time
+from concurrent.futures import CancelledError, as_completed
+from concurrent.futures.process import BrokenProcessPool
 from copy import deepcopy
+from dataclasses import dataclass
+from typing import Callable, Iterable, Iterator, Optional, TypeVar
 
 from constants import BattleType
 from fp.battle import Battle
-from config import FoulPlayConfig
-from .standard_battles import prepare_battles
-from .random_battles import prepare_random_battles
+from fp.legal_actions import legal_actions
+from config import FoulPlayConfig, SearchAggregation, SearchBackend
+from .standard_battles import iter_battles
+from .random_battles import iter_random_battles
+from .worker_pool import SearchWorkerPool
+from .scheduler import SearchScheduler, turn_criticality
+from .distributed import SearchCoordinator
+from .aggregation import StreamingPolicy, aggregate_policy
+from .transposition import MctsSummary, TranspositionTable, state_key
+from .telemetry import SearchTelemetry, TelemetrySink, policy_entropy
+from .throughput import SearchThroughput, base_search_time_ms
+from .worker_sampling import SamplingDatasets, sampling_chunks
+from .uncertainty import opponent_uncertainty_bits, policy_spread
+from .focus import focus_moves, focused_battle
+from .belief import Beliefs
+from .lead_cache import LEAD_CACHE_SEARCHES_TO_TRUST, LeadCache, top_up_deadline
+from .endgame import (
+    EndgameTable,
+    ExpectiminimaxSummary,
+    endgame_policy,
+    search_backend,
+)
 
-from poke_engine import State as PokeEngineState, monte_carlo_tree_search, MctsResult
+from poke_engine import (
+    State as PokeEngineState,
+    iterative_deepening_expectiminimax,
+    monte_carlo_tree_search,
+)
 
 from fp.search.poke_engine_helpers import battle_to_poke_engine_state
 
 logger = logging.getLogger(__name__)
 
+# When searching against a deadline, the fraction of the time left
+# that may be spent sampling battles before searching them
+SAMPLING_DEADLINE_FRACTION = 0.25
+
+# Time kept back from the search for collecting and aggregating the results
+AGGREGATION_RESERVE_MS = 20
+
+# Time each search loses to IPC and `PokeEngineState.from_string`
+SEARCH_OVERHEAD_MS = 5
+
+MIN_SEARCH_TIME_MS = 10
+
+# Battles are sampled in waves of `FoulPlayConfig.parallelism`:
+# one wave per this many bits of uncertainty about the opponent's sets, up to a maximum.
+# A freshly revealed pokemon's sets are about 2.6 bits in gen9 random battles,
+# so the number of waves goes down as the opponent's team is revealed and fainted
+BITS_PER_WORLD_WAVE = 5
+MAX_WORLD_WAVES = 4
+
+# A second wave of battles is sampled when the first ones' policies disagree more than this,
+# see `uncertainty.policy_spread`
+POLICY_SPREAD_THRESHOLD = 0.3
+
+# Without a deadline, the share of the planned search time held back for that wave
+SPREAD_ROUND_FRACTION = 0.25
+
+# When no search has finished by the deadline, how much longer than its own search
+# time to wait for the first one before giving up on all of them
+LATE_SEARCH_SLACK_MS = 1000
+
+# With `--search-focus-moves`, the share of the search time that goes to the first round,
+# which searches every move. The results of each round are weighted by their share
+FOCUS_FIRST_ROUND_FRACTION = 0.5
+
+
+def policy_from_mcts_results(
+    mcts_results: list[(MctsSummary, float, int)],
+    strategy: SearchAggregation = None,
+    telemetry: SearchTelemetry = None,
+) -> dict[str, float]:
+    """Aggregates the searches of every sampled battle into one value per move"""
+    if strategy is None:
+        strategy = FoulPlayConfig.search_aggregation
+    telemetry = telemetry or SearchTelemetry()
 
-def select_move_from_mcts_results(mcts_results: list[(MctsResult, float, int)]) -> str:
-    final_policy = {}
     for mcts_result, sample_chance, index in mcts_results:
         this_policy = max(mcts_result.side_one, key=lambda x: x.visits)
         logger.info(
@@ -29,12 +100,32 @@ def select_move_from_mcts_results(mcts_results: list[(MctsResult, float, int)])
                 round(sample_chance, 3),
             )
         )
-        for s1_option in mcts_result.side_one:
-            final_policy[s1_option.move_choice] = final_policy.get(
-                s1_option.move_choice, 0
-            ) + (sample_chance * (s1_option.visits / mcts_result.total_visits))
 
-    final_policy = sorted(final_policy.items(), key=lambda x: x[1], reverse=True)
+    with telemetry.phase("aggregation"):
+        visit_policy = aggregate_policy(mcts_results, SearchAggregation.visit_weighted)
+        telemetry.policy_entropy = policy_entropy(visit_policy)
+        if strategy == SearchAggregation.visit_weighted:
+            return visit_policy
+        return aggregate_policy(mcts_results, strategy)
+
+
+def select_move_from_policy(
+    policy: dict[str, float],
+    strategy: SearchAggregation = None,
+    telemetry: SearchTelemetry = None,
+    rng=random,
+) -> str:
+    if strategy is None:
+        strategy = FoulPlayConfig.search_aggregation
+    telemetry = telemetry or SearchTelemetry()
+    final_policy = sorted(policy.items(), key=lambda x: x[1], reverse=True)
+
+    if strategy != SearchAggregation.visit_weighted:
+        logger.info("Best choices by {}:".format(strategy.name))
+        for policy in final_policy[:3]:
+            logger.info(f"\t{round(policy[1], 3)}: {policy[0]}")
+        telemetry.choice = final_policy[0][0]
+        return telemetry.choice
 
     # Consider all moves that are close to the best move
     highest_percentage = final_policy[0][1]
@@ -43,17 +134,525 @@ def select_move_from_mcts_results(mcts_results: list[(MctsResult, float, int)])
     for i, policy in enumerate(final_policy):
         logger.info(f"\t{round(policy[1] * 100, 3)}%: {policy[0]}")
 
-    choice = random.choices(final_policy, weights=[p[1] for p in final_policy])[0]
+    choice = rng.choices(final_policy, weights=[p[1] for p in final_policy])[0]
+    telemetry.choice = choice[0]
     return choice[0]
 
 
-def get_result_from_mcts(state: str, search_time_ms: int, index: int) -> MctsResult:
+def select_move_from_mcts_results(
+    mcts_results: list[(MctsSummary, float, int)],
+    strategy: SearchAggregation = None,
+    telemetry: SearchTelemetry = None,
+    rng=random,
+) -> str:
+    policy = policy_from_mcts_results(mcts_results, strategy, telemetry)
+    return select_move_from_policy(policy, strategy, telemetry, rng)
+
+
+def get_result_from_mcts(state: str, search_time_ms: int, index: int) -> MctsSummary:
     logger.debug("Calling with {} state: {}".format(index, state))
+    started = time.perf_counter()
     poke_engine_state = PokeEngineState.from_string(state)
 
     res = monte_carlo_tree_search(poke_engine_state, search_time_ms)
     logger.info("Iterations {}: {}".format(index, res.total_visits))
-    return res
+    return MctsSummary.from_mcts_result(
+        res, search_ms=1000 * (time.perf_counter() - started)
+    )
+
+
+def get_result_from_expectiminimax(
+    state: str, search_time_ms: int, index: int
+) -> ExpectiminimaxSummary:
+    started = time.perf_counter()
+    poke_engine_state = PokeEngineState.from_string(state)
+
+    res = iterative_deepening_expectiminimax(poke_engine_state, search_time_ms)
+    logger.info("Depth {}: {}".format(index, res.depth_searched))
+    return ExpectiminimaxSummary.from_result(
+        res, search_ms=1000 * (time.perf_counter() - started)
+    )
+
+
+@dataclass
+class SampledWorld:
+    key: bytes
+    chance: float
+    summary: MctsSummary
+    search_time_ms: int
+
+
+def sample_and_search(
+    battle: Battle,
+    datasets: (str, str),
+    seed: int,
+    num_battles: int,
+    chance: float,
+    search_time_ms: int,
+    index: int,
+) -> (list[SampledWorld], dict[str, float]):
+    """
+    Runs in a search worker: samples `num_battles` battles from `battle` with `seed`,
+    then converts and searches each one.
+
+    The chunk as a whole gets `num_battles * search_time_ms`, so the time spent sampling
+    is taken from the searches that come after it.
+    Returns the searched worlds and how long sampling and conversion took
+    """
+    SamplingDatasets.install(*datasets)
+    telemetry = SearchTelemetry()
+    started = time.monotonic()
+    budget_ms = num_battles * search_time_ms
+    worlds = {}
+    # the belief lives in the process playing the battle, a worker has none to update
+    states = iter_states(
+        battle,
+        num_battles,
+        telemetry=telemetry,
+        rng=random.Random(seed),
+        use_belief=False,
+    )
+    for i, (state, _) in enumerate(states):
+        elapsed_ms = 1000 * (time.monotonic() - started)
+        ms = min(search_time_ms, int((budget_ms - elapsed_ms) / (num_battles - i)))
+        ms = max(MIN_SEARCH_TIME_MS, ms)
+        summary = get_result_from_mcts(state, ms, index + i)
+
+        key = state_key(state)
+        world = worlds.get(key)
+        if world is None:
+            worlds[key] = SampledWorld(key, chance, summary, ms)
+        else:
+            world.chance += chance
+            world.summary = world.summary.merge(summary)
+            world.search_time_ms += ms
+
+    return list(worlds.values()), telemetry.phases_ms
+
+
+T = TypeVar("T")
+
+
+def collect_searches(
+    futures: dict,
+    collect: Callable[[object, object], None],
+    deadline: float = None,
+    late_ms: int = 0,
+    wait_for_one: bool = True,
+    stop_early: Callable[[], bool] = None,
+    name: str = "searches",
+) -> int:
+    """
+    Calls `collect(fut, result)` with each of `futures` as it finishes, until
+    `deadline` passes or `stop_early()` is true.
+
+    If `wait_for_one` is set and nothing was collected by the deadline, waits up to
+    `late_ms` more for the first search to finish.
+    Searches cancelled by a worker pool restart are dropped, and every search that
+    was not collected is cancelled. A `BrokenProcessPool` is raised to the caller,
+    see `retry_if_a_worker_dies`.
+    Returns how many searches were collected
+    """
+    timeout = None
+    if deadline is not None:
+        timeout = max(0, deadline - time.monotonic())
+
+    seen = set()
+    num_collected = 0
+    num_cancelled = 0
+
+    def collect_next(fut) -> bool:
+        nonlocal num_collected, num_cancelled
+        seen.add(fut)
+        try:
+            result = fut.result()
+        except CancelledError:
+            num_cancelled += 1
+            return False
+        collect(fut, result)
+        num_collected += 1
+        return True
+
+    try:
+        for fut in as_completed(futures, timeout=timeout):
+            if (
+                collect_next(fut)
+                and stop_early is not None
+                and num_collected + num_cancelled < len(futures)
+                and stop_early()
+            ):
+                break
+    except TimeoutError:
+        if num_collected == 0 and wait_for_one:
+            logger.warning(
+                "No search finished before the deadline, waiting up to {}ms "
+                "for the first one".format(late_ms)
+            )
+            try:
+                for fut in as_completed(set(futures) - seen, timeout=late_ms / 1000):
+                    if collect_next(fut):
+                        break
+            except TimeoutError:
+                pass
+        logger.warning(
+            "Dropping {} {} that did not finish before the deadline".format(
+                len(futures) - num_collected - num_cancelled, name
+            )
+        )
+    finally:
+        # searches still waiting for a worker are never started
+        for fut in futures:
+            fut.cancel()
+
+    if num_cancelled:
+        logger.warning(
+            "Dropping {} {} cancelled by a worker pool restart".format(
+                num_cancelled, name
+            )
+        )
+    return num_collected
+
+
+def retry_if_a_worker_dies(search: Callable[[], T], retry: Callable[[], T] = None) -> T:
+    """
+    Runs `search`, and if a worker died during it restarts the worker pool and runs
+    `retry` (by default `search` again) once.
+    `retry` should undo whatever the first attempt recorded
+    """
+    try:
+        return search()
+    except BrokenProcessPool:
+        logger.warning("A search worker died, retrying the search once")
+        SearchWorkerPool.restart()
+        return (retry or search)()
+
+
+@dataclass
+class _World:
+    state: str
+    chance: float
+    summary: Optional[MctsSummary] = None
+    searched_ms: int = 0
+    # whether the chance of the world so far is in the streaming policy
+    counted: bool = False
+
+
+def search_states(
+    states: Iterable[tuple[str, float]],
+    search_time_ms: int,
+    deadline: float = None,
+    early_stopping: bool = False,
+    telemetry: SearchTelemetry = None,
+    criticality: float = 0,
+    first_index: int = 0,
+) -> list[(MctsSummary, float, int)]:
+    """
+    Searches every state in the worker pool as soon as `states` produces it,
+    so that sampling the next states overlaps with searching the first ones.
+
+    A state that is produced again is not a new world and is not searched again:
+    its chance is added to the first one. Once every state is produced, the time
+    that was planned for the repeated ones is spent searching the others for longer.
+    States already in the transposition table are not searched again, or are only
+    searched for the time that was not already spent on them.
+    Searches that have not finished when `deadline` passes, or once the best move
+    is safely ahead when `early_stopping` is set, are cancelled and dropped.
+    So are searches cancelled by the worker pool being restarted, e.g. by another
+    battle whose search broke the pool.
+    `deadline` and `criticality` also order these searches against other battles'.
+    Worlds are numbered from `first_index`
+    """
+    telemetry = telemetry or SearchTelemetry()
+    telemetry.queue_depth = SearchScheduler.queue_depth()
+    streaming_policy = StreamingPolicy(0)
+    worlds = []
+    world_indexes = {}
+    futures = {}
+    num_sampled = 0
+    num_cached = 0
+
+    def submit(index, ms):
+        if FoulPlayConfig.search_workers:
+            fut = SearchCoordinator.submit(worlds[index].state, ms, first_index + index)
+        else:
+            fut = SearchScheduler.submit(
+                get_result_from_mcts,
+                worlds[index].state,
+                ms,
+                first_index + index,
+                deadline=deadline,
+                criticality=criticality,
+                battle_tag=telemetry.battle_tag,
+            )
+        futures[fut] = (index, ms)
+
+    for state, chance in states:
+        num_sampled += 1
+        streaming_policy.total_weight += chance
+        if state in world_indexes:
+            world = worlds[world_indexes[state]]
+            world.chance += chance
+            # otherwise the whole chance is counted when its search is collected
+            if world.counted:
+                streaming_policy.add(world.summary, chance)
+            continue
+
+        index = len(worlds)
+        world_indexes[state] = index
+        world = _World(state, chance)
+        worlds.append(world)
+        cached, remaining_ms = TranspositionTable.lookup(state, search_time_ms)
+        if cached is not None:
+            world.summary = cached
+            world.searched_ms = search_time_ms - remaining_ms
+        if remaining_ms <= 0:
+            num_cached += 1
+            streaming_policy.add(cached, chance)
+            world.counted = True
+            telemetry.add_world(
+                cached, chance, first_index + index, search_time_ms, cached=True
+            )
+            continue
+        if cached is not None:
+            remaining_ms = max(MIN_SEARCH_TIME_MS, remaining_ms)
+        submit(index, remaining_ms)
+
+    telemetry.num_sampled += num_sampled
+    telemetry.num_worlds += len(worlds)
+    if num_sampled > len(worlds):
+        logger.info(
+            "Merged {} sampled battles into {} distinct states".format(
+                num_sampled, len(worlds)
+            )
+        )
+    if num_cached:
+        logger.info(
+            "{} of {} states were found in the search cache".format(
+                num_cached, len(worlds)
+            )
+        )
+
+    # the search slots of the states sampled again or found in the cache are given
+    # to the states being searched, as a follow-up search of each one
+    searched = sorted({index for index, _ in futures.values()})
+    if searched:
+        extra_ms = (
+            search_time_after_deduplication(num_sampled, len(searched), search_time_ms)
+            - search_time_ms
+        )
+        if extra_ms >= MIN_SEARCH_TIME_MS:
+            logger.info(
+                "Searching {} states for {}ms more".format(len(searched), extra_ms)
+            )
+            for index in searched:
+                submit(index, extra_ms)
+
+    num_collected = 0
+
+    def collect(fut, mcts_result):
+        nonlocal num_collected
+        index, ms = futures[fut]
+        world = worlds[index]
+        SearchThroughput.observe(mcts_result.total_visits, mcts_result.search_ms)
+        telemetry.add_world(
+            mcts_result, world.chance, first_index + index, ms, cached=False
+        )
+        if world.summary is None:
+            world.summary = mcts_result
+        else:
+            world.summary = world.summary.merge(mcts_result)
+        world.searched_ms += ms
+        TranspositionTable.store(world.state, world.searched_ms, world.summary)
+        if not world.counted:
+            streaming_policy.add(mcts_result, world.chance)
+            world.counted = True
+        num_collected += 1
+
+    def stop_early() -> bool:
+        if not streaming_policy.lead_is_safe():
+            return False
+        logger.info(
+            "{} is safely ahead after {} of {} searches, stopping early".format(
+                streaming_policy.best_move(),
+                num_cached + num_collected,
+                num_cached + len(futures),
+            )
+        )
+        return True
+
+    collect_searches(
+        futures,
+        collect,
+        deadline=deadline,
+        late_ms=search_time_ms + LATE_SEARCH_SLACK_MS,
+        wait_for_one=num_cached == 0,
+        stop_early=stop_early if early_stopping else None,
+    )
+
+    mcts_results = [
+        (world.summary, world.chance, first_index + index)
+        for index, world in enumerate(worlds)
+        if world.summary is not None
+    ]
+    telemetry.num_searched += len(mcts_results)
+    return mcts_results
+
+
+def search_in_workers(
+    battle: Battle,
+    num_battles: int,
+    search_time_ms: int,
+    deadline: float = None,
+    early_stopping: bool = False,
+    telemetry: SearchTelemetry = None,
+    criticality: float = 0,
+    rng=random,
+) -> list[(MctsSummary, float, int)]:
+    """
+    Sends `battle` to the workers in at most one chunk per worker instead of
+    sampling and converting every battle here. Each chunk samples its battles
+    with its own seed, so the sampling is spread over every worker.
+
+    Worlds sampled by more than one chunk are merged. The transposition table is
+    not used because the states are never seen by this process
+    """
+    telemetry = telemetry or SearchTelemetry()
+    telemetry.queue_depth = SearchScheduler.queue_depth()
+    datasets = SamplingDatasets.publish()
+    chance = 1 / num_battles
+    streaming_policy = StreamingPolicy(1)
+    worlds = {}
+    futures = {}
+    index = 0
+    for seed, chunk_size in sampling_chunks(
+        num_battles, FoulPlayConfig.parallelism, rng
+    ):
+        fut = SearchScheduler.submit(
+            sample_and_search,
+            battle,
+            datasets,
+            seed,
+            chunk_size,
+            chance,
+            search_time_ms,
+            index,
+            deadline=deadline,
+            criticality=criticality,
+            battle_tag=telemetry.battle_tag,
+        )
+        futures[fut] = (index, chunk_size)
+        index += chunk_size
+
+    num_collected = 0
+
+    def collect(fut, result):
+        nonlocal num_collected
+        index, chunk_size = futures[fut]
+        sampled_worlds, phases_ms = result
+        for name in ["sampling", "conversion"]:
+            telemetry.phases_ms[name] = telemetry.phases_ms.get(
+                name, 0
+            ) + phases_ms.get(name, 0)
+        telemetry.num_sampled += chunk_size
+        for i, world in enumerate(sampled_worlds):
+            SearchThroughput.observe(
+                world.summary.total_visits, world.summary.search_ms
+            )
+            telemetry.add_world(
+                world.summary,
+                world.chance,
+                index + i,
+                world.search_time_ms,
+                cached=False,
+            )
+            streaming_policy.add(world.summary, world.chance)
+            if world.key in worlds:
+                _, first = worlds[world.key]
+                first.chance += world.chance
+                first.summary = first.summary.merge(world.summary)
+            else:
+                worlds[world.key] = (index + i, world)
+        num_collected += 1
+
+    def stop_early() -> bool:
+        if not streaming_policy.lead_is_safe():
+            return False
+        logger.info(
+            "{} is safely ahead after {} of {} chunks, stopping early".format(
+                streaming_policy.best_move(), num_collected, len(futures)
+            )
+        )
+        return True
+
+    # a chunk searches its battles one after the other
+    largest_chunk = max((chunk_size for _, chunk_size in futures.values()), default=0)
+    collect_searches(
+        futures,
+        collect,
+        deadline=deadline,
+        late_ms=largest_chunk * search_time_ms + LATE_SEARCH_SLACK_MS,
+        stop_early=stop_early if early_stopping else None,
+        name="chunks",
+    )
+
+    mcts_results = [
+        (world.summary, world.chance, index)
+        for index, world in sorted(worlds.values(), key=lambda x: x[0])
+    ]
+    telemetry.num_worlds = len(mcts_results)
+    telemetry.num_searched = len(mcts_results)
+    return mcts_results
+
+
+def search_time_for_deadline(num_states: int, deadline: float) -> (int, int):
+    """
+    Returns how many of `num_states` can be searched, and for how long each,
+    so that every search finishes before `deadline`.
+    Searches of other battles already waiting for a worker are assumed to go first
+    """
+    remaining_ms = (deadline - time.monotonic()) * 1000 - AGGREGATION_RESERVE_MS
+    num_queued = SearchScheduler.queue_depth()
+    waves = math.ceil((num_states + num_queued) / FoulPlayConfig.parallelism)
+    if remaining_ms / waves - SEARCH_OVERHEAD_MS < MIN_SEARCH_TIME_MS:
+        waves = max(1, int(remaining_ms // (MIN_SEARCH_TIME_MS + SEARCH_OVERHEAD_MS)))
+        num_states = min(
+            num_states, max(1, waves * FoulPlayConfig.parallelism - num_queued)
+        )
+
+    search_time_ms = max(
+        MIN_SEARCH_TIME_MS, int(remaining_ms / waves) - SEARCH_OVERHEAD_MS
+    )
+    return num_states, search_time_ms
+
+
+def deduplicate_states(states: list[(str, float)]) -> list[(str, float)]:
+    """
+    Merges sampled worlds that serialize to the same engine state, summing their chances.
+    The result is ordered from the most to the least likely state
+    """
+    merged = {}
+    for state, chance in states:
+        merged[state] = merged.get(state, 0) + chance
+
+    if len(merged) < len(states):
+        logger.info(
+            "Merged {} sampled battles into {} distinct states".format(
+                len(states), len(merged)
+            )
+        )
+    return sorted(merged.items(), key=lambda x: x[1], reverse=True)
+
+
+def search_time_after_deduplication(
+    num_sampled: int, num_distinct: int, search_time_ms: int
+) -> int:
+    """
+    Gives the time that would have been spent searching duplicate states
+    to the distinct states by searching each of them for longer
+    """
+    waves_sampled = math.ceil(num_sampled / FoulPlayConfig.parallelism)
+    waves_distinct = math.ceil(num_distinct / FoulPlayConfig.parallelism)
+    return int(search_time_ms * waves_sampled / waves_distinct)
 
 
 def search_time_num_battles_randombattles(battle):
@@ -73,13 +672,13 @@ def search_time_num_battles_randombattles(battle):
     ):
         num_battles_multiplier = 2 if in_time_pressure else 4
         return FoulPlayConfig.parallelism * num_battles_multiplier, int(
-            FoulPlayConfig.search_time_ms // 2
+            base_search_time_ms() // 2
         )
 
     else:
         num_battles_multiplier = 1 if in_time_pressure else 2
         return FoulPlayConfig.parallelism * num_battles_multiplier, int(
-            FoulPlayConfig.search_time_ms
+            base_search_time_ms()
         )
 
 
@@ -94,52 +693,595 @@ def search_time_num_battles_standard_battle(battle):
     ):
         num_battles_multiplier = 1 if in_time_pressure else 2
         return FoulPlayConfig.parallelism * num_battles_multiplier, int(
-            FoulPlayConfig.search_time_ms
+            base_search_time_ms()
         )
     else:
-        return FoulPlayConfig.parallelism, FoulPlayConfig.search_time_ms
+        return FoulPlayConfig.parallelism, base_search_time_ms()
 
 
-def find_best_move(battle: Battle) -> str:
+def decision_rng(battle: Battle, purpose: str):
+    """
+    With `--search-seed` set, a generator seeded from the seed, the battle, the turn
+    and `purpose` so that a decision is sampled and made the same way every time.
+    Otherwise, the global `random` module
+    """
+    if FoulPlayConfig.search_seed is None:
+        return random
+    key = "{}:{}:{}:{}".format(
+        FoulPlayConfig.search_seed, battle.battle_tag, battle.turn, purpose
+    )
+    return random.Random(hashlib.sha256(key.encode()).digest())
+
+
+def _battle_to_search(battle: Battle) -> Battle:
     battle = deepcopy(battle)
     if battle.team_preview:
         battle.user.active = battle.user.reserve.pop(0)
         battle.opponent.active = battle.opponent.reserve.pop(0)
+    return battle
 
+
+def plan_search(battle: Battle) -> (int, int):
+    """How many battles to sample and how long to search each of them for"""
     if battle.battle_type == BattleType.RANDOM_BATTLE:
-        num_battles, search_time_per_battle = search_time_num_battles_randombattles(
-            battle
+        num_battles, search_time_ms = search_time_num_battles_randombattles(battle)
+    elif battle.battle_type in (
+        BattleType.BATTLE_FACTORY,
+        BattleType.STANDARD_BATTLE,
+    ):
+        num_battles, search_time_ms = search_time_num_battles_standard_battle(battle)
+    else:
+        raise ValueError("Unsupported battle type: {}".format(battle.battle_type))
+    return worlds_for_uncertainty(battle, num_battles, search_time_ms)
+
+
+def worlds_for_uncertainty(
+    battle: Battle, num_battles: int, search_time_ms: int
+) -> (int, int):
+    """
+    Splits the search time that `num_battles` battles of `search_time_ms` would take
+    between more battles or longer searches, by how uncertain the opponent's sets are:
+    a wave of battles per `BITS_PER_WORLD_WAVE` bits of uncertainty
+    """
+    parallelism = FoulPlayConfig.parallelism
+    budget_ms = math.ceil(num_battles / parallelism) * search_time_ms
+    bits = opponent_uncertainty_bits(battle)
+    waves = min(MAX_WORLD_WAVES, 1 + int(bits // BITS_PER_WORLD_WAVE))
+    search_time_ms = max(MIN_SEARCH_TIME_MS, int(budget_ms / waves))
+    logger.info(
+        "Opponent uncertainty of {} bits: sampling {} battles".format(
+            round(bits, 2), waves * parallelism
         )
-        battles = prepare_random_battles(battle, num_battles)
-    elif battle.battle_type == BattleType.BATTLE_FACTORY:
-        num_battles, search_time_per_battle = search_time_num_battles_standard_battle(
-            battle
+    )
+    return waves * parallelism, search_time_ms
+
+
+def iter_states(
+    battle: Battle,
+    num_battles: int,
+    deadline: float = None,
+    telemetry: SearchTelemetry = None,
+    rng=random,
+    use_belief: bool = True,
+) -> Iterator[tuple[str, float]]:
+    """
+    Samples `num_battles` battles one at a time and yields each one
+    as an engine state with its chance. States are not deduplicated.
+    With `--search-belief-particles` and `use_belief`, the battles are drawn from
+    the battle's belief
+    """
+    telemetry = telemetry or SearchTelemetry()
+    if use_belief and FoulPlayConfig.search_belief_particles > 0:
+        battles = Beliefs.sample_battles(
+            battle, num_battles, deadline=deadline, rng=rng
         )
-        battles = prepare_random_battles(battle, num_battles)
     elif battle.battle_type == BattleType.STANDARD_BATTLE:
-        num_battles, search_time_per_battle = search_time_num_battles_standard_battle(
-            battle
+        battles = iter_battles(battle, num_battles, deadline=deadline, rng=rng)
+    else:
+        battles = iter_random_battles(battle, num_battles, deadline=deadline, rng=rng)
+
+    while True:
+        with telemetry.phase("sampling"):
+            sampled = next(battles, None)
+        if sampled is None:
+            return
+        b, chance = sampled
+        with telemetry.phase("conversion"):
+            state = battle_to_poke_engine_state(b).to_string()
+        yield state, chance
+
+
+def _sampling_deadline(deadline: Optional[float]) -> Optional[float]:
+    if deadline is None:
+        return None
+    now = time.monotonic()
+    return now + SAMPLING_DEADLINE_FRACTION * (deadline - now)
+
+
+def prepare_states(
+    battle: Battle,
+    deadline: float = None,
+    telemetry: SearchTelemetry = None,
+    rng=random,
+    use_belief: bool = True,
+) -> (list[(str, float)], int):
+    """
+    Samples the battles to search and converts them to distinct engine states.
+    Returns the states with their chances, and how long to search each of them for.
+    `use_belief` is passed on to `iter_states`
+    """
+    telemetry = telemetry or SearchTelemetry()
+    battle = _battle_to_search(battle)
+    num_battles, search_time_per_battle = plan_search(battle)
+    sampled = list(
+        iter_states(
+            battle,
+            num_battles,
+            deadline=_sampling_deadline(deadline),
+            telemetry=telemetry,
+            rng=rng,
+            use_belief=use_belief,
+        )
+    )
+    states = deduplicate_states(sampled)
+    telemetry.num_sampled = len(sampled)
+    telemetry.num_worlds = len(states)
+
+    if deadline is None:
+        search_time_per_battle = search_time_after_deduplication(
+            len(sampled), len(states), search_time_per_battle
         )
-        battles = prepare_battles(battle, num_battles)
     else:
-        raise ValueError("Unsupported battle type: {}".format(battle.battle_type))
+        num_states, search_time_per_battle = search_time_for_deadline(
+            len(states), deadline
+        )
+        states = states[:num_states]
+        total_chance = sum(chance for _, chance in states)
+        states = [(state, chance / total_chance) for state, chance in states]
+
+    return states, search_time_per_battle
+
+
+def search_battle(
+    battle: Battle, deadline: float = None, telemetry: SearchTelemetry = None
+) -> list[(MctsSummary, float, int)]:
+    """
+    `deadline` is a `time.monotonic()` time that the whole decision must be made by.
+    If not given and the time bank is enabled, it is planned from the battle timer
+
+    Battles are sampled one at a time and each one is searched as soon as it is
+    converted, so sampling overlaps with the searches already running.
+    If the searched battles disagree on what to do and the deadline leaves time,
+    one more wave of battles is sampled and searched. Without a deadline,
+    `SPREAD_ROUND_FRACTION` of the planned search time is held back for it,
+    and is not spent when the battles agree.
+
+    With `--search-focus-moves`, the time is shared with a second round of freshly
+    sampled battles where only the best moves of the first round can be chosen
+    """
+    telemetry = telemetry or SearchTelemetry()
+    if deadline is None and FoulPlayConfig.use_time_bank:
+        deadline = battle.time_bank.deadline(battle)
+    if deadline is not None:
+        telemetry.deadline_ms = round(1000 * (deadline - time.monotonic()), 1)
+
+    criticality = turn_criticality(battle)
+    battle = _battle_to_search(battle)
+    num_battles, search_time_per_battle = plan_search(battle)
+
+    focus = FoulPlayConfig.search_focus_moves > 0 and not (
+        FoulPlayConfig.search_sample_in_workers and not FoulPlayConfig.search_workers
+    )
+    first_round_deadline = deadline
+    focus_search_time = search_time_per_battle
+    if focus and deadline is not None:
+        now = time.monotonic()
+        first_round_deadline = now + FOCUS_FIRST_ROUND_FRACTION * (deadline - now)
+    elif focus:
+        search_time_per_battle = max(
+            MIN_SEARCH_TIME_MS, int(FOCUS_FIRST_ROUND_FRACTION * search_time_per_battle)
+        )
+        focus_search_time = max(
+            MIN_SEARCH_TIME_MS, focus_search_time - search_time_per_battle
+        )
+    if deadline is not None:
+        num_battles, search_time_per_battle = search_time_for_deadline(
+            num_battles, first_round_deadline
+        )
 
     logger.info("Searching for a move using MCTS...")
     logger.info(
         "Sampling {} battles at {}ms each".format(num_battles, search_time_per_battle)
     )
-    with ProcessPoolExecutor(max_workers=FoulPlayConfig.parallelism) as executor:
-        futures = []
-        for index, (b, chance) in enumerate(battles):
-            fut = executor.submit(
-                get_result_from_mcts,
-                battle_to_poke_engine_state(b).to_string(),
+    if FoulPlayConfig.search_sample_in_workers and not FoulPlayConfig.search_workers:
+
+        def search():
+            return search_in_workers(
+                battle,
+                num_battles,
                 search_time_per_battle,
+                deadline=deadline,
+                early_stopping=FoulPlayConfig.search_early_stopping,
+                telemetry=telemetry,
+                criticality=criticality,
+                rng=decision_rng(battle, "sampling"),
+            )
+
+        def retry():
+            telemetry.worlds = []
+            telemetry.num_sampled = 0
+            return search()
+
+        with telemetry.phase("search"):
+            return retry_if_a_worker_dies(search, retry)
+
+    rng = decision_rng(battle, "sampling")
+    mcts_results = _search_all_moves(
+        battle,
+        num_battles,
+        search_time_per_battle,
+        deadline=first_round_deadline,
+        telemetry=telemetry,
+        criticality=criticality,
+        rng=rng,
+    )
+    if not focus:
+        return mcts_results
+    return _search_focused(
+        battle,
+        mcts_results,
+        num_battles,
+        focus_search_time,
+        deadline=deadline,
+        telemetry=telemetry,
+        criticality=criticality,
+        rng=rng,
+    )
+
+
+def next_world_index(mcts_results: list[(MctsSummary, float, int)]) -> int:
+    """The index after every world of `mcts_results`, so that more worlds can be added"""
+    return 1 + max((index for _, _, index in mcts_results), default=-1)
+
+
+def _search_all_moves(
+    battle: Battle,
+    num_battles: int,
+    search_time_per_battle: int,
+    deadline: float = None,
+    telemetry: SearchTelemetry = None,
+    criticality: float = 0,
+    rng=random,
+) -> list[(MctsSummary, float, int)]:
+    spread_round_ms = 0
+    if deadline is None:
+        waves = math.ceil(num_battles / FoulPlayConfig.parallelism)
+        first_round_ms = max(
+            MIN_SEARCH_TIME_MS,
+            int((1 - SPREAD_ROUND_FRACTION) * search_time_per_battle),
+        )
+        spread_round_ms = waves * (search_time_per_battle - first_round_ms)
+        search_time_per_battle = first_round_ms
+
+    mcts_results = _search_sampled(
+        battle,
+        num_battles,
+        search_time_per_battle,
+        deadline=deadline,
+        telemetry=telemetry,
+        criticality=criticality,
+        rng=rng,
+    )
+
+    # the searched worlds disagree on what to do: sample one more wave of battles
+    if not mcts_results:
+        return mcts_results
+    spread = policy_spread(mcts_results)
+    if spread <= POLICY_SPREAD_THRESHOLD:
+        return mcts_results
+    if deadline is None:
+        if spread_round_ms < MIN_SEARCH_TIME_MS:
+            return mcts_results
+        num_extra, search_time_per_battle = FoulPlayConfig.parallelism, spread_round_ms
+    else:
+        remaining_ms = 1000 * (deadline - time.monotonic()) - AGGREGATION_RESERVE_MS
+        if remaining_ms < MIN_SEARCH_TIME_MS + SEARCH_OVERHEAD_MS:
+            return mcts_results
+        num_extra, extra_search_time = search_time_for_deadline(
+            FoulPlayConfig.parallelism, deadline
+        )
+        search_time_per_battle = min(search_time_per_battle, extra_search_time)
+    logger.info(
+        "Policy spread of {} across the searched battles, sampling {} more".format(
+            round(spread, 3), num_extra
+        )
+    )
+    extra_results = _search_sampled(
+        battle,
+        num_extra,
+        search_time_per_battle,
+        deadline=deadline,
+        telemetry=telemetry,
+        criticality=criticality,
+        rng=rng,
+        first_index=next_world_index(mcts_results),
+    )
+
+    # every sampled battle is equally likely, whichever round it was sampled in
+    total_battles = num_battles + num_extra
+    return [
+        (mcts_result, chance * num_battles / total_battles, index)
+        for mcts_result, chance, index in mcts_results
+    ] + [
+        (mcts_result, chance * num_extra / total_battles, index)
+        for mcts_result, chance, index in extra_results
+    ]
+
+
+def _search_focused(
+    battle: Battle,
+    mcts_results: list[(MctsSummary, float, int)],
+    num_battles: int,
+    search_time_per_battle: int,
+    deadline: float = None,
+    telemetry: SearchTelemetry = None,
+    criticality: float = 0,
+    rng=random,
+) -> list[(MctsSummary, float, int)]:
+    """
+    Searches a second round of battles where only the best moves of `mcts_results`
+    can be chosen. Both rounds' results are returned, weighted by their share of the time
+    """
+    moves = focus_moves(
+        mcts_results,
+        FoulPlayConfig.search_focus_moves,
+        FoulPlayConfig.search_aggregation,
+    )
+    focused = focused_battle(battle, moves) if moves else None
+    if focused is None:
+        return mcts_results
+    if deadline is not None:
+        remaining_ms = 1000 * (deadline - time.monotonic()) - AGGREGATION_RESERVE_MS
+        if remaining_ms < MIN_SEARCH_TIME_MS + SEARCH_OVERHEAD_MS:
+            return mcts_results
+        num_battles, search_time_per_battle = search_time_for_deadline(
+            num_battles, deadline
+        )
+
+    logger.info(
+        "Focusing {} more battles at {}ms each on {}".format(
+            num_battles, search_time_per_battle, moves
+        )
+    )
+    focus_results = _search_sampled(
+        focused,
+        num_battles,
+        search_time_per_battle,
+        deadline=deadline,
+        telemetry=telemetry,
+        criticality=criticality,
+        rng=rng,
+        first_index=next_world_index(mcts_results),
+    )
+    return [
+        (mcts_result, chance * FOCUS_FIRST_ROUND_FRACTION, index)
+        for mcts_result, chance, index in mcts_results
+    ] + [
+        (mcts_result, chance * (1 - FOCUS_FIRST_ROUND_FRACTION), index)
+        for mcts_result, chance, index in focus_results
+    ]
+
+
+def _search_sampled(
+    battle: Battle,
+    num_battles: int,
+    search_time_per_battle: int,
+    deadline: float = None,
+    telemetry: SearchTelemetry = None,
+    criticality: float = 0,
+    rng=random,
+    first_index: int = 0,
+) -> list[(MctsSummary, float, int)]:
+    sampled = []
+    states = iter_states(
+        battle,
+        num_battles,
+        deadline=_sampling_deadline(deadline),
+        telemetry=telemetry,
+        rng=rng,
+    )
+
+    def record(states):
+        for state in states:
+            sampled.append(state)
+            yield state
+
+    counts = (telemetry.num_sampled, telemetry.num_worlds, telemetry.num_searched)
+
+    def search():
+        return search_states(
+            record(states),
+            search_time_per_battle,
+            deadline=deadline,
+            early_stopping=FoulPlayConfig.search_early_stopping,
+            telemetry=telemetry,
+            criticality=criticality,
+            first_index=first_index,
+        )
+
+    def retry():
+        telemetry.worlds = [w for w in telemetry.worlds if w.index < first_index]
+        telemetry.num_sampled, telemetry.num_worlds, telemetry.num_searched = counts
+        # the battles already sampled are searched again instead of sampling new ones
+        all_sampled = sampled + list(states)
+        retry_states = deduplicate_states(all_sampled)
+        if deadline is None:
+            retry_search_time = search_time_after_deduplication(
+                len(all_sampled), len(retry_states), search_time_per_battle
+            )
+        else:
+            _, retry_search_time = search_time_for_deadline(len(retry_states), deadline)
+        return search_states(
+            retry_states,
+            retry_search_time,
+            deadline=deadline,
+            early_stopping=FoulPlayConfig.search_early_stopping,
+            telemetry=telemetry,
+            criticality=criticality,
+            first_index=first_index,
+        )
+
+    # sampling and converting the states is timed by `iter_states` as it goes
+    with telemetry.phase("search", exclude=["sampling", "conversion"]):
+        return retry_if_a_worker_dies(search, retry)
+
+
+def search_endgame(
+    battle: Battle, deadline: float = None, telemetry: SearchTelemetry = None
+) -> dict[str, float]:
+    """
+    Searches every sampled battle with expectiminimax instead of MCTS.
+    Returns the maximin score of each move averaged over the sampled battles,
+    which is empty if no search finished
+    """
+    telemetry = telemetry or SearchTelemetry()
+    telemetry.backend = SearchBackend.expectiminimax.name
+    if deadline is None and FoulPlayConfig.use_time_bank:
+        deadline = battle.time_bank.deadline(battle)
+    if deadline is not None:
+        telemetry.deadline_ms = round(1000 * (deadline - time.monotonic()), 1)
+
+    states, search_time_ms = prepare_states(
+        battle,
+        deadline=deadline,
+        telemetry=telemetry,
+        rng=decision_rng(battle, "sampling"),
+    )
+    logger.info(
+        "Searching {} battles with expectiminimax at {}ms each".format(
+            len(states), search_time_ms
+        )
+    )
+
+    criticality = turn_criticality(battle)
+
+    def search() -> list[(ExpectiminimaxSummary, float, int)]:
+        results = []
+        futures = {}
+        for index, (state, chance) in enumerate(states):
+            cached, remaining_ms = EndgameTable.lookup(state, search_time_ms)
+            if remaining_ms <= 0:
+                results.append((cached, chance, index))
+                continue
+            fut = SearchScheduler.submit(
+                get_result_from_expectiminimax,
+                state,
+                search_time_ms,
                 index,
+                deadline=deadline,
+                criticality=criticality,
+                battle_tag=telemetry.battle_tag,
+            )
+            futures[fut] = (state, chance, index)
+
+        def collect(fut, summary):
+            state, chance, index = futures[fut]
+            EndgameTable.store(state, search_time_ms, summary)
+            results.append((summary, chance, index))
+
+        with telemetry.phase("search"):
+            collect_searches(
+                futures,
+                collect,
+                deadline=deadline,
+                late_ms=search_time_ms + LATE_SEARCH_SLACK_MS,
+                wait_for_one=not results,
+            )
+        return results
+
+    results = retry_if_a_worker_dies(search)
+    telemetry.num_searched = len(results)
+    telemetry.search_depth = min(
+        (summary.depth_searched for summary, _, _ in results), default=None
+    )
+    with telemetry.phase("aggregation"):
+        return endgame_policy(results)
+
+
+def select_endgame_move(
+    policy: dict[str, float], telemetry: SearchTelemetry = None
+) -> str:
+    telemetry = telemetry or SearchTelemetry()
+    final_policy = sorted(policy.items(), key=lambda x: x[1], reverse=True)
+    logger.info("Best choices by maximin score:")
+    for move, score in final_policy[:3]:
+        logger.info(f"\t{round(score, 3)}: {move}")
+    telemetry.choice = final_policy[0][0]
+    return telemetry.choice
+
+
+def find_best_move(battle: Battle, deadline: float = None) -> str:
+    """
+    Chooses the move to make in `battle`, for every way of playing a battle.
+
+    At team preview a lead policy cached from earlier battles is used when it is
+    trusted, otherwise it is topped up by this search. Endgames are searched with
+    expectiminimax, and the rest with MCTS together with what was pondered during
+    the opponent's turn. Pondering the reply to the chosen move is then started.
+    `deadline` is passed on to the search, see `search_battle`
+    """
+    # pondering searches with this module's functions
+    from .ponder import Ponderers, restrict_to_moves
+
+    rng = decision_rng(battle, "choice")
+    if battle.team_preview:
+        lead = LeadCache.lookup(battle)
+        if lead is not None and lead.num_searches >= LEAD_CACHE_SEARCHES_TO_TRUST:
+            logger.info(
+                "Using the cached lead policy of {} searches".format(lead.num_searches)
             )
-            futures.append((fut, chance, index))
+            return select_move_from_policy(lead.policy, rng=rng)
+        if lead is not None:
+            logger.info(
+                "Topping up the cached lead policy of {} searches".format(
+                    lead.num_searches
+                )
+            )
+            deadline = top_up_deadline(time.monotonic(), deadline)
+
+    telemetry = SearchTelemetry.for_battle(battle)
+    if search_backend(battle) == SearchBackend.expectiminimax:
+        Ponderers.for_battle(battle.battle_tag).cancel()
+        policy = search_endgame(battle, deadline=deadline, telemetry=telemetry)
+        if policy:
+            choice = select_endgame_move(policy, telemetry=telemetry)
+            logger.info("Choice: {}".format(choice))
+            TelemetrySink.emit(telemetry)
+            return choice
+        logger.warning("No endgame search finished, searching with MCTS instead")
+
+    pondered_results = []
+    if FoulPlayConfig.ponder and not battle.team_preview:
+        pondered_results = Ponderers.for_battle(battle.battle_tag).collect(battle)
 
-    mcts_results = [(fut.result(), chance, index) for (fut, chance, index) in futures]
-    choice = select_move_from_mcts_results(mcts_results)
+    mcts_results = search_battle(battle, deadline=deadline, telemetry=telemetry)
+    actions = [] if mcts_results else legal_actions(battle)
+    if actions:
+        logger.warning("No search finished, choosing {}".format(actions[0]))
+        TelemetrySink.emit(telemetry)
+        return actions[0]
+
+    # the approximated battle that was pondered may allow moves the real one does not
+    searched_moves = {o.move_choice for r, _, _ in mcts_results for o in r.side_one}
+    pondered_results = restrict_to_moves(pondered_results, searched_moves)
+    policy = policy_from_mcts_results(
+        mcts_results + pondered_results, telemetry=telemetry
+    )
+    if battle.team_preview:
+        policy = LeadCache.store(battle, policy).policy
+    choice = select_move_from_policy(policy, telemetry=telemetry, rng=rng)
     logger.info("Choice: {}".format(choice))
+    TelemetrySink.emit(telemetry)
+    if FoulPlayConfig.ponder:
+        Ponderers.for_battle(battle.battle_tag).start(battle, choice, mcts_results)
     return choice
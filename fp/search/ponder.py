@@ -0,0 +1,301 @@
+import logging
+import threading
+from collections import OrderedDict
+from copy import deepcopy
+from typing import Optional
+
+import constants
+from fp.battle import Battle
+from fp.battle import LastUsedMove
+
+from .main import get_result_from_mcts, prepare_states
+from .poke_engine_helpers import poke_engine_get_damage_rolls
+from .transposition import MctsSummary
+from .scheduler import SearchScheduler
+
+logger = logging.getLogger(__name__)
+
+
+# How many of the opponent's most likely replies to our move are pondered
+PONDER_NUM_REPLIES = 2
+
+# How much a pondered search counts for compared to the turn's own search
+PONDER_RESULT_WEIGHT = 0.5
+
+# HP is bucketed when matching a pondered battle to the real one
+# because the damage applied while pondering is only an average roll
+PONDER_HP_BUCKETS = 4
+
+# How many battles' ponderers are kept, e.g. for concurrent battles
+MAX_PONDERERS = 32
+
+# `calculate_damage` gives the highest roll. Rolls are uniform from 85% to 100%
+AVERAGE_DAMAGE_ROLL = 0.925
+
+
+def likely_opponent_replies(
+    mcts_results: list[(MctsSummary, float, int)], num_replies: int
+) -> list[str]:
+    """
+    The opponent's moves that were visited the most across every searched world
+    """
+    policy = {}
+    for mcts_result, sample_chance, _ in mcts_results:
+        for s2_option in mcts_result.side_two:
+            policy[s2_option.move_choice] = policy.get(s2_option.move_choice, 0) + (
+                sample_chance * s2_option.visits / mcts_result.total_visits
+            )
+    replies = sorted(policy.items(), key=lambda x: x[1], reverse=True)
+    return [move for move, _ in replies[:num_replies]]
+
+
+def ponder_key(battle: Battle) -> tuple:
+    def battler_key(battler):
+        return (
+            battler.active.name,
+            round(PONDER_HP_BUCKETS * battler.active.hp / battler.active.max_hp),
+            battler.active.status,
+            tuple(sorted((k, v) for k, v in battler.active.boosts.items() if v)),
+            tuple(sorted((k, v) for k, v in battler.side_conditions.items() if v)),
+        )
+
+    return battler_key(battle.user), battler_key(battle.opponent)
+
+
+def restrict_to_moves(
+    pondered: list[(MctsSummary, float, int)], moves: set[str]
+) -> list[(MctsSummary, float, int)]:
+    """
+    Drops the pondered moves that are not in `moves`,
+    e.g. a move that the approximated battle allowed but the real one does not.
+    A pondered search without any of `moves` is dropped
+    """
+    restricted = []
+    for mcts_result, sample_chance, index in pondered:
+        side_one = [o for o in mcts_result.side_one if o.move_choice in moves]
+        total_visits = sum(o.visits for o in side_one)
+        if total_visits <= 0:
+            continue
+        restricted.append(
+            (
+                MctsSummary(
+                    side_one=side_one,
+                    side_two=mcts_result.side_two,
+                    total_visits=total_visits,
+                    search_ms=mcts_result.search_ms,
+                ),
+                sample_chance,
+                index,
+            )
+        )
+    return restricted
+
+
+def _switch_in(battler, pkmn_name: str) -> bool:
+    pkmn = battler.find_pokemon_in_reserves(pkmn_name)
+    if pkmn is None or not pkmn.is_alive():
+        return False
+    battler.reserve.remove(pkmn)
+    battler.active.boosts.clear()
+    battler.active.volatile_statuses = []
+    battler.reserve.append(battler.active)
+    battler.active = pkmn
+    return True
+
+
+def _use_move(battle: Battle, battler, move: str):
+    base_move = move.removesuffix("-tera").removesuffix("-mega")
+    if move.endswith("-tera"):
+        battler.active.terastallized = True
+        for pkmn in [battler.active] + battler.reserve:
+            pkmn.can_terastallize = False
+    elif move.endswith("-mega"):
+        for mega_name, required_item in battler.active.get_mega_pkmn_info():
+            if required_item == battler.active.item:
+                battler.active.forme_change(mega_name)
+                break
+        battler.active.is_mega = True
+        for pkmn in [battler.active] + battler.reserve:
+            pkmn.can_mega_evo = False
+    battler.last_used_move = LastUsedMove(battler.active.name, base_move, battle.turn)
+
+
+def approximate_next_battle(
+    battle: Battle, user_move: str, opponent_move: str
+) -> Optional[Battle]:
+    """
+    The battle as it would be at the start of next turn if both sides used these moves,
+    with switches applied first and then an average damage roll from each side's move.
+    Terastallizing, mega evolving and the moves locked by the move used are kept
+
+    Returns None if the turn cannot be approximated,
+    e.g. a pkmn would faint and a replacement would have to be chosen
+    """
+    next_battle = deepcopy(battle)
+    for battler, move in [
+        (next_battle.user, user_move),
+        (next_battle.opponent, opponent_move),
+    ]:
+        if move.startswith(constants.SWITCH_STRING + " "):
+            if not _switch_in(battler, move.split(" ", 1)[1]):
+                return None
+            battler.last_used_move = LastUsedMove(None, move, battle.turn)
+        else:
+            _use_move(next_battle, battler, move)
+
+    user_went_first = next_battle.get_effective_speed(
+        next_battle.user
+    ) >= next_battle.get_effective_speed(next_battle.opponent)
+    user_rolls, opponent_rolls = poke_engine_get_damage_rolls(
+        deepcopy(next_battle),
+        user_move.removesuffix("-tera").removesuffix("-mega"),
+        opponent_move.removesuffix("-tera").removesuffix("-mega"),
+        user_went_first,
+    )
+    for pkmn, rolls in [
+        (next_battle.opponent.active, user_rolls),
+        (next_battle.user.active, opponent_rolls),
+    ]:
+        if rolls:
+            pkmn.hp -= int(AVERAGE_DAMAGE_ROLL * rolls[0])
+        if pkmn.hp <= 0:
+            return None
+
+    next_battle.user.lock_moves()
+    next_battle.turn += 1
+    return next_battle
+
+
+class BattlePonderer:
+    """
+    Searches the likely battles of a battle's next turn while waiting for the
+    opponent's decision.
+
+    `start` is called after a decision is sent. It approximates the battle after our
+    move and each of the opponent's likely replies, and queues searches of them in
+    the worker pool. `collect` is called when the next request arrives. It returns the
+    pondered searches that finished for the battle matching the real one and cancels
+    the rest.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._branches = {}
+
+    def start(
+        self,
+        battle: Battle,
+        user_move: str,
+        mcts_results: list[(MctsSummary, float, int)],
+    ):
+        self.cancel()
+        if battle.team_preview:
+            return
+        with self._lock:
+            generation = self._generation
+
+        replies = likely_opponent_replies(mcts_results, PONDER_NUM_REPLIES)
+        threading.Thread(
+            target=self._ponder,
+            args=(deepcopy(battle), user_move, replies, generation),
+            daemon=True,
+        ).start()
+
+    def _ponder(self, battle, user_move, replies, generation):
+        for opponent_move in replies:
+            try:
+                next_battle = approximate_next_battle(battle, user_move, opponent_move)
+                if next_battle is None:
+                    continue
+                # a speculative battle must not be taken as evidence by the belief
+                states, search_time_ms = prepare_states(next_battle, use_belief=False)
+            except Exception:
+                logger.exception(
+                    "Could not ponder {} vs {}".format(user_move, opponent_move)
+                )
+                continue
+
+            key = ponder_key(next_battle)
+            with self._lock:
+                if generation != self._generation:
+                    return
+                logger.info(
+                    "Pondering {} vs {}: {} states".format(
+                        user_move, opponent_move, len(states)
+                    )
+                )
+                branch = self._branches.setdefault(key, [])
+                for index, (state, chance) in enumerate(states):
+                    fut = SearchScheduler.submit(
+                        get_result_from_mcts,
+                        state,
+                        search_time_ms,
+                        index,
+                        background=True,
+                        battle_tag=battle.battle_tag,
+                    )
+                    branch.append((fut, chance))
+
+    def collect(self, battle: Battle) -> list[(MctsSummary, float, int)]:
+        key = ponder_key(battle)
+        with self._lock:
+            branch = self._branches.get(key, [])
+            self._cancel_locked()
+
+        pondered = []
+        total_chance = sum(chance for _, chance in branch)
+        for index, (fut, chance) in enumerate(branch):
+            if fut.done() and not fut.cancelled() and fut.exception() is None:
+                pondered.append(
+                    (
+                        fut.result(),
+                        PONDER_RESULT_WEIGHT * chance / total_chance,
+                        "ponder-{}".format(index),
+                    )
+                )
+        if branch:
+            logger.info(
+                "Using {} of {} pondered searches".format(len(pondered), len(branch))
+            )
+        return pondered
+
+    def _cancel_locked(self):
+        for branch in self._branches.values():
+            for fut, _ in branch:
+                fut.cancel()
+        self._branches = {}
+        self._generation += 1
+
+    def cancel(self):
+        with self._lock:
+            self._cancel_locked()
+
+
+class _Ponderers:
+    """The ponderer of every battle that is being played, see `BattlePonderer`"""
+
+    def __init__(self):
+        self._ponderers = OrderedDict()
+        self._lock = threading.Lock()
+
+    def for_battle(self, battle_tag: str) -> BattlePonderer:
+        with self._lock:
+            ponderer = self._ponderers.get(battle_tag)
+            if ponderer is None:
+                ponderer = BattlePonderer()
+                self._ponderers[battle_tag] = ponderer
+            self._ponderers.move_to_end(battle_tag)
+            while len(self._ponderers) > MAX_PONDERERS:
+                _, evicted = self._ponderers.popitem(last=False)
+                evicted.cancel()
+            return ponderer
+
+    def remove(self, battle_tag: str):
+        with self._lock:
+            ponderer = self._ponderers.pop(battle_tag, None)
+        if ponderer is not None:
+            ponderer.cancel()
+
+
+Ponderers = _Ponderers()
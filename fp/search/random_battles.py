@@ -1,11 +1,14 @@
 import logging
 import random
-from copy import deepcopy
+import time
+from functools import lru_cache
+from typing import Iterator
 
 from constants import BattleType
 from fp.battle import Battle, Pokemon
 from data.pkmn_sets import RandomBattleTeamDatasets, TeamDatasets
 from fp.search.helpers import populate_pkmn_from_set
+from fp.search.set_sampler import SetSamplers
 from fp.helpers import (
     POKEMON_TYPE_INDICES,
     is_super_effective,
@@ -15,7 +18,7 @@ from fp.helpers import (
 logger = logging.getLogger(__name__)
 
 
-def get_all_remaining_sets_for_revealed_pkmn(battle: Battle) -> dict:
+def get_all_remaining_sets_for_revealed_pkmn(battle: Battle, rng=random) -> dict:
     if battle.battle_type == BattleType.RANDOM_BATTLE:
         datasets = RandomBattleTeamDatasets
     elif battle.battle_type == BattleType.BATTLE_FACTORY:
@@ -32,74 +35,61 @@ def get_all_remaining_sets_for_revealed_pkmn(battle: Battle) -> dict:
     ret = {}
     for pkmn in revealed_pkmn:
         sets = datasets.get_all_remaining_sets(pkmn)
-        random.shuffle(sets)
+        rng.shuffle(sets)
         ret[pkmn.name] = sets
 
     return ret
 
 
-def prepare_random_battles(battle: Battle, num_battles: int) -> list[(Battle, float)]:
-    revealed_pkmn_sets = get_all_remaining_sets_for_revealed_pkmn(deepcopy(battle))
+def iter_random_battles(
+    battle: Battle, num_battles: int, deadline: float = None, rng=random
+) -> Iterator[tuple[Battle, float]]:
+    """
+    Samples the battles one at a time so that each can be searched as soon as it exists.
+
+    `rng` is the decision's source of randomness. Every sampled battle draws its own
+    generator from it so that a battle sampled with a given seed does not depend
+    on how many battles were sampled before it
+    """
+    revealed_pkmn_sets = get_all_remaining_sets_for_revealed_pkmn(
+        battle.clone(), rng=rng
+    )
+    samplers = {
+        pkmn_name: SetSamplers.get(
+            (battle.battle_tag, battle.turn),
+            pkmn_name,
+            sets,
+            lambda s: s.pkmn_set.count,
+        )
+        for pkmn_name, sets in revealed_pkmn_sets.items()
+    }
 
-    sampled_battles = []
     for index in range(num_battles):
+        if deadline is not None and index > 0 and time.monotonic() > deadline:
+            logger.warning(
+                "Sampling deadline reached after {} of {} battles".format(
+                    index, num_battles
+                )
+            )
+            break
         logger.info("Sampling battle {}".format(index))
-        battle_copy = deepcopy(battle)
+        battle_rng = random.Random(rng.getrandbits(64))
+        battle_copy = battle.clone()
 
         active = battle_copy.opponent.active
         if revealed_pkmn_sets[active.name]:
-            pkmn_full_set = random.choices(
-                revealed_pkmn_sets[active.name],
-                weights=[s.pkmn_set.count for s in revealed_pkmn_sets[active.name]],
-            )[0]
+            pkmn_full_set = samplers[active.name].sample(battle_rng)
             populate_pkmn_from_set(active, pkmn_full_set)
 
         for pkmn in filter(lambda x: x.is_alive(), battle_copy.opponent.reserve):
             if not revealed_pkmn_sets[pkmn.name]:
                 continue
-            pkmn_full_set = random.choices(
-                revealed_pkmn_sets[pkmn.name],
-                weights=[s.pkmn_set.count for s in revealed_pkmn_sets[pkmn.name]],
-            )[0]
+            pkmn_full_set = samplers[pkmn.name].sample(battle_rng)
             populate_pkmn_from_set(pkmn, pkmn_full_set)
 
-        populate_randombattle_unrevealed_pkmn(battle_copy)
+        populate_randombattle_unrevealed_pkmn(battle_copy, rng=battle_rng)
         battle_copy.opponent.lock_moves()
-        sampled_battles.append((battle_copy, 1 / num_battles))
-
-    return sampled_battles
-
-
-def sample_randombattle_pokemon(existing_pokemon: list[Pokemon]) -> Pokemon:
-    ok = False
-    existing_pokemon_names = {pkmn.name for pkmn in existing_pokemon}
-
-    sample_count = 0
-    while not ok:
-        sample_count += 1
-        ok = True
-        pkmn_name, pkmn_sets = random.choice(
-            list(RandomBattleTeamDatasets.pkmn_sets.items())
-        )
-        pkmn_full_set = random.choice(pkmn_sets)
-        pkmn = Pokemon(pkmn_name, pkmn_full_set.pkmn_set.level)
-        if pkmn_name in existing_pokemon_names:
-            ok = False
-        if sample_count < 10 and _more_than_3_pokemon_weak_to_a_given_typing(
-            existing_pokemon + [pkmn]
-        ):
-            ok = False
-        if sample_count < 10 and _more_than_2_pokemon_of_any_type(
-            existing_pokemon + [pkmn]
-        ):
-            ok = False
-        if sample_count < 10 and _more_than_1_pokemon_with_4x_weakness(
-            existing_pokemon + [pkmn]
-        ):
-            ok = False
-
-    populate_pkmn_from_set(pkmn, pkmn_full_set)
-    return pkmn
+        yield battle_copy, 1 / num_battles
 
 
 #
@@ -109,47 +99,103 @@ def sample_randombattle_pokemon(existing_pokemon: list[Pokemon]) -> Pokemon:
 #   more than 3 Pokemon weak to any given typing,
 #   more than 2 Pokemon of any given type,
 #   or more than 1 Pokemon that shares a 4x weakness
-def _more_than_3_pokemon_weak_to_a_given_typing(team: list[Pokemon]) -> bool:
-    num_pkmn_weak_to_typing = {}
-    for pkmn in team:
-        for t in POKEMON_TYPE_INDICES.keys():
-            if is_super_effective(t, pkmn.types):
-                num_pkmn_weak_to_typing[t] = num_pkmn_weak_to_typing.get(t, 0) + 1
+#
+# A pokemon's type profile counts, for every type, whether it is weak to it,
+# whether it has it and whether it is 4x weak to it. Each count is a 5-bit lane of
+# one int so that a team's counts are the sum of its pokemon's profiles.
+# The lanes are biased so that a count over its limit sets the lane's high bit,
+# which makes checking every limit of a team a single addition and mask
+_PROFILE_TYPES = list(POKEMON_TYPE_INDICES.keys())
+_LANE_BITS = 5
+_LANE_HIGH_BIT = 1 << (_LANE_BITS - 1)
+_TYPE_LIMITS = (
+    [3] * len(_PROFILE_TYPES) + [2] * len(_PROFILE_TYPES) + [1] * len(_PROFILE_TYPES)
+)
+
+
+def _pack_lanes(counts: list[int]) -> int:
+    return sum(count << (_LANE_BITS * i) for i, count in enumerate(counts))
+
+
+_TYPE_LIMITS_BIAS = _pack_lanes([_LANE_HIGH_BIT - 1 - limit for limit in _TYPE_LIMITS])
+_TYPE_LIMITS_MASK = _pack_lanes([_LANE_HIGH_BIT] * len(_TYPE_LIMITS))
+
+
+@lru_cache(maxsize=None)
+def _type_profile(types: tuple[str, ...]) -> int:
+    weak = [int(is_super_effective(t, types)) for t in _PROFILE_TYPES]
+    has_type = [0] * len(_PROFILE_TYPES)
+    for t in types[:2]:
+        has_type[_PROFILE_TYPES.index(t)] += 1
+    weak_4x = [int(type_effectiveness_modifier(t, types) == 4) for t in _PROFILE_TYPES]
+    return _pack_lanes(weak + has_type + weak_4x)
 
-    if any(x > 3 for x in num_pkmn_weak_to_typing.values()):
-        return True
 
-    return False
+def team_type_profile(team: list[Pokemon]) -> int:
+    return sum(_type_profile(tuple(pkmn.types)) for pkmn in team)
 
 
-def _more_than_2_pokemon_of_any_type(team: list[Pokemon]) -> bool:
-    num_of_each_type = {}
-    for pkmn in team:
-        num_of_each_type[pkmn.types[0]] = num_of_each_type.get(pkmn.types[0], 0) + 1
-        if len(pkmn.types) > 1:
-            num_of_each_type[pkmn.types[1]] = num_of_each_type.get(pkmn.types[1], 0) + 1
+def team_breaks_type_limits(team_profile: int) -> bool:
+    return bool((team_profile + _TYPE_LIMITS_BIAS) & _TYPE_LIMITS_MASK)
 
-    if any(x > 2 for x in num_of_each_type.values()):
-        return True
 
-    return False
+# Candidates drawn before the allowed ones are filtered out of all of them
+MAX_CANDIDATE_DRAWS = 10
 
+# (pkmn_sets the pool was built from, [(pkmn_name, pkmn_sets, type profile)])
+_candidate_pool = (None, [])
 
-def _more_than_1_pokemon_with_4x_weakness(team: list[Pokemon]) -> bool:
-    num_of_each_4x_weakness = {}
-    for pkmn in team:
-        for t in POKEMON_TYPE_INDICES.keys():
-            if type_effectiveness_modifier(t, pkmn.types) == 4:
-                num_of_each_4x_weakness[t] = num_of_each_4x_weakness.get(t, 0) + 1
 
-    if any(x > 1 for x in num_of_each_4x_weakness.values()):
-        return True
+def _randombattle_candidates() -> list[tuple[str, list, int]]:
+    """Every pokemon that can be sampled, built once per version of the datasets"""
+    global _candidate_pool
+    pkmn_sets, candidates = _candidate_pool
+    if pkmn_sets is RandomBattleTeamDatasets.pkmn_sets and len(candidates) == len(
+        pkmn_sets
+    ):
+        return candidates
 
-    return False
+    pkmn_sets = RandomBattleTeamDatasets.pkmn_sets
+    candidates = []
+    for pkmn_name, sets in pkmn_sets.items():
+        pkmn = Pokemon(pkmn_name, sets[0].pkmn_set.level)
+        candidates.append((pkmn_name, sets, team_type_profile([pkmn])))
+    _candidate_pool = (pkmn_sets, candidates)
+    return candidates
+
+
+def sample_randombattle_pokemon(existing_pokemon: list[Pokemon], rng=random) -> Pokemon:
+    """
+    Samples a pokemon that is not in `existing_pokemon` uniformly from the ones that
+    keep the team within the type limits, or from all of them if none do
+    """
+    existing_pokemon_names = {pkmn.name for pkmn in existing_pokemon}
+    team_profile = team_type_profile(existing_pokemon)
+    candidates = _randombattle_candidates()
+
+    # most pokemon are allowed, so a few draws are usually enough to find one
+    for _ in range(MAX_CANDIDATE_DRAWS):
+        candidate = rng.choice(candidates)
+        if candidate[0] not in existing_pokemon_names and not team_breaks_type_limits(
+            team_profile + candidate[2]
+        ):
+            break
+    else:
+        candidates = [c for c in candidates if c[0] not in existing_pokemon_names]
+        allowed = [
+            c for c in candidates if not team_breaks_type_limits(team_profile + c[2])
+        ]
+        candidate = rng.choice(allowed or candidates)
+
+    pkmn_name, pkmn_sets, _ = candidate
+    pkmn_full_set = rng.choice(pkmn_sets)
+    pkmn = Pokemon(pkmn_name, pkmn_full_set.pkmn_set.level)
+    populate_pkmn_from_set(pkmn, pkmn_full_set)
+    return pkmn
 
 
 # take a Battle and fill in the unrevealed pkmn for the opponent
-def populate_randombattle_unrevealed_pkmn(battle: Battle):
+def populate_randombattle_unrevealed_pkmn(battle: Battle, rng=random):
     num_revealed_pkmn = 0
     existing_pkmn = []
     for pkmn in battle.opponent.reserve:
@@ -164,7 +210,7 @@ def populate_randombattle_unrevealed_pkmn(battle: Battle):
 
     logger.info("Sampling {} unrevealed pokemon".format(6 - num_revealed_pkmn))
     while num_revealed_pkmn < 6:
-        pkmn = sample_randombattle_pokemon(existing_pkmn)
+        pkmn = sample_randombattle_pokemon(existing_pkmn, rng=rng)
         existing_pkmn.append(pkmn)
         battle.opponent.reserve.append(pkmn)
         num_revealed_pkmn += 1
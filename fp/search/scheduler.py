@@ -0,0 +1,159 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import CancelledError, Future
+from dataclasses import dataclass, field
+from typing import Optional
+
+from config import FoulPlayConfig
+from fp.battle import Battle
+
+from .worker_pool import SearchWorkerPool
+
+logger = logging.getLogger(__name__)
+
+
+# A search without a deadline is ordered as if it had this long left
+UNTIMED_SEARCH_SLACK_SECONDS = 10
+
+# A search of a turn with criticality 1 is ordered as if its deadline were this much sooner
+CRITICALITY_SECONDS = 5
+
+
+def turn_criticality(battle: Battle) -> float:
+    """
+    How much a decision is likely to matter, from 0 to 1.
+    Rises as pokemon faint on either side, since late game mistakes are rarely recovered from
+    """
+    pokemon = [battle.user.active] + battle.user.reserve
+    pokemon += [battle.opponent.active] + battle.opponent.reserve
+    pokemon = [p for p in pokemon if p is not None and p.name]
+    if not pokemon:
+        return 0
+    return sum(1 for p in pokemon if not p.is_alive()) / len(pokemon)
+
+
+@dataclass(order=True)
+class _Job:
+    priority: tuple
+    fn: object = field(compare=False)
+    args: tuple = field(compare=False)
+    future: Future = field(compare=False)
+    battle_tag: Optional[str] = field(compare=False)
+    submitted: float = field(compare=False)
+
+
+class _SearchScheduler:
+    """
+    Orders the searches of every battle this process is playing and feeds them to the
+    worker pool no more than `FoulPlayConfig.parallelism` at a time, so that concurrent
+    battles share the workers instead of each assuming it owns all of them.
+
+    Searches are started earliest deadline first, where a critical turn's deadline
+    counts as sooner. Background searches (pondering) only run when nothing else is waiting.
+    A search that is cancelled before it starts never reaches the pool
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = []
+        self._sequence = itertools.count()
+        self._in_flight = 0
+        self._max_pending = 0
+        self._num_started = 0
+        self._total_wait_seconds = 0
+
+    def submit(
+        self,
+        fn,
+        *args,
+        deadline: float = None,
+        criticality: float = 0,
+        background: bool = False,
+        battle_tag: str = None,
+    ) -> Future:
+        now = time.monotonic()
+        if deadline is None:
+            deadline = now + UNTIMED_SEARCH_SLACK_SECONDS
+        priority = (background, deadline - CRITICALITY_SECONDS * criticality)
+        job = _Job(
+            priority=priority + (next(self._sequence),),
+            fn=fn,
+            args=args,
+            future=Future(),
+            battle_tag=battle_tag,
+            submitted=now,
+        )
+        with self._lock:
+            heapq.heappush(self._pending, job)
+            self._max_pending = max(self._max_pending, len(self._pending))
+        self._dispatch()
+        return job.future
+
+    def _dispatch(self):
+        while True:
+            with self._lock:
+                if not self._pending or self._in_flight >= FoulPlayConfig.parallelism:
+                    return
+                job = heapq.heappop(self._pending)
+                if not job.future.set_running_or_notify_cancel():
+                    continue
+                self._in_flight += 1
+                self._num_started += 1
+                self._total_wait_seconds += time.monotonic() - job.submitted
+
+            try:
+                pool_future = SearchWorkerPool.submit(job.fn, *job.args)
+            except Exception as e:
+                with self._lock:
+                    self._in_flight -= 1
+                job.future.set_exception(e)
+                continue
+            pool_future.add_done_callback(lambda f, job=job: self._finished(job, f))
+
+    def _finished(self, job: _Job, pool_future: Future):
+        with self._lock:
+            self._in_flight -= 1
+        if pool_future.cancelled():
+            # `job.future` is already running so it can not be cancelled itself
+            job.future.set_exception(CancelledError())
+        elif pool_future.exception() is not None:
+            job.future.set_exception(pool_future.exception())
+        else:
+            job.future.set_result(pool_future.result())
+        self._dispatch()
+
+    def queue_depth(self, battle_tag: str = None) -> int:
+        """Searches waiting for a worker, of every battle or only of `battle_tag`"""
+        with self._lock:
+            return sum(
+                1
+                for job in self._pending
+                if not job.future.cancelled()
+                and (battle_tag is None or job.battle_tag == battle_tag)
+            )
+
+    def stats(self) -> dict:
+        with self._lock:
+            pending_by_battle = {}
+            for job in self._pending:
+                if not job.future.cancelled():
+                    pending_by_battle[job.battle_tag] = (
+                        pending_by_battle.get(job.battle_tag, 0) + 1
+                    )
+            mean_wait_ms = 0
+            if self._num_started:
+                mean_wait_ms = 1000 * self._total_wait_seconds / self._num_started
+            return {
+                "pending": sum(pending_by_battle.values()),
+                "in_flight": self._in_flight,
+                "max_pending": self._max_pending,
+                "started": self._num_started,
+                "mean_wait_ms": round(mean_wait_ms, 1),
+                "pending_by_battle": pending_by_battle,
+            }
+
+
+SearchScheduler = _SearchScheduler()
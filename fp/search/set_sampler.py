@@ -0,0 +1,97 @@
+import random
+import threading
+from bisect import bisect
+from collections import OrderedDict
+from itertools import accumulate
+from typing import Callable, Optional
+
+# How many battles' samplers are kept, e.g. for concurrent battles
+MAX_CACHED_BATTLES = 32
+
+
+class WeightedSampler:
+    """
+    Draws one of `items` with a chance proportional to its weight.
+    The cumulative weights are computed once so that each draw is a bisection
+    """
+
+    def __init__(self, items: list, weights: list[float]):
+        self.items = items
+        self.cum_weights = list(accumulate(weights))
+        self.total = self.cum_weights[-1] if self.cum_weights else 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def sample(self, rng=random):
+        # the same draw as `rng.choices(items, weights)[0]`,
+        # so a battle sampled with a given seed is the same as it was before
+        if self.total <= 0:
+            raise ValueError("Total of weights must be greater than zero")
+        return self.items[
+            bisect(self.cum_weights, rng.random() * self.total, 0, len(self.items) - 1)
+        ]
+
+
+class _SetSamplers:
+    """
+    The samplers of a battle's candidate sets for its current turn.
+
+    A sampler is looked up by the sets it was built from, whatever their order, so it
+    is rebuilt as soon as `get_all_remaining_sets` returns different sets for a pokemon
+    but not when the same sets were shuffled again. A sampler that is reused keeps the
+    order of the sets it was built from, which draws each set just as often.
+    The sampler holds on to its sets, so the ids identifying them can not be reused
+    while it is cached
+    """
+
+    def __init__(self):
+        self._battles = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(
+        self,
+        turn_key: Optional[tuple],
+        pkmn_name: str,
+        sets: list,
+        weight: Callable,
+    ) -> WeightedSampler:
+        """
+        The sampler of `sets` for `pkmn_name` in the battle and turn of `turn_key`.
+        Without a `turn_key` the sampler is not cached
+        """
+        if turn_key is None:
+            return WeightedSampler(sets, [weight(s) for s in sets])
+
+        battle_tag, turn = turn_key
+        key = (pkmn_name, frozenset(map(id, sets)))
+        with self._lock:
+            cached_turn, samplers = self._battles.get(battle_tag, (None, None))
+            if cached_turn != turn:
+                samplers = {}
+                self._battles[battle_tag] = (turn, samplers)
+            self._battles.move_to_end(battle_tag)
+            while len(self._battles) > MAX_CACHED_BATTLES:
+                self._battles.popitem(last=False)
+
+            sampler = samplers.get(key)
+            if sampler is not None:
+                self.hits += 1
+                return sampler
+            self.misses += 1
+
+        sampler = WeightedSampler(list(sets), [weight(s) for s in sets])
+        with self._lock:
+            samplers[key] = sampler
+        return sampler
+
+    def clear(self):
+        with self._lock:
+            self._battles.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+SetSamplers = _SetSamplers()
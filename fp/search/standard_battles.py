@@ -1,12 +1,17 @@
 import logging
 import random
+import threading
+import time
+from collections import OrderedDict
 from copy import deepcopy
+from typing import Iterator
 
 import constants
 from data import all_move_json
 from fp.search.helpers import (
     populate_pkmn_from_set,
 )
+from fp.search.set_sampler import SetSamplers, WeightedSampler
 from fp.helpers import natures
 from fp.battle import Pokemon, Battle, Battler
 from data.pkmn_sets import (
@@ -17,7 +22,6 @@ from data.pkmn_sets import (
     MOVES_STRING,
     TeamDatasets,
     RAW_COUNT,
-    TEAMMATES,
 )
 
 logger = logging.getLogger(__name__)
@@ -213,7 +217,9 @@ def get_filtered_sets(
     return filtered_sets
 
 
-def sample_pokemon_moveset_with_known_pkmn_set(pkmn: Pokemon, pkmn_set: PokemonSet):
+def sample_pokemon_moveset_with_known_pkmn_set(
+    pkmn: Pokemon, pkmn_set: PokemonSet, rng=random
+):
     pkmn_known_moves = [m.name for m in pkmn.moves]
     num_known_moves = len(pkmn_known_moves)
     if num_known_moves >= 4:
@@ -241,7 +247,7 @@ def sample_pokemon_moveset_with_known_pkmn_set(pkmn: Pokemon, pkmn_set: PokemonS
         remaining_team_movesets.append((pkmn_moveset, count))
 
     if remaining_team_movesets:
-        sampled_moveset, count = random.choices(
+        sampled_moveset, count = rng.choices(
             remaining_team_movesets, weights=[m[1] for m in remaining_team_movesets]
         )[0]
         for mv in sampled_moveset:
@@ -269,7 +275,7 @@ def sample_pokemon_moveset_with_known_pkmn_set(pkmn: Pokemon, pkmn_set: PokemonS
             break
         index = index % len(moves_adjusted_probabilities)
         mv, chance = moves_adjusted_probabilities[index]
-        if random.random() < chance:
+        if rng.random() < chance:
             pkmn_known_moves.append(mv)
             if not smogon_set_makes_sense(
                 PredictedPokemonSet(
@@ -303,21 +309,25 @@ def set_most_likely_hidden_power(pkmn: Pokemon):
                 break
 
 
-def sample_pokemon(pkmn: Pokemon):
+def sample_pokemon(pkmn: Pokemon, rng=random, turn_key: tuple = None):
+    """
+    `turn_key` is the (battle tag, turn) that `pkmn` is sampled for,
+    which lets the samplers of its candidate sets be reused for the rest of the turn
+    """
     if not pkmn.mega_name:
-        _sample_pokemon(pkmn)
+        _sample_pokemon(pkmn, rng=rng, turn_key=turn_key)
         return
 
     # the ability of a mega pokemon that has not yet mega-evolved
     # needs to be sampled from its non-mega version
-    pkmn_without_mega = deepcopy(pkmn)
+    pkmn_without_mega = pkmn.clone()
     pkmn_without_mega.mega_name = None
-    _sample_pokemon(pkmn_without_mega)
+    _sample_pokemon(pkmn_without_mega, rng=rng, turn_key=turn_key)
     pkmn.ability = pkmn_without_mega.ability
-    _sample_pokemon(pkmn)
+    _sample_pokemon(pkmn, rng=rng, turn_key=turn_key)
 
 
-def _sample_pokemon(pkmn: Pokemon):
+def _sample_pokemon(pkmn: Pokemon, rng=random, turn_key: tuple = None):
     set_most_likely_hidden_power(pkmn)
 
     # 1: TeamDatasets is not emptied and `get_all_remaining_sets` returned at least one set
@@ -326,8 +336,8 @@ def _sample_pokemon(pkmn: Pokemon):
     # Skip this step an amount of the time to get some variety
     # if at least 1 move is known
     remaining_team_sets = TeamDatasets.get_all_remaining_sets(pkmn)
-    if remaining_team_sets and (not pkmn.moves or random.random() < 0.75):
-        sampled_set = deepcopy(random.choice(remaining_team_sets))
+    if remaining_team_sets and (not pkmn.moves or rng.random() < 0.75):
+        sampled_set = deepcopy(rng.choice(remaining_team_sets))
         populate_pkmn_from_set(pkmn, sampled_set, source="teamdatasets-full")
         return
 
@@ -339,8 +349,8 @@ def _sample_pokemon(pkmn: Pokemon):
         if s.pkmn_set.set_makes_sense(pkmn) and smogon_set_makes_sense(s)
     ]
     if remaining_team_sets:
-        sampled_set = deepcopy(random.choice(remaining_team_sets).pkmn_set)
-        moves = sample_pokemon_moveset_with_known_pkmn_set(pkmn, sampled_set)
+        sampled_set = deepcopy(rng.choice(remaining_team_sets).pkmn_set)
+        moves = sample_pokemon_moveset_with_known_pkmn_set(pkmn, sampled_set, rng=rng)
         sampled_set = PredictedPokemonSet(
             pkmn_set=sampled_set,
             pkmn_moveset=PokemonMoveset(moves=moves),
@@ -353,13 +363,13 @@ def _sample_pokemon(pkmn: Pokemon):
     remaining_smogon_sets = SmogonSets.get_all_remaining_sets(pkmn)
     remaining_smogon_sets = get_filtered_sets(pkmn, remaining_smogon_sets)
     if remaining_smogon_sets:
-        sampled_smogon_set = deepcopy(
-            random.choices(
-                remaining_smogon_sets,
-                weights=[s.count for s in remaining_smogon_sets],
-            )[0]
+        sampler = SetSamplers.get(
+            turn_key, pkmn.name, remaining_smogon_sets, lambda s: s.count
+        )
+        sampled_smogon_set = deepcopy(sampler.sample(rng))
+        moves = sample_pokemon_moveset_with_known_pkmn_set(
+            pkmn, sampled_smogon_set, rng=rng
         )
-        moves = sample_pokemon_moveset_with_known_pkmn_set(pkmn, sampled_smogon_set)
         sampled_set = PredictedPokemonSet(
             pkmn_set=sampled_smogon_set,
             pkmn_moveset=PokemonMoveset(moves=moves),
@@ -370,56 +380,93 @@ def _sample_pokemon(pkmn: Pokemon):
     logger.warning(f"Could not sample {pkmn.name}")
 
 
-def predict_team_likelihood(revealed_pokemon, all_pkmn_counts):
+def teammate_likelihoods(
+    revealed_pokemon, teammate_rates: dict[str, dict[str, float]]
+) -> dict[str, float]:
+    """
+    The average rate at which each pokemon is a teammate of the revealed pokemon,
+    from the sparse rows of `SmogonSets.teammate_rates`, most likely first.
+    Only the pokemon that are a teammate of at least one revealed pokemon are scored,
+    every other pokemon's likelihood is 0
+    """
     revealed_set = set(revealed_pokemon)
-    likelihoods = {}
-
-    for pkmn in all_pkmn_counts.keys():
-        if pkmn in revealed_set:
-            continue
-
-        joint_probs = []
-        for revealed in revealed_set:
-            try:
-                co_count = all_pkmn_counts[revealed][TEAMMATES][pkmn]
-            except KeyError:
-                co_count = 0
-
-            prob = co_count / all_pkmn_counts[revealed][RAW_COUNT]
-            joint_probs.append(prob)
-
-        likelihoods[pkmn] = sum(joint_probs) / len(joint_probs)
-
-    sorted_likelihoods = dict(
-        sorted(likelihoods.items(), key=lambda x: x[1], reverse=True)
-    )
-
-    return sorted_likelihoods
+    rows = [teammate_rates.get(revealed, {}) for revealed in revealed_set]
+    candidates = {pkmn for row in rows for pkmn in row} - revealed_set
 
-
-def sample_standardbattle_pokemon(existing_pokemon: list[Pokemon]) -> Pokemon:
-    existing_pokemon_names = {pkmn.name for pkmn in existing_pokemon}
-    selected_pkmn_name = ""
-    ok = False
-    while not ok:
-        ok = True
-        sample_weights = predict_team_likelihood(
-            existing_pokemon_names,
-            SmogonSets.all_pkmn_counts,
-        )
-        keys = list(sample_weights.keys())[:50]
-        values = list(sample_weights.values())[:50]
-        selected_pkmn_name = random.choices(keys, weights=values)[0]
-        if selected_pkmn_name in existing_pokemon_names:
-            ok = False
-
-    pkmn = Pokemon(selected_pkmn_name, 100)
-    sample_pokemon(pkmn)
+    order = {pkmn: i for i, pkmn in enumerate(teammate_rates)}
+    likelihoods = [
+        (pkmn, sum(row.get(pkmn, 0) for row in rows) / len(rows)) for pkmn in candidates
+    ]
+    # ties keep the order of `all_pkmn_counts`
+    likelihoods.sort(key=lambda x: (-x[1], order[x[0]]))
+    return dict(likelihoods)
+
+
+# The number of most likely teammates an unrevealed pokemon is sampled from
+TEAMMATE_CANDIDATES = 50
+
+# How many sets of revealed pokemon have their teammate sampler kept
+MAX_TEAMMATE_SAMPLERS = 1024
+
+
+class _TeammateSamplers:
+    """
+    The sampler of an unrevealed pokemon for each set of revealed pokemon,
+    kept until `SmogonSets` is initialized with different stats
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._teammate_rates = None
+        self._samplers = OrderedDict()
+
+    def get(self, revealed_pokemon) -> WeightedSampler:
+        key = frozenset(revealed_pokemon)
+        with self._lock:
+            if self._teammate_rates is not SmogonSets.teammate_rates:
+                self._teammate_rates = SmogonSets.teammate_rates
+                self._samplers.clear()
+            teammate_rates = self._teammate_rates
+            sampler = self._samplers.get(key)
+            if sampler is not None:
+                self._samplers.move_to_end(key)
+                return sampler
+
+        likelihoods = teammate_likelihoods(key, teammate_rates)
+        top = list(likelihoods.items())[:TEAMMATE_CANDIDATES]
+        sampler = WeightedSampler([t[0] for t in top], [t[1] for t in top])
+        if sampler.total <= 0:
+            # none of the revealed pokemon has teammate stats to go by,
+            # so the most used pokemon are sampled instead
+            counts = SmogonSets.all_pkmn_counts
+            top = sorted(
+                (p for p in counts if p not in key),
+                key=lambda p: counts[p][RAW_COUNT],
+                reverse=True,
+            )[:TEAMMATE_CANDIDATES]
+            sampler = WeightedSampler(top, [counts[p][RAW_COUNT] for p in top])
+        with self._lock:
+            if self._teammate_rates is teammate_rates:
+                self._samplers[key] = sampler
+                while len(self._samplers) > MAX_TEAMMATE_SAMPLERS:
+                    self._samplers.popitem(last=False)
+        return sampler
+
+
+TeammateSamplers = _TeammateSamplers()
+
+
+def sample_standardbattle_pokemon(
+    existing_pokemon: list[Pokemon], rng=random
+) -> Pokemon:
+    sampler = TeammateSamplers.get({pkmn.name for pkmn in existing_pokemon})
+    pkmn = Pokemon(sampler.sample(rng), 100)
+    sample_pokemon(pkmn, rng=rng)
     return pkmn
 
 
 # take a Battle and fill in the unrevealed pkmn for the opponent
-def populate_standardbattle_unrevealed_pkmn(battle: Battle):
+def populate_standardbattle_unrevealed_pkmn(battle: Battle, rng=random):
     num_revealed_pkmn = 0
     existing_pkmn = []
     for pkmn in battle.opponent.reserve:
@@ -434,13 +481,13 @@ def populate_standardbattle_unrevealed_pkmn(battle: Battle):
 
     logger.info("Sampling {} unrevealed pokemon".format(6 - num_revealed_pkmn))
     while num_revealed_pkmn < 6:
-        pkmn = sample_standardbattle_pokemon(existing_pkmn)
+        pkmn = sample_standardbattle_pokemon(existing_pkmn, rng=rng)
         existing_pkmn.append(pkmn)
         battle.opponent.reserve.append(pkmn)
         num_revealed_pkmn += 1
 
 
-def sample_mega_evolution(battler: Battler, index: int):
+def sample_mega_evolution(battler: Battler, index: int, rng=random):
     if battler.mega_revealed():
         logger.info("Mega evolution already revealed for {}".format(battler.name))
         return
@@ -448,8 +495,8 @@ def sample_mega_evolution(battler: Battler, index: int):
     if not mega_formes:
         logger.info("No possible mega evolutions for {}".format(battler.name))
         return
-    selected_mega = random.choice(list(mega_formes.keys()))
-    mega_pkmn_name, mega_item = random.choice(mega_formes[selected_mega])
+    selected_mega = rng.choice(list(mega_formes.keys()))
+    mega_pkmn_name, mega_item = rng.choice(mega_formes[selected_mega])
 
     if battler.active.name == selected_mega:
         pkmn = battler.active
@@ -465,21 +512,36 @@ def sample_mega_evolution(battler: Battler, index: int):
     pkmn.mega_name = mega_pkmn_name
 
 
-def prepare_battles(battle: Battle, num_battles: int) -> list[(Battle, float)]:
-    sampled_battles = []
+def iter_battles(
+    battle: Battle, num_battles: int, deadline: float = None, rng=random
+) -> Iterator[tuple[Battle, float]]:
+    """
+    Samples the battles one at a time so that each can be searched as soon as it exists.
+
+    `rng` is the decision's source of randomness. Every sampled battle draws its own
+    generator from it so that a battle sampled with a given seed does not depend
+    on how many battles were sampled before it
+    """
     for index in range(num_battles):
+        if deadline is not None and index > 0 and time.monotonic() > deadline:
+            logger.warning(
+                "Sampling deadline reached after {} of {} battles".format(
+                    index, num_battles
+                )
+            )
+            break
         logger.info("Sampling battle {}".format(index))
-        battle_copy = deepcopy(battle)
+        battle_rng = random.Random(rng.getrandbits(64))
+        battle_copy = battle.clone()
         if battle_copy.mega_evolve_possible():
-            sample_mega_evolution(battle_copy.opponent, index)
+            sample_mega_evolution(battle_copy.opponent, index, rng=battle_rng)
 
-        sample_pokemon(battle_copy.opponent.active)
+        turn_key = (battle.battle_tag, battle.turn)
+        sample_pokemon(battle_copy.opponent.active, rng=battle_rng, turn_key=turn_key)
         for pkmn in filter(lambda x: x.is_alive(), battle_copy.opponent.reserve):
-            sample_pokemon(pkmn)
+            sample_pokemon(pkmn, rng=battle_rng, turn_key=turn_key)
 
         if battle.generation in constants.NO_TEAM_PREVIEW_GENS:
-            populate_standardbattle_unrevealed_pkmn(battle_copy)
+            populate_standardbattle_unrevealed_pkmn(battle_copy, rng=battle_rng)
         battle_copy.opponent.lock_moves()
-        sampled_battles.append((battle_copy, 1 / num_battles))
-
-    return sampled_battles
+        yield battle_copy, 1 / num_battles
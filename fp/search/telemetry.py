@@ -0,0 +1,155 @@
+import json
+import logging
+import math
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from typing import Callable, Optional
+
+from config import FoulPlayConfig
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class WorldTelemetry:
+    index: int
+    sample_chance: float
+    search_time_ms: int
+    engine_ms: float
+    iterations: int
+    iterations_per_second: float
+    cached: bool
+
+
+@dataclass
+class SearchTelemetry:
+    """
+    What one decision's search spent its time on.
+
+    `phases_ms` has the wall time of sampling, state conversion, search and aggregation.
+    `ipc` is the part of the search wall time that is not explained by the engine time
+    reported by the workers, i.e. pickling, scheduling and waiting for a free worker.
+    `queue_depth` is how many searches of other battles were waiting when the search started.
+    `search_depth` is the shallowest depth an expectiminimax search completed
+    """
+
+    battle_tag: str = None
+    turn: int = None
+    timestamp: float = field(default_factory=time.time)
+    parallelism: int = None
+    deadline_ms: Optional[float] = None
+    num_sampled: int = 0
+    num_worlds: int = 0
+    num_searched: int = 0
+    queue_depth: int = 0
+    backend: str = "mcts"
+    search_depth: Optional[int] = None
+    phases_ms: dict[str, float] = field(default_factory=dict)
+    worlds: list[WorldTelemetry] = field(default_factory=list)
+    policy_entropy: Optional[float] = None
+    choice: Optional[str] = None
+
+    @classmethod
+    def for_battle(cls, battle) -> "SearchTelemetry":
+        return cls(
+            battle_tag=battle.battle_tag,
+            turn=battle.turn,
+            parallelism=FoulPlayConfig.parallelism,
+        )
+
+    @contextmanager
+    def phase(self, name: str, exclude: list[str] = ()):
+        """Times `name`, leaving out the time of the `exclude` phases timed within it"""
+        started = time.perf_counter()
+        excluded_ms = sum(self.phases_ms.get(p, 0) for p in exclude)
+        try:
+            yield
+        finally:
+            elapsed_ms = 1000 * (time.perf_counter() - started)
+            elapsed_ms -= sum(self.phases_ms.get(p, 0) for p in exclude) - excluded_ms
+            self.phases_ms[name] = self.phases_ms.get(name, 0) + elapsed_ms
+
+    def add_world(
+        self, mcts_result, sample_chance: float, index, search_time_ms: int, cached
+    ):
+        if mcts_result.search_ms > 0:
+            iterations_per_second = mcts_result.total_visits / (
+                mcts_result.search_ms / 1000
+            )
+        else:
+            iterations_per_second = 0
+        self.worlds.append(
+            WorldTelemetry(
+                index=index,
+                sample_chance=sample_chance,
+                search_time_ms=search_time_ms,
+                engine_ms=round(mcts_result.search_ms, 3),
+                iterations=mcts_result.total_visits,
+                iterations_per_second=round(iterations_per_second, 1),
+                cached=cached,
+            )
+        )
+
+    def estimate_ipc(self):
+        searched = [w for w in self.worlds if not w.cached]
+        if "search" not in self.phases_ms or not searched:
+            return
+        workers = max(1, min(self.parallelism or 1, len(searched)))
+        engine_wall_ms = sum(w.engine_ms for w in searched) / workers
+        self.phases_ms["ipc"] = max(0, self.phases_ms["search"] - engine_wall_ms)
+
+
+def policy_entropy(policy: dict[str, float]) -> float:
+    """Entropy in bits of `policy` after normalizing it"""
+    total = sum(policy.values())
+    if total <= 0:
+        return 0
+    return -sum((p / total) * math.log2(p / total) for p in policy.values() if p > 0)
+
+
+class _TelemetrySink:
+    """
+    Receives a `SearchTelemetry` record after every decision,
+    writes it as a line of JSON to `FoulPlayConfig.search_telemetry_file` if set,
+    and passes it to every registered callback
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._callbacks = []
+
+    def add_callback(self, callback: Callable[[SearchTelemetry], None]):
+        self._callbacks.append(callback)
+
+    def remove_callback(self, callback: Callable[[SearchTelemetry], None]):
+        self._callbacks.remove(callback)
+
+    def emit(self, telemetry: SearchTelemetry):
+        telemetry.estimate_ipc()
+        logger.info(
+            "Search telemetry: {} worlds, {} searched, {}".format(
+                telemetry.num_worlds,
+                telemetry.num_searched,
+                ", ".join(
+                    "{}={}ms".format(phase, round(ms, 1))
+                    for phase, ms in telemetry.phases_ms.items()
+                ),
+            )
+        )
+
+        if FoulPlayConfig.search_telemetry_file is not None:
+            line = json.dumps(asdict(telemetry))
+            with self._lock:
+                with open(FoulPlayConfig.search_telemetry_file, "a") as f:
+                    f.write(line + "\n")
+
+        for callback in list(self._callbacks):
+            try:
+                callback(telemetry)
+            except Exception:
+                logger.exception("Search telemetry callback failed")
+
+
+TelemetrySink = _TelemetrySink()
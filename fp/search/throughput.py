@@ -0,0 +1,180 @@
+import logging
+import statistics
+import threading
+from concurrent.futures import TimeoutError
+
+from config import FoulPlayConfig
+from fp.battle import Battle, Pokemon
+
+from .worker_pool import SearchWorkerPool
+
+logger = logging.getLogger(__name__)
+
+
+# How long each reference state is searched for when calibrating
+CALIBRATION_SEARCH_TIME_MS = 200
+CALIBRATION_TIMEOUT_SECONDS = 30
+
+# Weight of the latest search in the live throughput's moving average
+LIVE_THROUGHPUT_SMOOTHING = 0.2
+
+# Live throughput is trusted over the calibration after this many searches
+LIVE_OBSERVATIONS_TO_TRUST = 20
+
+MIN_ITERATION_BUDGET_MS = 10
+MAX_ITERATION_BUDGET_MS = 30000
+
+
+# (name, level, ability, item, tera type, moves)
+# fmt: off
+REFERENCE_TEAMS = [
+    (
+        [("garchomp", 77, "roughskin", "lifeorb", "steel", ["earthquake", "outrage", "swordsdance", "stoneedge"])],
+        [("dragapult", 76, "infiltrator", "choicespecs", "ghost", ["shadowball", "dracometeor", "flamethrower", "uturn"])],
+    ),
+    (
+        [
+            ("greattusk", 78, "protosynthesis", "boosterenergy", "ground", ["headlongrush", "closecombat", "icespinner", "rapidspin"]),
+            ("corviknight", 79, "pressure", "leftovers", "dragon", ["bravebird", "roost", "uturn", "defog"]),
+            ("gholdengo", 77, "goodasgold", "choicescarf", "steel", ["makeitrain", "shadowball", "trick", "focusblast"]),
+        ],
+        [
+            ("kingambit", 76, "supremeoverlord", "blackglasses", "dark", ["kowtowcleave", "suckerpunch", "ironhead", "swordsdance"]),
+            ("toxapex", 85, "regenerator", "blacksludge", "fairy", ["surf", "toxic", "recover", "haze"]),
+            ("dragonite", 74, "multiscale", "heavydutyboots", "normal", ["extremespeed", "earthquake", "dragondance", "roost"]),
+        ],
+    ),
+]
+# fmt: on
+
+
+def _reference_pokemon(name, level, ability, item, tera_type, moves) -> Pokemon:
+    pkmn = Pokemon(name, level)
+    pkmn.ability = ability
+    pkmn.item = item
+    pkmn.tera_type = tera_type
+    for mv in moves:
+        pkmn.add_move(mv)
+    return pkmn
+
+
+def reference_battles() -> list[Battle]:
+    battles = []
+    for user_team, opponent_team in REFERENCE_TEAMS:
+        battle = Battle("calibration")
+        battle.turn = 1
+        for battler, team in [
+            (battle.user, user_team),
+            (battle.opponent, opponent_team),
+        ]:
+            team = [_reference_pokemon(*p) for p in team]
+            battler.active = team[0]
+            battler.reserve = team[1:]
+        battles.append(battle)
+    return battles
+
+
+class _SearchThroughput:
+    """
+    MCTS iterations per second per worker, measured by a calibration at startup
+    and by every search since, used to turn an iteration target into a time budget
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calibrated = None
+        self.live = None
+        self.num_observed = 0
+
+    def observe(self, iterations: int, search_ms: float):
+        if search_ms <= 0 or iterations <= 0:
+            return
+        iterations_per_second = iterations / (search_ms / 1000)
+        with self._lock:
+            if self.live is None:
+                self.live = iterations_per_second
+            else:
+                self.live += LIVE_THROUGHPUT_SMOOTHING * (
+                    iterations_per_second - self.live
+                )
+            self.num_observed += 1
+
+    def iterations_per_second(self):
+        """
+        A blend of the calibrated and the live throughput that leans on the live one
+        as more searches are observed, or None if neither has been measured
+        """
+        if self.live is None:
+            return self.calibrated
+        if self.calibrated is None:
+            return self.live
+        live_weight = min(1, self.num_observed / LIVE_OBSERVATIONS_TO_TRUST)
+        return live_weight * self.live + (1 - live_weight) * self.calibrated
+
+    def time_budget_ms(self, iterations: int):
+        """
+        Returns how many milliseconds a search needs to reach `iterations`,
+        or None if the throughput is not known
+        """
+        iterations_per_second = self.iterations_per_second()
+        if not iterations_per_second:
+            return None
+        budget_ms = int(1000 * iterations / iterations_per_second)
+        return max(MIN_ITERATION_BUDGET_MS, min(MAX_ITERATION_BUDGET_MS, budget_ms))
+
+    def calibrate(self):
+        """
+        Searches the reference battles on every worker of the pool at once,
+        so that the measurement includes the slowdown of running in parallel
+        """
+        from .main import get_result_from_mcts
+        from .poke_engine_helpers import battle_to_poke_engine_state
+
+        states = [
+            battle_to_poke_engine_state(b).to_string() for b in reference_battles()
+        ]
+        futures = [
+            SearchWorkerPool.submit(
+                get_result_from_mcts,
+                states[i % len(states)],
+                CALIBRATION_SEARCH_TIME_MS,
+                i,
+            )
+            for i in range(max(len(states), FoulPlayConfig.parallelism))
+        ]
+
+        measured = []
+        for fut in futures:
+            try:
+                result = fut.result(timeout=CALIBRATION_TIMEOUT_SECONDS)
+            except TimeoutError:
+                continue
+            if result.search_ms > 0:
+                measured.append(result.total_visits / (result.search_ms / 1000))
+
+        if not measured:
+            logger.warning("Search throughput calibration did not finish")
+            return None
+
+        self.calibrated = statistics.median(measured)
+        logger.info(
+            "Calibrated search throughput: {} iterations/second per worker".format(
+                int(self.calibrated)
+            )
+        )
+        return self.calibrated
+
+
+SearchThroughput = _SearchThroughput()
+
+
+def base_search_time_ms() -> int:
+    """
+    The search time of one battle before it is adjusted to the situation.
+    `--search-time-ms`, or the time to reach `--search-iterations` if it is set
+    """
+    if FoulPlayConfig.search_iterations is not None:
+        budget_ms = SearchThroughput.time_budget_ms(FoulPlayConfig.search_iterations)
+        if budget_ms is not None:
+            return budget_ms
+    return FoulPlayConfig.search_time_ms
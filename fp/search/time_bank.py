@@ -0,0 +1,128 @@
+import logging
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+# Pokemon Showdown's timer adds time to the bank at the start of every turn
+# This is the starting guess until an increment has been observed
+DEFAULT_TURN_INCREMENT_SECONDS = 10
+
+# Time kept in reserve every turn for network latency and the event loop
+SAFETY_MARGIN_SECONDS = 5
+
+# A battle is expected to last this many more turns for each pkmn still alive
+TURNS_PER_ALIVE_PKMN = 1.5
+MIN_EXPECTED_REMAINING_TURNS = 2
+
+MIN_TURN_BUDGET_MS = 50
+
+
+class TimeBank:
+    """
+    Keeps track of the battle timer as reported by `|inactive|` messages
+    and plans how much wall-clock time each decision is allowed to use
+    """
+
+    def __init__(self):
+        self.turn_seconds_left = None
+        self.total_seconds_left = None
+        self.observed_at = None
+        self.seconds_spent_since_observed = 0
+        self.turn_increment_seconds = DEFAULT_TURN_INCREMENT_SECONDS
+
+    def observe(self, turn_seconds_left, total_seconds_left=None, now=None):
+        now = time.monotonic() if now is None else now
+        if total_seconds_left is not None and self.total_seconds_left is not None:
+            # whatever was added to the bank since the last observation
+            # that was not spent by us is the per-turn increment
+            increment = total_seconds_left - (
+                self.total_seconds_left - self.seconds_spent_since_observed
+            )
+            if increment >= 0:
+                self.turn_increment_seconds = (
+                    0.5 * self.turn_increment_seconds + 0.5 * increment
+                )
+
+        self.turn_seconds_left = turn_seconds_left
+        self.total_seconds_left = total_seconds_left
+        self.observed_at = now
+        self.seconds_spent_since_observed = 0
+
+    def record_spent(self, seconds):
+        self.seconds_spent_since_observed += seconds
+
+    def reset(self):
+        self.turn_seconds_left = None
+        self.total_seconds_left = None
+        self.observed_at = None
+        self.seconds_spent_since_observed = 0
+
+    def seconds_left(self, now=None) -> Optional[tuple[float, float]]:
+        """
+        Returns the (this turn, total) seconds left right now, or None if the timer is not running
+        """
+        if self.turn_seconds_left is None:
+            return None
+        now = time.monotonic() if now is None else now
+        elapsed = now - self.observed_at
+        turn_left = self.turn_seconds_left - elapsed
+        if self.total_seconds_left is None:
+            total_left = turn_left
+        else:
+            total_left = self.total_seconds_left - elapsed
+        return turn_left, total_left
+
+    def plan_turn_budget_ms(self, battle, now=None) -> Optional[int]:
+        seconds_left = self.seconds_left(now=now)
+        if seconds_left is None:
+            return None
+        turn_left, total_left = seconds_left
+
+        remaining_turns = expected_remaining_turns(battle)
+        spendable = (
+            total_left
+            - SAFETY_MARGIN_SECONDS
+            + self.turn_increment_seconds * (remaining_turns - 1)
+        )
+        budget_seconds = min(
+            spendable / remaining_turns, turn_left - SAFETY_MARGIN_SECONDS
+        )
+        budget_ms = max(MIN_TURN_BUDGET_MS, int(budget_seconds * 1000))
+        logger.info(
+            "Time bank: {}s this turn, {}s total, ~{} turns left, +{}s/turn -> {}ms budget".format(
+                round(turn_left, 1),
+                round(total_left, 1),
+                round(remaining_turns, 1),
+                round(self.turn_increment_seconds, 1),
+                budget_ms,
+            )
+        )
+        return budget_ms
+
+    def deadline(self, battle, now=None) -> Optional[float]:
+        """
+        Returns a `time.monotonic()` deadline for the current decision, or None if the timer is not running
+        """
+        now = time.monotonic() if now is None else now
+        budget_ms = self.plan_turn_budget_ms(battle, now=now)
+        if budget_ms is None:
+            return None
+        return now + budget_ms / 1000
+
+
+def expected_remaining_turns(battle) -> float:
+    user_alive = sum(
+        p.is_alive() for p in battle.user.reserve + [battle.user.active] if p
+    )
+    opponent_revealed = [
+        p for p in battle.opponent.reserve + [battle.opponent.active] if p
+    ]
+    opponent_alive = sum(p.is_alive() for p in opponent_revealed) + max(
+        0, 6 - len(opponent_revealed)
+    )
+    return max(
+        MIN_EXPECTED_REMAINING_TURNS,
+        TURNS_PER_ALIVE_PKMN * (user_alive + opponent_alive),
+    )
@@ -0,0 +1,199 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Optional
+
+from config import FoulPlayConfig
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class MctsMoveSummary:
+    move_choice: str
+    total_score: float
+    visits: int
+
+
+@dataclass
+class MctsSummary:
+    """
+    A picklable copy of a `poke_engine.MctsResult`
+    Two summaries of the same state can be merged as if they were one longer search
+    """
+
+    side_one: list[MctsMoveSummary]
+    side_two: list[MctsMoveSummary]
+    total_visits: int
+    # wall time spent in the engine by the worker that searched it
+    search_ms: float = 0
+
+    @classmethod
+    def from_mcts_result(cls, mcts_result, search_ms: float = 0) -> MctsSummary:
+        return cls(
+            side_one=[
+                MctsMoveSummary(o.move_choice, o.total_score, o.visits)
+                for o in mcts_result.side_one
+            ],
+            side_two=[
+                MctsMoveSummary(o.move_choice, o.total_score, o.visits)
+                for o in mcts_result.side_two
+            ],
+            total_visits=mcts_result.total_visits,
+            search_ms=search_ms,
+        )
+
+    @classmethod
+    def from_dict(cls, summary: dict) -> MctsSummary:
+        return cls(
+            side_one=[MctsMoveSummary(**o) for o in summary["side_one"]],
+            side_two=[MctsMoveSummary(**o) for o in summary["side_two"]],
+            total_visits=summary["total_visits"],
+            search_ms=summary["search_ms"],
+        )
+
+    @staticmethod
+    def _merge_side(
+        side: list[MctsMoveSummary], other_side: list[MctsMoveSummary]
+    ) -> list[MctsMoveSummary]:
+        merged = {
+            o.move_choice: MctsMoveSummary(o.move_choice, o.total_score, o.visits)
+            for o in side
+        }
+        for o in other_side:
+            if o.move_choice in merged:
+                merged[o.move_choice].total_score += o.total_score
+                merged[o.move_choice].visits += o.visits
+            else:
+                merged[o.move_choice] = MctsMoveSummary(
+                    o.move_choice, o.total_score, o.visits
+                )
+        return list(merged.values())
+
+    def merge(self, other: MctsSummary) -> MctsSummary:
+        return MctsSummary(
+            side_one=self._merge_side(self.side_one, other.side_one),
+            side_two=self._merge_side(self.side_two, other.side_two),
+            total_visits=self.total_visits + other.total_visits,
+            search_ms=self.search_ms + other.search_ms,
+        )
+
+
+def state_key(state: str) -> bytes:
+    return hashlib.blake2b(state.encode(), digest_size=16).digest()
+
+
+class _TranspositionTable:
+    """
+    A bounded LRU cache from a poke-engine state string to the summary of
+    the searches that have been done on it, and how long they searched for
+
+    A lookup for a search that is not longer than what has been cached is a hit.
+    A lookup for a longer search is a partial hit: only the difference needs searching
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.partial_hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def lookup(
+        self, state: str, search_time_ms: int
+    ) -> tuple[Optional[MctsSummary], int]:
+        """
+        Returns the cached summary for `state` (or None),
+        and how many milliseconds are left to search to reach `search_time_ms`
+        """
+        if FoulPlayConfig.search_cache_size <= 0:
+            return None, search_time_ms
+
+        key = state_key(state)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None, search_time_ms
+
+            self._entries.move_to_end(key)
+            cached_search_time_ms, summary = entry
+            if cached_search_time_ms >= search_time_ms:
+                self.hits += 1
+                return summary, 0
+            self.partial_hits += 1
+            return summary, search_time_ms - cached_search_time_ms
+
+    def store(self, state: str, search_time_ms: int, summary: MctsSummary):
+        if FoulPlayConfig.search_cache_size <= 0:
+            return
+
+        key = state_key(state)
+        with self._lock:
+            self._entries[key] = (search_time_ms, summary)
+            self._entries.move_to_end(key)
+            while len(self._entries) > FoulPlayConfig.search_cache_size:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.partial_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "partial_hits": self.partial_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.partial_hits) / lookups if lookups else 0,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.partial_hits = 0
+            self.misses = 0
+
+    def load(self, path: str):
+        if not os.path.exists(path):
+            return
+        # the file is plain data, loading it can not run code
+        try:
+            with open(path) as f:
+                entries = OrderedDict(
+                    (bytes.fromhex(key), (search_time_ms, MctsSummary.from_dict(s)))
+                    for key, search_time_ms, s in json.load(f)
+                )
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning("Could not load search cache from {}: {}".format(path, e))
+            return
+
+        with self._lock:
+            self._entries = entries
+            while len(self._entries) > FoulPlayConfig.search_cache_size:
+                self._entries.popitem(last=False)
+        logger.info(
+            "Loaded {} search cache entries from {}".format(len(self._entries), path)
+        )
+
+    def save(self, path: str):
+        with self._lock:
+            entries = [
+                [key.hex(), search_time_ms, asdict(summary)]
+                for key, (search_time_ms, summary) in self._entries.items()
+            ]
+        tmp_path = "{}.tmp".format(path)
+        with open(tmp_path, "w") as f:
+            json.dump(entries, f)
+        os.replace(tmp_path, path)
+        logger.info("Saved {} search cache entries to {}".format(len(entries), path))
+
+
+TranspositionTable = _TranspositionTable()
@@ -0,0 +1,79 @@
+import math
+
+from constants import BattleType
+from data.pkmn_sets import RandomBattleTeamDatasets, SmogonSets, TeamDatasets
+from fp.battle import Battle, Pokemon
+
+from .aggregation import visit_fractions
+
+
+# What an unrevealed pokemon adds to the uncertainty. log2 of the number of pokemon
+# it could be (about 9 bits in gen9 random battles) would keep the number of sampled
+# battles at its maximum until the whole team is revealed, while a pokemon in the back
+# matters less to the next turns than the ones already seen: it is counted as a little
+# more than the sets of a freshly revealed pokemon (about 2.6 bits)
+UNREVEALED_POKEMON_BITS = 3
+
+TEAM_SIZE = 6
+
+
+def entropy(weights: list[float]) -> float:
+    """Entropy in bits of `weights` after normalizing them"""
+    total = sum(weights)
+    if total <= 0:
+        return 0
+    return -sum(w / total * math.log2(w / total) for w in weights if w > 0)
+
+
+def remaining_sets_entropy(battle: Battle, pkmn: Pokemon) -> float:
+    """How uncertain the set of one of the opponent's revealed pokemon still is"""
+    if battle.battle_type == BattleType.RANDOM_BATTLE:
+        sets = RandomBattleTeamDatasets.get_all_remaining_sets(pkmn)
+        return entropy([s.pkmn_set.count for s in sets])
+    elif battle.battle_type == BattleType.BATTLE_FACTORY:
+        sets = TeamDatasets.get_all_remaining_sets(pkmn)
+        return entropy([s.pkmn_set.count for s in sets])
+
+    # team datasets are sampled uniformly, see `standard_battles._sample_pokemon`
+    team_sets = TeamDatasets.get_all_remaining_sets(pkmn)
+    if team_sets:
+        return math.log2(len(team_sets))
+    return entropy([s.count for s in SmogonSets.get_all_remaining_sets(pkmn)])
+
+
+def opponent_uncertainty_bits(battle: Battle) -> float:
+    """
+    The entropy of the opponent's remaining sets summed over their alive pokemon,
+    plus a fixed amount for every pokemon that has not been revealed
+    """
+    revealed = [battle.opponent.active] + battle.opponent.reserve
+    revealed = [p for p in revealed if p is not None]
+    bits = sum(remaining_sets_entropy(battle, p) for p in revealed if p.is_alive())
+    return bits + UNREVEALED_POKEMON_BITS * max(0, TEAM_SIZE - len(revealed))
+
+
+def policy_spread(mcts_results) -> float:
+    """
+    How much the searched worlds disagree on what to do: the chance-weighted mean
+    total variation distance between each world's visit policy and their average.
+    0 when every world's search visited the moves the same way, at most 1
+    """
+    worlds = [
+        (chance, visit_fractions(mcts_result))
+        for mcts_result, chance, _ in mcts_results
+        if mcts_result.total_visits > 0
+    ]
+    total_chance = sum(chance for chance, _ in worlds)
+    if total_chance <= 0:
+        return 0
+
+    average = {}
+    for chance, fractions in worlds:
+        for move, fraction in fractions.items():
+            average[move] = average.get(move, 0) + chance / total_chance * fraction
+
+    spread = 0
+    for chance, fractions in worlds:
+        distance = sum(abs(fractions.get(move, 0) - f) for move, f in average.items())
+        spread += chance / total_chance * distance / 2
+    return spread
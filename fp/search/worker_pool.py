@@ -0,0 +1,120 @@
+import atexit
+import logging
+import multiprocessing
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from config import FoulPlayConfig
+
+from .cpus import pin_current_process, worker_cpus
+
+logger = logging.getLogger(__name__)
+
+
+def _initialize_worker(cpu_queue=None):
+    if cpu_queue is not None:
+        # each worker takes the next CPU so that no two share one
+        try:
+            pin_current_process([cpu_queue.get_nowait()])
+        except queue.Empty:
+            pass
+
+    # pay for the `poke_engine` import and the module-level `data` JSON parsing
+    # once when the worker starts instead of on the first search it runs
+    import data  # noqa: F401
+    import fp.search.main  # noqa: F401
+
+
+def _ping():
+    return True
+
+
+class _SearchWorkerPool:
+    """
+    A long-lived process pool used for searching.
+
+    The pool is started the first time it is needed and is re-used for every
+    decision of every battle until the process exits. If a worker dies the pool
+    is marked as broken by `concurrent.futures` and is respawned on next use.
+    """
+
+    def __init__(self):
+        self._executor = None
+        self._max_workers = None
+        self._lock = threading.Lock()
+        self._atexit_registered = False
+
+    def _start(self, max_workers):
+        logger.info("Starting search worker pool with {} workers".format(max_workers))
+        initargs = ()
+        if FoulPlayConfig.search_pin_workers:
+            cpus = worker_cpus(max_workers, FoulPlayConfig.search_reserved_cpus)
+            logger.info("Pinning search workers to CPUs {}".format(cpus))
+            cpu_queue = multiprocessing.Queue()
+            for cpu in cpus:
+                cpu_queue.put(cpu)
+            initargs = (cpu_queue,)
+        self._executor = ProcessPoolExecutor(
+            max_workers=max_workers, initializer=_initialize_worker, initargs=initargs
+        )
+        self._max_workers = max_workers
+        if not self._atexit_registered:
+            atexit.register(self.shutdown)
+            self._atexit_registered = True
+
+    def _stop(self, wait):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+        self._executor = None
+        self._max_workers = None
+
+    def get_executor(self) -> ProcessPoolExecutor:
+        max_workers = FoulPlayConfig.parallelism
+        with self._lock:
+            if self._executor is not None and self._max_workers != max_workers:
+                logger.info(
+                    "Search parallelism changed from {} to {}, restarting the search worker pool".format(
+                        self._max_workers, max_workers
+                    )
+                )
+                self._stop(wait=True)
+            if self._executor is None:
+                self._start(max_workers)
+            return self._executor
+
+    def submit(self, fn, *args):
+        try:
+            return self.get_executor().submit(fn, *args)
+        except BrokenProcessPool:
+            logger.warning("Search worker pool is broken, respawning it")
+            self.restart()
+            return self.get_executor().submit(fn, *args)
+
+    def restart(self):
+        with self._lock:
+            self._stop(wait=False)
+
+    def health_check(self, timeout=5.0) -> bool:
+        """
+        Round-trip a no-op through the pool, respawning it if the round-trip fails
+        Returns whether the pool was healthy before the check
+        """
+        try:
+            # not `submit`, which would quietly respawn a pool that is already broken
+            self.get_executor().submit(_ping).result(timeout=timeout)
+            return True
+        except (BrokenProcessPool, TimeoutError):
+            logger.warning("Search worker pool failed its health check, respawning it")
+            self.restart()
+            return False
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                logger.info("Shutting down search worker pool")
+            self._stop(wait=True)
+
+
+SearchWorkerPool = _SearchWorkerPool()
@@ -0,0 +1,126 @@
+import atexit
+import hashlib
+import logging
+import os
+import pickle
+import random
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+
+from data.pkmn_sets import RandomBattleTeamDatasets, SmogonSets, TeamDatasets
+
+logger = logging.getLogger(__name__)
+
+
+# The set datasets a battle can be sampled from.
+# They are initialized in the main process for each battle's format
+_DATASETS = [
+    ("RandomBattleTeamDatasets", RandomBattleTeamDatasets),
+    ("TeamDatasets", TeamDatasets),
+    ("SmogonSets", SmogonSets),
+]
+
+# How many versions of the datasets are kept on disk for the workers,
+# and in memory by each worker, e.g. for concurrent battles of different formats
+MAX_DATASET_VERSIONS = 8
+
+
+def datasets_key() -> str:
+    """
+    Changes whenever the candidate sets a battle would be sampled from change:
+    a new format, new smogon stats, or pokemon added to the datasets during a battle
+    """
+    parts = []
+    for name, datasets in _DATASETS:
+        parts.append(
+            (
+                name,
+                datasets.pkmn_mode,
+                getattr(datasets, "current_pkmn_sets_url", None),
+                sorted((pkmn, len(sets)) for pkmn, sets in datasets.pkmn_sets.items()),
+            )
+        )
+    return hashlib.blake2b(repr(parts).encode(), digest_size=16).hexdigest()
+
+
+def sampling_chunks(num_battles: int, num_chunks: int, rng=random) -> list[(int, int)]:
+    """
+    Splits sampling `num_battles` battles into at most `num_chunks` tasks.
+    Returns the seed each task samples with and how many battles it samples
+    """
+    num_chunks = max(1, min(num_chunks, num_battles))
+    return [
+        (
+            rng.getrandbits(64),
+            num_battles // num_chunks + (1 if i < num_battles % num_chunks else 0),
+        )
+        for i in range(num_chunks)
+    ]
+
+
+class _SamplingDatasets:
+    """
+    Ships the set datasets to the search workers so that they can sample battles themselves.
+
+    The main process writes each version of the datasets to a file once, and every
+    task only carries the version's key and path. A worker loads a version the first
+    time one of its tasks needs it and keeps it for the following tasks
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._directory = None
+        self._published = OrderedDict()
+        self._loaded = OrderedDict()
+        self._installed_key = None
+
+    def publish(self) -> (str, str):
+        """Main process: returns the key and path of the current datasets"""
+        key = datasets_key()
+        with self._lock:
+            if key in self._published:
+                self._published.move_to_end(key)
+                return key, self._published[key]
+
+            if self._directory is None:
+                self._directory = tempfile.mkdtemp(prefix="foul-play-datasets-")
+                atexit.register(shutil.rmtree, self._directory, True)
+            path = os.path.join(self._directory, "{}.pickle".format(key))
+            snapshot = {name: vars(datasets) for name, datasets in _DATASETS}
+            tmp_path = "{}.tmp".format(path)
+            with open(tmp_path, "wb") as f:
+                pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+            logger.info(
+                "Published sampling datasets {} for the search workers".format(key)
+            )
+
+            self._published[key] = path
+            while len(self._published) > MAX_DATASET_VERSIONS:
+                _, old_path = self._published.popitem(last=False)
+                os.remove(old_path)
+            return key, path
+
+    def install(self, key: str, path: str):
+        """Search worker: makes the datasets with `key` the ones that are sampled from"""
+        with self._lock:
+            if key == self._installed_key:
+                return
+            snapshot = self._loaded.get(key)
+            if snapshot is None:
+                with open(path, "rb") as f:
+                    snapshot = pickle.load(f)
+                self._loaded[key] = snapshot
+                while len(self._loaded) > MAX_DATASET_VERSIONS:
+                    self._loaded.popitem(last=False)
+            self._loaded.move_to_end(key)
+
+            for name, datasets in _DATASETS:
+                vars(datasets).clear()
+                vars(datasets).update(snapshot[name])
+            self._installed_key = key
+
+
+SamplingDatasets = _SamplingDatasets()
@@ -1,4 +1,5 @@
 from fp.battle import Battle
+from fp.legal_actions import legal_actions
 from fp.search.main import find_best_move
 from transformers import AutoModelForCausalLM, AutoTokenizer
 import torch
@@ -73,8 +74,9 @@ class LLMPokemonPlayer:
         opp_active = battle.opponent.active
 
         # Format moves with detailed info
-        moves_list = [f"{m.name} (Power: {m.base_power}, Type: {m.type})" for m in my_active.moves if not m.disabled]
-        switches_list = [p.name for p in battle.user.reserve if not p.fainted]
+        legal_move_names = self._legal_moves(battle)
+        moves_list = [f"{m.name} (Power: {m.base_power}, Type: {m.type})" for m in my_active.moves if m.name in legal_move_names]
+        switches_list = [p.name for p in self._legal_switches(battle)]
 
         prompt = f"""You are an expert Pokemon battler in Gen 9 OU format.
 
@@ -122,6 +124,26 @@ IMPORTANT:
 """
         return prompt
     
+    def _has_request(self, battle: Battle):
+        """Whether legal_actions can read the choices from the request"""
+        return battle.request_json is not None and not battle.team_preview
+
+    def _legal_moves(self, battle: Battle):
+        """Names of the moves the request allows, without the -tera/-mega variants"""
+        if not self._has_request(battle):
+            return [m.name for m in battle.user.active.moves if not m.disabled]
+        return [
+            a for a in legal_actions(battle)
+            if not a.startswith("switch ") and not a.endswith(("-tera", "-mega"))
+        ]
+
+    def _legal_switches(self, battle: Battle):
+        """Reserve Pokemon the request allows switching to"""
+        if not self._has_request(battle):
+            return [p for p in battle.user.reserve if not p.fainted]
+        switches = legal_actions(battle)
+        return [p for p in battle.user.reserve if f"switch {p.name}" in switches]
+
     def _format_team(self, pokemon_list):
         """Format Pokemon team for display"""
         available = [f"- {p.name}: {p.hp_percent}% HP, {p.status or 'Healthy'}" 
@@ -228,8 +250,7 @@ IMPORTANT:
         if len(decision_text.split()) > 3:
             logger.debug(f"Decision looks like a sentence: {decision_text[:50]}")
             # Try to find a move name in the available moves
-            my_active = battle.user.active
-            available_moves = [m.name.lower() for m in my_active.moves if not m.disabled]
+            available_moves = [m.lower() for m in self._legal_moves(battle)]
             for word in decision_text.split():
                 if word.lower() in available_moves:
                     decision_text = word
@@ -319,7 +340,7 @@ IMPORTANT:
                 best_match = None
                 best_score = 0
                 
-                for pkmn in battle.user.reserve:
+                for pkmn in self._legal_switches(battle):
                     if not pkmn.fainted:
                         # Normalize both names
                         pkmn_name_lower = pkmn.name.lower().replace('-', '').replace(' ', '')
@@ -350,8 +371,7 @@ IMPORTANT:
                 logger.warning(f"⚠️  Could not find Pokemon matching '{target_pokemon}' in reserve")
         
         # Otherwise, try to find a move
-        my_active = battle.user.active
-        available_moves = [m.name for m in my_active.moves if not m.disabled]
+        available_moves = self._legal_moves(battle)
         
         # Try exact match first
         for move in available_moves:
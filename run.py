@@ -8,6 +8,13 @@ from config import FoulPlayConfig, init_logging, BotModes
 
 from teams import load_team
 from fp.run_battle import pokemon_battle
+from fp.search.worker_pool import SearchWorkerPool
+from fp.search.cpus import configure_search_cpus
+from fp.search.transposition import TranspositionTable
+from fp.search.lead_cache import LeadCache
+from fp.search.scheduler import SearchScheduler
+from fp.search.distributed import SearchCoordinator
+from fp.search.throughput import SearchThroughput
 from fp.websocket_client import PSWebsocketClient
 
 from data import all_move_json
@@ -46,6 +53,7 @@ async def run_foul_play():
     FoulPlayConfig.configure()
     init_logging(FoulPlayConfig.log_level, FoulPlayConfig.log_to_file)
     apply_mods(FoulPlayConfig.pokemon_format)
+    configure_search_cpus()
 
     original_pokedex = deepcopy(pokedex)
     original_move_json = deepcopy(all_move_json)
@@ -59,12 +67,22 @@ async def run_foul_play():
     if FoulPlayConfig.avatar is not None:
         await ps_websocket_client.avatar(FoulPlayConfig.avatar)
 
+    if FoulPlayConfig.search_cache_file is not None:
+        TranspositionTable.load(FoulPlayConfig.search_cache_file)
+    if FoulPlayConfig.lead_cache_file is not None:
+        LeadCache.load(FoulPlayConfig.lead_cache_file)
+    if FoulPlayConfig.search_iterations is not None:
+        SearchThroughput.calibrate()
+
     battles_run = 0
     wins = 0
     losses = 0
     team_file_name = "None"
     team_dict = None
     while True:
+        # respawns the search workers if one of them died during the last battle
+        SearchWorkerPool.health_check()
+
         if FoulPlayConfig.requires_team():
             team_packed, team_dict, team_file_name = load_team(FoulPlayConfig.team_name)
             await ps_websocket_client.update_team(team_packed)
@@ -97,11 +115,19 @@ async def run_foul_play():
 
         logger.info("W: {}\tL: {}".format(wins, losses))
         check_dictionaries_are_unmodified(original_pokedex, original_move_json)
+        logger.info("Search cache: {}".format(TranspositionTable.stats()))
+        logger.info("Search scheduler: {}".format(SearchScheduler.stats()))
+        if FoulPlayConfig.search_cache_file is not None:
+            TranspositionTable.save(FoulPlayConfig.search_cache_file)
+        if FoulPlayConfig.lead_cache_file is not None:
+            LeadCache.save(FoulPlayConfig.lead_cache_file)
 
         battles_run += 1
         if battles_run >= FoulPlayConfig.run_count:
             break
     await ps_websocket_client.close()
+    SearchCoordinator.shutdown()
+    SearchWorkerPool.shutdown()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,18 @@
+from fp.search.transposition import MctsMoveSummary
+from fp.search.transposition import MctsSummary
+
+
+def summary(
+    visits: dict[str, int],
+    side_two_visits: dict[str, int] = None,
+    search_ms: float = 0,
+) -> MctsSummary:
+    """A search where every move scored half of its visits"""
+    return MctsSummary(
+        side_one=[MctsMoveSummary(m, 0.5 * v, v) for m, v in visits.items()],
+        side_two=[
+            MctsMoveSummary(m, 0.5 * v, v) for m, v in (side_two_visits or {}).items()
+        ],
+        total_visits=sum(visits.values()),
+        search_ms=search_ms,
+    )
@@ -0,0 +1,151 @@
+import unittest
+from collections import namedtuple
+
+from config import SearchAggregation
+from fp.search.aggregation import StreamingPolicy
+from fp.search.aggregation import WorldMoveMatrix
+from fp.search.aggregation import aggregate_policy
+from fp.search.aggregation import visit_fractions
+
+
+MoveResult = namedtuple("MoveResult", ["move_choice", "total_score", "visits"])
+SearchResult = namedtuple("SearchResult", ["side_one", "side_two", "total_visits"])
+
+
+def search_result(visits: dict[str, int]) -> SearchResult:
+    return SearchResult(
+        side_one=[MoveResult(m, 0.5 * v, v) for m, v in visits.items()],
+        side_two=[],
+        total_visits=sum(visits.values()),
+    )
+
+
+def scored_result(options: dict[str, tuple[int, float]]) -> SearchResult:
+    """`options` is move -> (visits, average score)"""
+    return SearchResult(
+        side_one=[MoveResult(m, v * score, v) for m, (v, score) in options.items()],
+        side_two=[],
+        total_visits=sum(v for v, _ in options.values()),
+    )
+
+
+class TestVisitFractions(unittest.TestCase):
+    def test_fractions_of_total_visits(self):
+        result = search_result({"tackle": 75, "growl": 25})
+
+        self.assertEqual({"tackle": 0.75, "growl": 0.25}, visit_fractions(result))
+
+
+class TestStreamingPolicy(unittest.TestCase):
+    def test_policy_is_weighted_by_sample_chance(self):
+        policy = StreamingPolicy(1)
+        policy.add(search_result({"tackle": 100, "growl": 0}), 0.75)
+        policy.add(search_result({"tackle": 0, "growl": 100}), 0.25)
+
+        self.assertEqual({"tackle": 0.75, "growl": 0.25}, policy.policy)
+        self.assertEqual("tackle", policy.best_move())
+
+    def test_lead_larger_than_unseen_weight_is_safe(self):
+        policy = StreamingPolicy(1)
+        policy.add(search_result({"tackle": 90, "growl": 10}), 0.5)
+
+        # 0.45 - 0.05 > 0.5 remaining is false
+        self.assertFalse(policy.lead_is_safe())
+
+        policy.add(search_result({"tackle": 90, "growl": 10}), 0.25)
+
+        # 0.675 - 0.075 > 0.25 remaining
+        self.assertTrue(policy.lead_is_safe())
+
+    def test_consistent_lead_over_many_worlds_is_safe(self):
+        policy = StreamingPolicy(100)
+        for _ in range(8):
+            policy.add(search_result({"tackle": 80, "growl": 15, "leer": 5}), 1)
+
+        self.assertTrue(policy.lead_is_safe())
+
+    def test_inconsistent_lead_is_not_safe(self):
+        policy = StreamingPolicy(100)
+        for i in range(8):
+            if i % 2:
+                policy.add(search_result({"tackle": 90, "growl": 10}), 1)
+            else:
+                policy.add(search_result({"tackle": 20, "growl": 80}), 1)
+
+        self.assertFalse(policy.lead_is_safe())
+
+    def test_too_few_worlds_is_not_safe(self):
+        policy = StreamingPolicy(100)
+        policy.add(search_result({"tackle": 80, "growl": 20}), 1)
+
+        self.assertFalse(policy.lead_is_safe())
+
+    def test_single_move_is_safe(self):
+        policy = StreamingPolicy(100)
+        policy.add(search_result({"tackle": 100}), 1)
+
+        self.assertTrue(policy.lead_is_safe())
+
+
+class TestWorldMoveMatrix(unittest.TestCase):
+    def test_moves_missing_from_a_world_have_no_visits_and_no_score(self):
+        matrix = WorldMoveMatrix(
+            [
+                (scored_result({"tackle": (3, 0.5), "growl": (1, 0.25)}), 0.5, 0),
+                (scored_result({"tackle": (4, 0.75)}), 0.5, 1),
+            ]
+        )
+
+        self.assertEqual(["tackle", "growl"], matrix.moves)
+        self.assertEqual([[0.75, 0.25], [1.0, 0.0]], matrix.visit_fractions)
+        self.assertEqual([[0.5, 0.25], [0.75, None]], matrix.scores)
+        self.assertEqual([[0.5, 0.25], [0.75, 0.75]], matrix.filled_scores())
+
+
+class TestAggregatePolicy(unittest.TestCase):
+    def setUp(self):
+        # tackle is good in the likely world and terrible in the unlikely one
+        # growl is mediocre in both
+        self.mcts_results = [
+            (scored_result({"tackle": (80, 0.9), "growl": (20, 0.6)}), 0.8, 0),
+            (scored_result({"tackle": (10, 0.1), "growl": (90, 0.5)}), 0.2, 1),
+        ]
+
+    def assert_policy_equal(self, expected, policy):
+        self.assertEqual(expected.keys(), policy.keys())
+        for move, value in expected.items():
+            self.assertAlmostEqual(value, policy[move])
+
+    def test_visit_weighted(self):
+        self.assert_policy_equal(
+            {"tackle": 0.66, "growl": 0.34},
+            aggregate_policy(self.mcts_results, SearchAggregation.visit_weighted),
+        )
+
+    def test_average_score(self):
+        self.assert_policy_equal(
+            {"tackle": 0.74, "growl": 0.58},
+            aggregate_policy(self.mcts_results, SearchAggregation.average_score),
+        )
+
+    def test_robust_max_picks_the_best_worst_case(self):
+        self.assert_policy_equal(
+            {"tackle": 0.1, "growl": 0.5},
+            aggregate_policy(self.mcts_results, SearchAggregation.robust_max),
+        )
+
+    def test_min_regret_picks_the_smallest_worst_regret(self):
+        self.assert_policy_equal(
+            {"tackle": -0.4, "growl": -0.3},
+            aggregate_policy(self.mcts_results, SearchAggregation.min_regret),
+        )
+
+    def test_hundreds_of_worlds(self):
+        mcts_results = [
+            (scored_result({"tackle": (60, 0.6), "growl": (40, 0.4)}), 1 / 500, i)
+            for i in range(500)
+        ]
+
+        for strategy in SearchAggregation:
+            policy = aggregate_policy(mcts_results, strategy)
+            self.assertEqual("tackle", max(policy, key=policy.get))
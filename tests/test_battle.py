@@ -1,5 +1,8 @@
 import unittest
+from copy import deepcopy
 
+import constants
+from fp.battle import Battle
 from fp.battle import LastUsedMove
 from fp.battle import Battler
 from fp.battle import Pokemon
@@ -173,3 +176,55 @@ class TestBattlerActiveLockedIntoMove(unittest.TestCase):
         self.assertFalse(self.battler.active.get_move("thunderbolt").disabled)
         self.assertFalse(self.battler.active.get_move("agility").disabled)
         self.assertFalse(self.battler.active.get_move("doubleteam").disabled)
+
+
+def as_tree(obj):
+    """`obj` as nested builtins so that two copies of a battle can be compared"""
+    if isinstance(obj, (list, tuple)):
+        return [as_tree(x) for x in obj]
+    if isinstance(obj, set):
+        return sorted(obj)
+    if isinstance(obj, dict):
+        return {k: as_tree(v) for k, v in obj.items()}
+    if hasattr(obj, "__dict__"):
+        return {k: as_tree(v) for k, v in vars(obj).items()}
+    return obj
+
+
+class TestBattleClone(unittest.TestCase):
+    def setUp(self):
+        self.battle = Battle("battle-gen9ou-1")
+        self.battle.weather = constants.RAIN
+        self.battle.user.active = Pokemon("pikachu", 100)
+        self.battle.user.active.add_move("thunderbolt")
+        self.battle.user.reserve = [Pokemon("charmander", 100)]
+        self.battle.opponent.active = Pokemon("garchomp", 100)
+        self.battle.opponent.active.add_move("earthquake")
+        self.battle.opponent.active.boosts[constants.ATTACK] = 2
+        self.battle.opponent.active.volatile_statuses.append("substitute")
+        self.battle.opponent.active.impossible_items.add("choicescarf")
+        self.battle.opponent.reserve = [Pokemon("dragapult", 100)]
+        self.battle.opponent.side_conditions[constants.STEALTH_ROCK] = 1
+        self.battle.opponent.last_used_move = LastUsedMove("garchomp", "earthquake", 3)
+
+    def test_clone_matches_deepcopy(self):
+        self.assertEqual(as_tree(deepcopy(self.battle)), as_tree(self.battle.clone()))
+
+    def test_changing_the_opponent_of_a_clone_does_not_change_the_battle(self):
+        clone = self.battle.clone()
+        clone.opponent.active.item = "choiceband"
+        clone.opponent.active.boosts[constants.SPEED] = 1
+        clone.opponent.active.get_move("earthquake").disabled = True
+        clone.opponent.active.add_move("swordsdance")
+        clone.opponent.reserve.append(Pokemon("kingambit", 100))
+        clone.opponent.side_conditions[constants.SPIKES] = 1
+
+        self.assertEqual(constants.UNKNOWN_ITEM, self.battle.opponent.active.item)
+        self.assertEqual(0, self.battle.opponent.active.boosts[constants.SPEED])
+        self.assertFalse(self.battle.opponent.active.get_move("earthquake").disabled)
+        self.assertEqual(1, len(self.battle.opponent.active.moves))
+        self.assertEqual(1, len(self.battle.opponent.reserve))
+        self.assertEqual(0, self.battle.opponent.side_conditions[constants.SPIKES])
+
+    def test_our_side_is_shared(self):
+        self.assertIs(self.battle.user, self.battle.clone().user)
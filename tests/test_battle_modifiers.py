@@ -6396,6 +6396,13 @@ class TestInactive(unittest.TestCase):
 
         self.assertEqual(60, self.battle.time_remaining)
 
+    def test_observes_time_left_this_turn_and_total(self):
+        split_msg = ["", "inactive", "Time left: 60 sec this turn ", " 240 sec total"]
+        inactive(self.battle, split_msg)
+
+        self.assertEqual(60, self.battle.time_bank.turn_seconds_left)
+        self.assertEqual(240, self.battle.time_bank.total_seconds_left)
+
     def test_capture_group_failing(self):
         self.battle.time_remaining = 1
         split_msg = ["", "inactive", "some random message"]
@@ -0,0 +1,138 @@
+import random
+import unittest
+
+from constants import BattleType
+from data.pkmn_sets import PokemonMoveset
+from data.pkmn_sets import PokemonSet
+from data.pkmn_sets import PredictedPokemonSet
+from data.pkmn_sets import RandomBattleTeamDatasets
+from fp.battle import Battle
+from fp.battle import Pokemon
+from fp.search.belief import BattleBelief
+from fp.search.belief import Particle
+from fp.search.belief import effective_sample_size
+from fp.search.belief import systematic_resample
+
+
+def predicted_set(moves: list[str], item="leftovers") -> PredictedPokemonSet:
+    return PredictedPokemonSet(
+        pkmn_set=PokemonSet(
+            ability="roughskin",
+            item=item,
+            nature="serious",
+            evs=(85,) * 6,
+            count=1,
+            level=77,
+        ),
+        pkmn_moveset=PokemonMoveset(moves=tuple(moves)),
+    )
+
+
+class TestParticle(unittest.TestCase):
+    def setUp(self):
+        self.battle = Battle("battle-gen9randombattle-1")
+        self.battle.battle_type = BattleType.RANDOM_BATTLE
+        self.battle.user.active = Pokemon("pikachu", 92)
+        self.battle.opponent.active = Pokemon("garchomp", 77)
+        self.particle = Particle(
+            weight=1,
+            sets={
+                "garchomp": predicted_set(
+                    ["earthquake", "outrage", "stealthrock", "spikes"]
+                )
+            },
+            unrevealed=[Pokemon("dragapult", 76), Pokemon("kingambit", 78)],
+        )
+
+    def test_battle_has_the_particles_sets_and_unrevealed_pokemon(self):
+        world = self.particle.to_battle(self.battle)
+
+        self.assertEqual("leftovers", world.opponent.active.item)
+        self.assertEqual(
+            ["earthquake", "outrage", "stealthrock", "spikes"],
+            [m.name for m in world.opponent.active.moves],
+        )
+        self.assertEqual(
+            ["dragapult", "kingambit"], [p.name for p in world.opponent.reserve]
+        )
+        self.assertEqual([], self.battle.opponent.reserve)
+        self.assertEqual([], self.battle.opponent.active.moves)
+
+    def test_particle_without_a_revealed_move_is_ruled_out(self):
+        self.battle.opponent.active.add_move("swordsdance")
+        particle = self.particle.observe(self.battle, [self.battle.opponent.active])
+        self.assertEqual(0, particle.weight)
+
+    def test_particle_with_the_revealed_move_and_item_is_kept(self):
+        self.battle.opponent.active.add_move("stealthrock")
+        self.battle.opponent.active.item = "leftovers"
+        particle = self.particle.observe(self.battle, [self.battle.opponent.active])
+        self.assertEqual(1, particle.weight)
+
+    def test_particle_with_another_item_is_ruled_out(self):
+        self.battle.opponent.active.item = "choicescarf"
+        particle = self.particle.observe(self.battle, [self.battle.opponent.active])
+        self.assertEqual(0, particle.weight)
+
+    def test_guessed_pokemon_keeps_its_set_when_revealed(self):
+        dragapult = Pokemon("dragapult", 76)
+        self.battle.opponent.reserve.append(dragapult)
+        self.particle.unrevealed[0].item = "choiceband"
+
+        particle = self.particle.observe(self.battle, [dragapult])
+
+        self.assertEqual("choiceband", particle.sets["dragapult"].pkmn_set.item)
+        self.assertEqual(["kingambit"], [p.name for p in particle.unrevealed])
+        self.assertEqual(2, len(self.particle.unrevealed))
+
+
+class TestResampling(unittest.TestCase):
+    def test_effective_sample_size(self):
+        self.assertEqual(4, effective_sample_size([1, 1, 1, 1]))
+        self.assertEqual(1, effective_sample_size([1, 0, 0, 0]))
+        self.assertEqual(0, effective_sample_size([]))
+
+    def test_particles_are_drawn_by_their_weights(self):
+        particles = [Particle(w, {}, []) for w in [0.5, 0, 0.25, 0.25]]
+        resampled = systematic_resample(particles, 4, rng=random.Random(0))
+        self.assertEqual(
+            [particles[0], particles[0], particles[2], particles[3]], resampled
+        )
+
+
+class TestBattleBelief(unittest.TestCase):
+    def setUp(self):
+        RandomBattleTeamDatasets.initialize("gen9")
+        self.battle = Battle("battle-gen9randombattle-1")
+        self.battle.battle_type = BattleType.RANDOM_BATTLE
+        self.battle.generation = "gen9"
+        self.battle.pokemon_format = "gen9randombattle"
+        self.battle.user.active = Pokemon("pikachu", 92)
+        self.battle.opponent.active = Pokemon("garchomp", 77)
+        self.battle.opponent.reserve.append(Pokemon("dragapult", 76))
+        self.belief = BattleBelief(16)
+        self.rng = random.Random(0)
+
+    def test_battles_are_drawn_from_sampled_particles(self):
+        battles = list(self.belief.sample_battles(self.battle, 4, rng=self.rng))
+
+        self.assertEqual(16, len(self.belief.particles))
+        self.assertEqual(4, len(battles))
+        for world, chance in battles:
+            self.assertEqual(0.25, chance)
+            self.assertEqual(5, len(world.opponent.reserve))
+
+    def test_particles_are_kept_without_new_information(self):
+        self.belief.update(self.battle, rng=self.rng)
+        particles = self.belief.particles
+        self.belief.update(self.battle, rng=self.rng)
+        self.assertIs(particles, self.belief.particles)
+
+    def test_ruled_out_particles_are_replaced(self):
+        self.belief.update(self.battle, rng=self.rng)
+        self.battle.opponent.active.add_move("stealthrock")
+        self.belief.update(self.battle, rng=self.rng)
+
+        self.assertEqual(16, len(self.belief.particles))
+        for particle in self.belief.particles:
+            self.assertIn("stealthrock", particle.sets["garchomp"].pkmn_moveset.moves)
@@ -0,0 +1,91 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from fp.search import cpus
+
+
+class TestCgroupCpuLimit(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, name: str, contents: str) -> str:
+        path = os.path.join(self.directory.name, name)
+        with open(path, "w") as f:
+            f.write(contents)
+        return path
+
+    def missing(self, name: str) -> str:
+        return os.path.join(self.directory.name, name)
+
+    def patch_paths(self, v2, v1_quota, v1_period):
+        return mock.patch.multiple(
+            cpus,
+            CGROUP_V2_CPU_MAX=v2,
+            CGROUP_V1_CFS_QUOTA=v1_quota,
+            CGROUP_V1_CFS_PERIOD=v1_period,
+        )
+
+    def test_cgroup_v2_quota(self):
+        with self.patch_paths(
+            self.write("cpu.max", "250000 100000\n"),
+            self.missing("quota"),
+            self.missing("period"),
+        ):
+            self.assertEqual(2.5, cpus.cgroup_cpu_limit())
+
+    def test_cgroup_v2_without_quota(self):
+        with self.patch_paths(
+            self.write("cpu.max", "max 100000\n"),
+            self.missing("quota"),
+            self.missing("period"),
+        ):
+            self.assertIsNone(cpus.cgroup_cpu_limit())
+
+    def test_cgroup_v1_quota(self):
+        with self.patch_paths(
+            self.missing("cpu.max"),
+            self.write("quota", "200000"),
+            self.write("period", "100000"),
+        ):
+            self.assertEqual(2, cpus.cgroup_cpu_limit())
+
+    def test_cgroup_v1_without_quota(self):
+        with self.patch_paths(
+            self.missing("cpu.max"),
+            self.write("quota", "-1"),
+            self.write("period", "100000"),
+        ):
+            self.assertIsNone(cpus.cgroup_cpu_limit())
+
+
+class TestCpuAssignment(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(cpus, "_process_cpus", [0, 1, 2, 3])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_quota_limits_parallelism(self):
+        with mock.patch.object(cpus, "cgroup_cpu_limit", return_value=2.5):
+            self.assertEqual(2, cpus.auto_parallelism(1))
+
+    def test_parallelism_is_every_cpu_but_the_reserved_ones(self):
+        with mock.patch.object(cpus, "cgroup_cpu_limit", return_value=None):
+            self.assertEqual(3, cpus.auto_parallelism(1))
+
+    def test_parallelism_is_at_least_one(self):
+        with mock.patch.object(cpus, "cgroup_cpu_limit", return_value=0.5):
+            self.assertEqual(1, cpus.auto_parallelism(1))
+
+    def test_workers_avoid_the_reserved_cpus(self):
+        self.assertEqual([1, 2, 3], cpus.worker_cpus(3, 1))
+
+    def test_workers_share_cpus_when_there_are_more_workers(self):
+        self.assertEqual([2, 3, 2], cpus.worker_cpus(3, 2))
+
+    def test_workers_use_every_cpu_if_all_are_reserved(self):
+        self.assertEqual([0, 1], cpus.worker_cpus(2, 4))
@@ -0,0 +1,121 @@
+import socket
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from unittest import mock
+
+from config import FoulPlayConfig
+from fp.search import distributed
+from fp.search.distributed import SearchWorkerServer
+from fp.search.distributed import _SearchCoordinator
+from fp.search.distributed import receive_message
+from fp.search.distributed import send_message
+from fp.search.transposition import MctsMoveSummary
+from fp.search.transposition import MctsSummary
+
+
+def fake_search(state: str, search_time_ms: int, index: int) -> MctsSummary:
+    return MctsSummary(
+        side_one=[MctsMoveSummary(state, 0.5 * search_time_ms, search_time_ms)],
+        side_two=[MctsMoveSummary("tackle", 0, search_time_ms)],
+        total_visits=search_time_ms,
+    )
+
+
+class TestProtocol(unittest.TestCase):
+    def test_messages_round_trip(self):
+        a, b = socket.socketpair()
+        with a, b:
+            send_message(a, {"id": 1, "state": "x" * 100000})
+            send_message(a, {"cancel": 1})
+
+            self.assertEqual({"id": 1, "state": "x" * 100000}, receive_message(b))
+            self.assertEqual({"cancel": 1}, receive_message(b))
+
+
+class TestDistributedSearch(unittest.TestCase):
+    def setUp(self):
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.searched = []
+        self.release = threading.Event()
+        self.release.set()
+
+        def submit(state, search_time_ms, index):
+            if state == "release":
+                self.release.set()
+            return self.executor.submit(self.search, state, search_time_ms, index)
+
+        self.server = SearchWorkerServer(("127.0.0.1", 0), submit=submit)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+        self.original_search_workers = FoulPlayConfig.search_workers
+        FoulPlayConfig.search_workers = [
+            "127.0.0.1:{}".format(self.server.server_address[1])
+        ]
+        self.coordinator = _SearchCoordinator()
+
+    def tearDown(self):
+        self.release.set()
+        self.coordinator.shutdown()
+        self.server.shutdown()
+        self.server.server_close()
+        self.executor.shutdown()
+        FoulPlayConfig.search_workers = self.original_search_workers
+
+    def search(self, state, search_time_ms, index):
+        self.searched.append(state)
+        self.release.wait(timeout=5)
+        return fake_search(state, search_time_ms, index)
+
+    def test_results_come_back_from_the_worker(self):
+        futures = [
+            self.coordinator.submit(state, 100 + i, i)
+            for i, state in enumerate(["a", "b", "c"])
+        ]
+
+        results = [f.result(timeout=5) for f in futures]
+
+        self.assertEqual(
+            [fake_search(s, 100 + i, i) for i, s in enumerate("abc")], results
+        )
+
+    def test_stragglers_are_dropped_and_queued_searches_are_cancelled(self):
+        self.release.clear()
+        slow = self.coordinator.submit("slow", 100, 0)
+        queued = self.coordinator.submit("queued", 100, 1)
+
+        with self.assertRaises(TimeoutError):
+            list(as_completed([slow, queued], timeout=0.2))
+        slow.cancel()
+        queued.cancel()
+
+        # the worker reads the cancellations before this search, which releases the slow one
+        self.assertEqual(
+            100,
+            self.coordinator.submit("release", 100, 2).result(timeout=5).total_visits,
+        )
+        self.assertTrue(slow.cancelled())
+        self.assertEqual(["slow", "release"], self.searched)
+
+    def test_searches_of_a_silent_worker_are_run_locally(self):
+        self.release.clear()
+        local = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(local.shutdown)
+        for patcher in [
+            mock.patch.object(distributed, "READ_TIMEOUT_SLACK_SECONDS", 0.2),
+            mock.patch.object(
+                distributed,
+                "search_locally",
+                lambda *args: local.submit(fake_search, *args),
+            ),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        started = time.monotonic()
+        result = self.coordinator.submit("stuck", 100, 0).result(timeout=3)
+
+        # given up on after the search time and the slack, not a fixed 30 seconds
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertEqual(fake_search("stuck", 100, 0), result)
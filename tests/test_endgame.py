@@ -0,0 +1,98 @@
+import unittest
+
+from config import FoulPlayConfig
+from config import SearchBackend
+from fp.battle import Battle
+from fp.battle import Pokemon
+from fp.search.endgame import ExpectiminimaxSummary
+from fp.search.endgame import endgame_policy
+from fp.search.endgame import is_endgame
+from fp.search.endgame import search_backend
+
+
+def battle_with(user_hp: list[int], opponent_hp: list[int]) -> Battle:
+    battle = Battle(None)
+    battle.user.active = Pokemon("pikachu", 100)
+    battle.user.reserve = [Pokemon("charmander", 100) for _ in user_hp[1:]]
+    for pkmn, hp in zip([battle.user.active] + battle.user.reserve, user_hp):
+        pkmn.hp = hp
+    battle.opponent.active = Pokemon("squirtle", 100)
+    battle.opponent.reserve = [Pokemon("bulbasaur", 100) for _ in opponent_hp[1:]]
+    for pkmn, hp in zip(
+        [battle.opponent.active] + battle.opponent.reserve, opponent_hp
+    ):
+        pkmn.hp = hp
+    return battle
+
+
+class TestIsEndgame(unittest.TestCase):
+    def test_two_pokemon_left_on_each_side(self):
+        battle = battle_with([100, 100, 0, 0, 0, 0], [100, 100, 0, 0, 0, 0])
+        self.assertTrue(is_endgame(battle))
+
+    def test_three_pokemon_left_is_not_an_endgame(self):
+        battle = battle_with([100, 100, 100, 0, 0, 0], [100, 0, 0, 0, 0, 0])
+        self.assertFalse(is_endgame(battle))
+
+    def test_unrevealed_opponent_pokemon_count_as_alive(self):
+        battle = battle_with([100, 0, 0, 0, 0, 0], [100, 0, 0, 0])
+        self.assertFalse(is_endgame(battle))
+
+
+class TestSearchBackend(unittest.TestCase):
+    def setUp(self):
+        self.original_backend = FoulPlayConfig.search_backend
+        FoulPlayConfig.search_backend = SearchBackend.auto
+        self.endgame = battle_with([100, 0, 0, 0, 0, 0], [100, 0, 0, 0, 0, 0])
+
+    def tearDown(self):
+        FoulPlayConfig.search_backend = self.original_backend
+
+    def test_auto_searches_endgames_with_expectiminimax(self):
+        self.assertEqual(SearchBackend.expectiminimax, search_backend(self.endgame))
+
+    def test_team_preview_is_always_searched_with_mcts(self):
+        FoulPlayConfig.search_backend = SearchBackend.expectiminimax
+        self.endgame.team_preview = True
+        self.assertEqual(SearchBackend.mcts, search_backend(self.endgame))
+
+    def test_backend_can_be_forced(self):
+        FoulPlayConfig.search_backend = SearchBackend.mcts
+        self.assertEqual(SearchBackend.mcts, search_backend(self.endgame))
+
+
+class TestEndgamePolicy(unittest.TestCase):
+    def test_maximin_is_the_worst_score_against_each_reply(self):
+        summary = ExpectiminimaxSummary(
+            side_one=["thunderbolt", "switch charmander"],
+            side_two=["surf", "protect"],
+            matrix=[-50, 20, 10, 0],
+            depth_searched=2,
+        )
+        self.assertEqual(
+            {"thunderbolt": -50, "switch charmander": 0}, summary.maximin()
+        )
+
+    def test_pruned_entries_are_skipped(self):
+        nan = float("nan")
+        summary = ExpectiminimaxSummary(
+            side_one=["thunderbolt", "switch charmander", "thunderwave"],
+            side_two=["surf", "protect"],
+            matrix=[nan, 20, 10, 0, nan, nan],
+            depth_searched=2,
+        )
+        self.assertEqual(
+            {"thunderbolt": 20, "switch charmander": 0, "thunderwave": 0},
+            summary.maximin(),
+        )
+
+    def test_maximin_scores_are_averaged_over_worlds(self):
+        results = [
+            (ExpectiminimaxSummary(["a", "b"], ["x"], [10, 0], 2), 0.75, 0),
+            (ExpectiminimaxSummary(["a", "b"], ["x"], [-30, 0], 2), 0.25, 1),
+            (ExpectiminimaxSummary(["a", "b", "c"], ["x"], [0, 0, 5], 2), 0.5, 2),
+        ]
+        policy = endgame_policy(results)
+        self.assertAlmostEqual(0, policy["a"])
+        self.assertAlmostEqual(0, policy["b"])
+        self.assertAlmostEqual(5, policy["c"])
@@ -0,0 +1,50 @@
+import unittest
+
+from config import SearchAggregation
+from fp.battle import Battle
+from fp.battle import Pokemon
+from fp.search.focus import focus_moves
+from fp.search.focus import focused_battle
+from tests.search_helpers import summary
+
+
+class TestFocusMoves(unittest.TestCase):
+    def test_best_moves_of_the_aggregated_policy(self):
+        results = [
+            (summary({"a": 50, "b": 30, "c": 20}), 0.5, 0),
+            (summary({"a": 10, "b": 60, "c": 30}), 0.5, 1),
+        ]
+        self.assertEqual(
+            ["b", "a"], focus_moves(results, 2, SearchAggregation.visit_weighted)
+        )
+
+    def test_nothing_to_focus_on_with_few_moves(self):
+        results = [(summary({"a": 50, "b": 50}), 1, 0)]
+        self.assertEqual([], focus_moves(results, 2, SearchAggregation.visit_weighted))
+
+
+class TestFocusedBattle(unittest.TestCase):
+    def setUp(self):
+        self.battle = Battle(None)
+        self.battle.user.active = Pokemon("pikachu", 100)
+        for move in ["thunderbolt", "voltswitch", "surf", "protect"]:
+            self.battle.user.active.add_move(move)
+        self.battle.user.reserve = [Pokemon("charmander", 100)]
+
+    def disabled_moves(self, battle: Battle) -> list[str]:
+        return [m.name for m in battle.user.active.moves if m.disabled]
+
+    def test_moves_not_focused_on_are_disabled(self):
+        focused = focused_battle(self.battle, ["thunderbolt-tera", "switch charmander"])
+        self.assertEqual(
+            ["voltswitch", "surf", "protect"], self.disabled_moves(focused)
+        )
+        self.assertFalse(focused.user.trapped)
+        self.assertEqual([], self.disabled_moves(self.battle))
+
+    def test_switching_is_not_possible_without_a_focused_switch(self):
+        focused = focused_battle(self.battle, ["thunderbolt", "surf"])
+        self.assertTrue(focused.user.trapped)
+
+    def test_nothing_left_to_choose(self):
+        self.assertIsNone(focused_battle(self.battle, ["recharge"]))
@@ -0,0 +1,135 @@
+import json
+import os
+import tempfile
+import unittest
+
+from config import FoulPlayConfig
+from data.pkmn_sets import SmogonSets
+from fp.battle import Battle
+from fp.battle import Pokemon
+from fp.search.lead_cache import LeadPolicy
+from fp.search.lead_cache import _LeadCache
+from fp.search.lead_cache import lead_key
+
+
+def team_preview_battle(user_team: list[str], opponent_team: list[str]) -> Battle:
+    battle = Battle("battle-gen9ou-1")
+    battle.pokemon_format = "gen9ou"
+    battle.team_preview = True
+    battle.user.reserve = [Pokemon(name, 100) for name in user_team]
+    battle.opponent.reserve = [Pokemon(name, 100) for name in opponent_team]
+    return battle
+
+
+class TestLeadKey(unittest.TestCase):
+    def test_order_of_either_team_does_not_matter(self):
+        self.assertEqual(
+            lead_key(
+                team_preview_battle(["garchomp", "toxapex"], ["kingambit", "dragapult"])
+            ),
+            lead_key(
+                team_preview_battle(["toxapex", "garchomp"], ["dragapult", "kingambit"])
+            ),
+        )
+
+    def test_different_opponents_are_different_keys(self):
+        self.assertNotEqual(
+            lead_key(team_preview_battle(["garchomp"], ["kingambit"])),
+            lead_key(team_preview_battle(["garchomp"], ["dragapult"])),
+        )
+
+    def test_user_sets_are_part_of_the_key(self):
+        battle = team_preview_battle(["garchomp"], ["kingambit"])
+        key = lead_key(battle)
+        battle.user.reserve[0].item = "choicescarf"
+
+        self.assertNotEqual(key, lead_key(battle))
+
+
+class TestLeadPolicy(unittest.TestCase):
+    def test_merge_weights_by_number_of_searches(self):
+        lead = LeadPolicy({"switch a": 0.8, "switch b": 0.2}, 3, None, "v1")
+
+        merged = lead.merge({"switch a": 0.4, "switch c": 0.6})
+
+        self.assertEqual(4, merged.num_searches)
+        self.assertAlmostEqual(0.7, merged.policy["switch a"])
+        self.assertAlmostEqual(0.15, merged.policy["switch b"])
+        self.assertAlmostEqual(0.15, merged.policy["switch c"])
+
+
+class TestLeadCache(unittest.TestCase):
+    def setUp(self):
+        self.original_size = FoulPlayConfig.lead_cache_size
+        self.original_url = SmogonSets.current_pkmn_sets_url
+        FoulPlayConfig.lead_cache_size = 2
+        SmogonSets.current_pkmn_sets_url = "gen9ou-2026-09"
+        self.cache = _LeadCache()
+        self.battle = team_preview_battle(["garchomp"], ["kingambit"])
+
+    def tearDown(self):
+        FoulPlayConfig.lead_cache_size = self.original_size
+        SmogonSets.current_pkmn_sets_url = self.original_url
+
+    def test_stored_policy_is_found(self):
+        self.cache.store(self.battle, {"switch garchomp": 1})
+
+        lead = self.cache.lookup(self.battle)
+
+        self.assertEqual({"switch garchomp": 1}, lead.policy)
+        self.assertEqual(1, lead.num_searches)
+
+    def test_storing_again_tops_up_the_policy(self):
+        self.cache.store(self.battle, {"switch garchomp": 1})
+        self.cache.store(self.battle, {"switch garchomp": 0})
+
+        lead = self.cache.lookup(self.battle)
+
+        self.assertEqual(2, lead.num_searches)
+        self.assertAlmostEqual(0.5, lead.policy["switch garchomp"])
+
+    def test_new_set_data_invalidates_the_policy(self):
+        self.cache.store(self.battle, {"switch garchomp": 1})
+        SmogonSets.current_pkmn_sets_url = "gen9ou-2026-10"
+
+        self.assertIsNone(self.cache.lookup(self.battle))
+
+    def test_least_recently_used_policy_is_evicted(self):
+        battles = [
+            team_preview_battle(["garchomp"], [opponent])
+            for opponent in ["kingambit", "dragapult", "toxapex"]
+        ]
+        self.cache.store(battles[0], {"switch garchomp": 1})
+        self.cache.store(battles[1], {"switch garchomp": 1})
+        self.cache.lookup(battles[0])
+        self.cache.store(battles[2], {"switch garchomp": 1})
+
+        self.assertIsNotNone(self.cache.lookup(battles[0]))
+        self.assertIsNone(self.cache.lookup(battles[1]))
+
+    def test_size_zero_disables_the_cache(self):
+        FoulPlayConfig.lead_cache_size = 0
+        self.cache.store(self.battle, {"switch garchomp": 1})
+
+        self.assertIsNone(self.cache.lookup(self.battle))
+
+    def test_save_and_load(self):
+        self.cache.store(self.battle, {"switch garchomp": 1})
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "leads.json")
+            self.cache.save(path)
+            loaded = _LeadCache()
+            loaded.load(path)
+
+        self.assertEqual({"switch garchomp": 1}, loaded.lookup(self.battle).policy)
+
+    def test_loading_a_file_that_is_not_a_lead_cache_leaves_the_cache_empty(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "leads.json")
+            with open(path, "w") as f:
+                lead = {"policy": {"switch garchomp": 1}, "strategy": "unknown"}
+                json.dump([[lead_key(self.battle).hex(), lead]], f)
+            loaded = _LeadCache()
+            loaded.load(path)
+
+        self.assertIsNone(loaded.lookup(self.battle))
@@ -0,0 +1,126 @@
+import unittest
+
+import constants
+from fp.battle import Battle
+from fp.battle import LastUsedMove
+from fp.battle import Pokemon
+from fp.legal_actions import legal_actions
+
+
+def request_move(name: str, disabled=False) -> dict:
+    return {"move": name, "id": name, "pp": 16, "maxpp": 16, "disabled": disabled}
+
+
+def request_pokemon(name: str, condition: str, active=False) -> dict:
+    return {
+        "ident": "p1: {}".format(name.capitalize()),
+        "details": "{}, L80".format(name.capitalize()),
+        "condition": condition,
+        "active": active,
+    }
+
+
+class TestLegalActions(unittest.TestCase):
+    def setUp(self):
+        self.battle = Battle(None)
+        self.battle.user.active = Pokemon("pikachu", 80)
+        self.battle.user.reserve = [
+            Pokemon("charmander", 80),
+            Pokemon("squirtle", 80),
+        ]
+        self.battle.request_json = {
+            constants.ACTIVE: [
+                {
+                    constants.MOVES: [
+                        request_move("thunderbolt"),
+                        request_move("voltswitch"),
+                    ]
+                }
+            ],
+            constants.SIDE: {
+                constants.POKEMON: [
+                    request_pokemon("pikachu", "100/100", active=True),
+                    request_pokemon("charmander", "100/100"),
+                    request_pokemon("squirtle", "100/100"),
+                ]
+            },
+        }
+
+    def test_moves_and_switches(self):
+        self.assertEqual(
+            ["thunderbolt", "voltswitch", "switch charmander", "switch squirtle"],
+            legal_actions(self.battle),
+        )
+
+    def test_disabled_moves_are_not_legal(self):
+        self.battle.request_json[constants.ACTIVE][0][constants.MOVES][1][
+            constants.DISABLED
+        ] = True
+        self.assertNotIn("voltswitch", legal_actions(self.battle))
+
+    def test_trapped_pokemon_cannot_switch(self):
+        self.battle.request_json[constants.ACTIVE][0][constants.TRAPPED] = True
+        self.assertEqual(["thunderbolt", "voltswitch"], legal_actions(self.battle))
+
+    def test_maybe_trapped_pokemon_cannot_switch(self):
+        self.battle.request_json[constants.ACTIVE][0][constants.MAYBE_TRAPPED] = True
+        self.assertEqual(["thunderbolt", "voltswitch"], legal_actions(self.battle))
+
+    def test_force_switch_with_one_living_reserve(self):
+        self.battle.request_json[constants.FORCE_SWITCH] = [True]
+        self.battle.request_json[constants.SIDE][constants.POKEMON][2][
+            constants.CONDITION
+        ] = "0 fnt"
+        self.assertEqual(["switch charmander"], legal_actions(self.battle))
+
+    def test_revival_blessing_chooses_a_fainted_pokemon(self):
+        self.battle.request_json[constants.FORCE_SWITCH] = [True]
+        side_pokemon = self.battle.request_json[constants.SIDE][constants.POKEMON]
+        side_pokemon[0][constants.REVIVING] = True
+        side_pokemon[2][constants.CONDITION] = "0 fnt"
+        self.assertEqual(["switch squirtle"], legal_actions(self.battle))
+
+    def test_terastallizing_doubles_the_moves(self):
+        self.battle.request_json[constants.ACTIVE][0][constants.TRAPPED] = True
+        self.battle.request_json[constants.ACTIVE][0][constants.CAN_TERASTALLIZE] = (
+            "electric"
+        )
+        self.assertEqual(
+            ["thunderbolt", "voltswitch", "thunderbolt-tera", "voltswitch-tera"],
+            legal_actions(self.battle),
+        )
+
+    def test_lock_moves_removes_moves_the_request_allows(self):
+        self.battle.user.active.add_move("fakeout")
+        self.battle.user.last_used_move = LastUsedMove("pikachu", "thunderbolt", 1)
+        self.battle.request_json[constants.ACTIVE][0][constants.TRAPPED] = True
+        self.battle.request_json[constants.ACTIVE][0][constants.MOVES] = [
+            request_move("thunderbolt"),
+            request_move("fakeout"),
+        ]
+        self.assertEqual(["thunderbolt"], legal_actions(self.battle))
+        self.assertFalse(self.battle.user.active.get_move("fakeout").disabled)
+
+    def test_lock_moves_does_not_remove_every_move(self):
+        self.battle.user.active.add_move("fakeout")
+        self.battle.user.last_used_move = LastUsedMove("pikachu", "fakeout", 1)
+        self.battle.request_json[constants.ACTIVE][0][constants.TRAPPED] = True
+        self.battle.request_json[constants.ACTIVE][0][constants.MOVES] = [
+            request_move("fakeout"),
+        ]
+        self.assertEqual(["fakeout"], legal_actions(self.battle))
+
+    def test_locked_into_recharge(self):
+        self.battle.request_json[constants.ACTIVE][0] = {
+            constants.MOVES: [request_move("recharge")],
+            constants.TRAPPED: True,
+        }
+        self.assertEqual(["recharge"], legal_actions(self.battle))
+
+    def test_nothing_to_decide_while_waiting(self):
+        self.battle.request_json[constants.WAIT] = True
+        self.assertEqual([], legal_actions(self.battle))
+
+    def test_nothing_to_decide_without_a_request(self):
+        self.battle.request_json = None
+        self.assertEqual([], legal_actions(self.battle))
@@ -0,0 +1,208 @@
+import unittest
+from unittest import mock
+
+import constants
+from fp.battle import Battle
+from fp.battle import Pokemon
+from fp.search import ponder
+from fp.search.ponder import BattlePonderer
+from fp.search.ponder import Ponderers
+from fp.search.ponder import approximate_next_battle
+from fp.search.ponder import likely_opponent_replies
+from fp.search.ponder import ponder_key
+from fp.search.ponder import restrict_to_moves
+from fp.search.transposition import MctsMoveSummary
+from fp.search.transposition import MctsSummary
+from tests.search_helpers import summary
+
+
+class TestLikelyOpponentReplies(unittest.TestCase):
+    def test_replies_are_ordered_by_sample_chance_weighted_visits(self):
+        mcts_results = [
+            (
+                summary({"tackle": 100}, {"earthquake": 60, "switch dragapult": 40}),
+                0.25,
+                0,
+            ),
+            (
+                summary(
+                    {"tackle": 100},
+                    {"earthquake": 10, "switch dragapult": 50, "swordsdance": 40},
+                ),
+                0.75,
+                1,
+            ),
+        ]
+
+        self.assertEqual(
+            ["switch dragapult", "swordsdance"],
+            likely_opponent_replies(mcts_results, 2),
+        )
+
+
+class TestPonderKey(unittest.TestCase):
+    def setUp(self):
+        self.battle = Battle(None)
+        self.battle.user.active = Pokemon("pikachu", 100)
+        self.battle.opponent.active = Pokemon("garchomp", 100)
+
+    def test_small_hp_differences_give_the_same_key(self):
+        key = ponder_key(self.battle)
+        self.battle.opponent.active.hp -= 5
+
+        self.assertEqual(key, ponder_key(self.battle))
+
+    def test_different_active_pkmn_give_different_keys(self):
+        key = ponder_key(self.battle)
+        self.battle.opponent.active = Pokemon("dragapult", 100)
+
+        self.assertNotEqual(key, ponder_key(self.battle))
+
+    def test_boosts_status_and_side_conditions_are_part_of_the_key(self):
+        key = ponder_key(self.battle)
+
+        self.battle.opponent.active.boosts[constants.ATTACK] = 2
+        boosted_key = ponder_key(self.battle)
+        self.battle.user.active.status = constants.PARALYZED
+        paralyzed_key = ponder_key(self.battle)
+        self.battle.user.side_conditions[constants.STEALTH_ROCK] = 1
+        stealthrock_key = ponder_key(self.battle)
+
+        self.assertEqual(4, len({key, boosted_key, paralyzed_key, stealthrock_key}))
+
+    def test_unboosted_stats_do_not_change_the_key(self):
+        key = ponder_key(self.battle)
+        self.battle.opponent.active.boosts[constants.ATTACK] = 0
+
+        self.assertEqual(key, ponder_key(self.battle))
+
+
+class TestRestrictToMoves(unittest.TestCase):
+    def test_moves_that_were_not_searched_are_dropped(self):
+        pondered = MctsSummary(
+            side_one=[
+                MctsMoveSummary("thunderbolt", 6, 10),
+                MctsMoveSummary("voltswitch", 3, 30),
+            ],
+            side_two=[],
+            total_visits=40,
+        )
+
+        [(restricted, chance, index)] = restrict_to_moves(
+            [(pondered, 0.5, "ponder-0")], {"thunderbolt"}
+        )
+
+        self.assertEqual(["thunderbolt"], [o.move_choice for o in restricted.side_one])
+        self.assertEqual(10, restricted.total_visits)
+        self.assertEqual((0.5, "ponder-0"), (chance, index))
+
+    def test_search_without_any_searched_move_is_dropped(self):
+        pondered = MctsSummary(
+            side_one=[MctsMoveSummary("voltswitch", 3, 30)],
+            side_two=[],
+            total_visits=30,
+        )
+
+        self.assertEqual(
+            [], restrict_to_moves([(pondered, 0.5, "ponder-0")], {"thunderbolt"})
+        )
+
+
+class TestBattlePonderer(unittest.TestCase):
+    def test_pondered_battles_are_not_drawn_from_the_belief(self):
+        battle = Battle("battle-1")
+        prepare_states = mock.Mock(return_value=([], 100))
+        for patcher in [
+            mock.patch.object(ponder, "approximate_next_battle", return_value=battle),
+            mock.patch.object(ponder, "prepare_states", prepare_states),
+            mock.patch.object(ponder, "ponder_key", return_value=()),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        BattlePonderer()._ponder(battle, "thunderbolt", ["earthquake"], 0)
+
+        prepare_states.assert_called_once_with(battle, use_belief=False)
+
+
+class TestPonderers(unittest.TestCase):
+    def tearDown(self):
+        Ponderers.remove("battle-1")
+        Ponderers.remove("battle-2")
+
+    def test_each_battle_has_its_own_ponderer(self):
+        self.assertIs(
+            Ponderers.for_battle("battle-1"), Ponderers.for_battle("battle-1")
+        )
+        self.assertIsNot(
+            Ponderers.for_battle("battle-1"), Ponderers.for_battle("battle-2")
+        )
+
+    def test_cancelling_one_battle_keeps_the_other_battles_searches(self):
+        fut = mock.Mock()
+        Ponderers.for_battle("battle-2")._branches = {"key": [(fut, 1)]}
+
+        Ponderers.for_battle("battle-1").cancel()
+        fut.cancel.assert_not_called()
+
+        Ponderers.remove("battle-2")
+        fut.cancel.assert_called_once()
+
+
+class TestApproximateNextBattle(unittest.TestCase):
+    def setUp(self):
+        self.battle = Battle(None)
+        self.battle.user.active = Pokemon("pikachu", 100)
+        self.battle.opponent.active = Pokemon("garchomp", 100)
+        for move in ["thunderbolt", "voltswitch"]:
+            self.battle.user.active.add_move(move)
+
+        patcher = mock.patch.object(
+            ponder, "poke_engine_get_damage_rolls", return_value=([], [])
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_terastallizing_is_kept(self):
+        self.battle.user.active.can_terastallize = True
+        next_battle = approximate_next_battle(
+            self.battle, "thunderbolt-tera", "earthquake"
+        )
+
+        self.assertTrue(next_battle.user.active.terastallized)
+        self.assertFalse(next_battle.user.active.can_terastallize)
+        self.assertFalse(self.battle.user.active.terastallized)
+
+    def test_choice_item_locks_the_move_used(self):
+        self.battle.user.active.item = "choicespecs"
+        next_battle = approximate_next_battle(self.battle, "thunderbolt", "earthquake")
+
+        self.assertEqual("thunderbolt", next_battle.user.last_used_move.move)
+        self.assertEqual(
+            ["voltswitch"],
+            [m.name for m in next_battle.user.active.moves if m.disabled],
+        )
+        self.assertEqual("earthquake", next_battle.opponent.last_used_move.move)
+
+    def test_switching_is_the_last_used_move(self):
+        self.battle.user.reserve.append(Pokemon("raichu", 100))
+        next_battle = approximate_next_battle(
+            self.battle, "switch raichu", "earthquake"
+        )
+
+        self.assertEqual("switch raichu", next_battle.user.last_used_move.move)
+        self.assertIsNone(next_battle.user.last_used_move.pokemon_name)
+
+    def test_switching_to_a_pkmn_that_is_not_in_reserve_cannot_be_approximated(self):
+        self.assertIsNone(
+            approximate_next_battle(self.battle, "switch raichu", "earthquake")
+        )
+
+    def test_switching_to_a_fainted_pkmn_cannot_be_approximated(self):
+        raichu = Pokemon("raichu", 100)
+        raichu.hp = 0
+        self.battle.user.reserve.append(raichu)
+
+        self.assertIsNone(
+            approximate_next_battle(self.battle, "switch raichu", "earthquake")
+        )
@@ -0,0 +1,61 @@
+import unittest
+
+import constants
+from fp.battle import Battle
+from fp.battle import Pokemon
+from porygonz import LLMPokemonPlayer
+from tests.test_legal_actions import request_move
+from tests.test_legal_actions import request_pokemon
+
+
+class TestPromptChoices(unittest.TestCase):
+    def setUp(self):
+        # the prompt does not need the model
+        self.player = LLMPokemonPlayer.__new__(LLMPokemonPlayer)
+        self.battle = Battle(None)
+        self.battle.user.active = Pokemon("pikachu", 80)
+        self.battle.user.active.add_move("thunderbolt")
+        self.battle.user.active.add_move("voltswitch")
+        self.battle.user.reserve = [
+            Pokemon("charmander", 80),
+            Pokemon("squirtle", 80),
+        ]
+        self.battle.opponent.active = Pokemon("bulbasaur", 80)
+
+    def test_team_preview_prompt_offers_the_reserve(self):
+        self.battle.user.active = Pokemon.get_dummy()
+        self.battle.opponent.active = Pokemon.get_dummy()
+        self.battle.team_preview = True
+
+        prompt = self.player.battle_state_to_prompt(self.battle)
+
+        self.assertIn("Switches: ['charmander', 'squirtle']", prompt)
+
+    def test_prompt_without_a_request_offers_every_move(self):
+        self.assertEqual(
+            ["thunderbolt", "voltswitch"], self.player._legal_moves(self.battle)
+        )
+
+    def test_prompt_offers_what_the_request_allows(self):
+        self.battle.request_json = {
+            constants.ACTIVE: [
+                {
+                    constants.MOVES: [
+                        request_move("thunderbolt"),
+                        request_move("voltswitch", disabled=True),
+                    ]
+                }
+            ],
+            constants.SIDE: {
+                constants.POKEMON: [
+                    request_pokemon("pikachu", "100/100", active=True),
+                    request_pokemon("charmander", "0 fnt"),
+                    request_pokemon("squirtle", "100/100"),
+                ]
+            },
+        }
+
+        self.assertEqual(["thunderbolt"], self.player._legal_moves(self.battle))
+        self.assertEqual(
+            ["squirtle"], [p.name for p in self.player._legal_switches(self.battle)]
+        )
@@ -0,0 +1,109 @@
+import random
+import unittest
+
+from constants import BattleType
+from data.pkmn_sets import RandomBattleTeamDatasets
+from fp.battle import Battle
+from fp.battle import Pokemon
+from fp.helpers import POKEMON_TYPE_INDICES
+from fp.helpers import is_super_effective
+from fp.helpers import type_effectiveness_modifier
+from fp.search.random_battles import iter_random_battles
+from fp.search.random_battles import sample_randombattle_pokemon
+from fp.search.random_battles import team_breaks_type_limits
+from fp.search.random_battles import team_type_profile
+from fp.search.set_sampler import SetSamplers
+
+
+def opponent_team(battle: Battle) -> list:
+    return [
+        (p.name, p.item, p.ability, p.tera_type, sorted(m.name for m in p.moves))
+        for p in [battle.opponent.active] + battle.opponent.reserve
+    ]
+
+
+class TestIterRandomBattlesWithSeed(unittest.TestCase):
+    def setUp(self):
+        RandomBattleTeamDatasets.initialize("gen9")
+        self.battle = Battle("battle-gen9randombattle-1")
+        self.battle.battle_type = BattleType.RANDOM_BATTLE
+        self.battle.generation = "gen9"
+        self.battle.pokemon_format = "gen9randombattle"
+        self.battle.user.active = Pokemon("pikachu", 92)
+        self.battle.opponent.active = Pokemon("garchomp", 77)
+        self.battle.opponent.reserve.append(Pokemon("dragapult", 76))
+
+    def sample(self, seed: int, num_battles: int) -> list:
+        battles = iter_random_battles(self.battle, num_battles, rng=random.Random(seed))
+        return [opponent_team(b) for b, _ in battles]
+
+    def test_same_seed_samples_the_same_battles(self):
+        self.assertEqual(self.sample(1, 3), self.sample(1, 3))
+
+    def test_different_seeds_sample_different_battles(self):
+        self.assertNotEqual(self.sample(1, 3), self.sample(2, 3))
+
+    def test_sampled_battle_does_not_depend_on_how_many_are_sampled(self):
+        self.assertEqual(self.sample(1, 2), self.sample(1, 4)[:2])
+
+    def test_samplers_are_reused_by_the_next_decision_of_the_turn(self):
+        SetSamplers.clear()
+        self.addCleanup(SetSamplers.clear)
+
+        self.sample(1, 3)
+        self.assertEqual((0, 2), (SetSamplers.hits, SetSamplers.misses))
+
+        # another seed shuffles the sets into another order
+        self.sample(2, 3)
+        self.assertEqual((2, 2), (SetSamplers.hits, SetSamplers.misses))
+
+    def test_iterating_samples_the_same_battles_one_at_a_time(self):
+        battles = iter_random_battles(self.battle, 3, rng=random.Random(1))
+        first, chance = next(battles)
+
+        self.assertEqual(1 / 3, chance)
+        self.assertEqual(
+            self.sample(1, 3),
+            [opponent_team(first)] + [opponent_team(b) for b, _ in battles],
+        )
+
+
+def breaks_type_limits(team: list[Pokemon]) -> bool:
+    for t in POKEMON_TYPE_INDICES:
+        if sum(is_super_effective(t, p.types) for p in team) > 3:
+            return True
+        if sum(p.types[:2].count(t) for p in team) > 2:
+            return True
+        if sum(type_effectiveness_modifier(t, p.types) == 4 for p in team) > 1:
+            return True
+    return False
+
+
+class TestRandomBattleTypeLimits(unittest.TestCase):
+    def setUp(self):
+        RandomBattleTeamDatasets.initialize("gen9")
+
+    def test_type_profile_agrees_with_counting_every_type(self):
+        rng = random.Random(0)
+        names = list(RandomBattleTeamDatasets.pkmn_sets)
+        for _ in range(300):
+            team = [Pokemon(name, 80) for name in rng.sample(names, rng.randint(1, 6))]
+            self.assertEqual(
+                breaks_type_limits(team),
+                team_breaks_type_limits(team_type_profile(team)),
+            )
+
+    def test_four_pokemon_weak_to_ground_break_the_limits(self):
+        team = [Pokemon(name, 80) for name in ["pikachu", "arcanine", "tyranitar"]]
+        self.assertFalse(team_breaks_type_limits(team_type_profile(team)))
+
+        team.append(Pokemon("magnezone", 80))
+        self.assertTrue(team_breaks_type_limits(team_type_profile(team)))
+
+    def test_sampled_pokemon_keeps_the_team_within_the_limits(self):
+        rng = random.Random(0)
+        team = [Pokemon(name, 80) for name in ["pikachu", "arcanine", "tyranitar"]]
+        for _ in range(50):
+            pkmn = sample_randombattle_pokemon(team, rng=rng)
+            self.assertNotIn(pkmn.name, [p.name for p in team])
+            self.assertFalse(breaks_type_limits(team + [pkmn]))
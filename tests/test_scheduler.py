@@ -0,0 +1,115 @@
+import unittest
+from concurrent.futures import Future
+from unittest import mock
+
+from config import FoulPlayConfig
+from fp.battle import Battle
+from fp.battle import Pokemon
+from fp.search import scheduler
+from fp.search.scheduler import _SearchScheduler
+from fp.search.scheduler import turn_criticality
+
+
+class FakeWorkerPool:
+    """Records what was submitted and lets the test decide when each search finishes"""
+
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, fn, *args):
+        fut = Future()
+        fut.set_running_or_notify_cancel()
+        self.submitted.append((args, fut))
+        return fut
+
+    def finish(self, i, result=None):
+        self.submitted[i][1].set_result(result)
+
+
+class TestSearchScheduler(unittest.TestCase):
+    def setUp(self):
+        self.original_parallelism = getattr(FoulPlayConfig, "parallelism", None)
+        FoulPlayConfig.parallelism = 2
+        self.pool = FakeWorkerPool()
+        patcher = mock.patch.object(scheduler, "SearchWorkerPool", self.pool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.scheduler = _SearchScheduler()
+
+    def tearDown(self):
+        FoulPlayConfig.parallelism = self.original_parallelism
+
+    def submitted_names(self):
+        return [args[0] for args, _ in self.pool.submitted]
+
+    def test_no_more_than_parallelism_searches_run_at_once(self):
+        for name in ["a", "b", "c"]:
+            self.scheduler.submit(print, name)
+
+        self.assertEqual(["a", "b"], self.submitted_names())
+        self.assertEqual(1, self.scheduler.queue_depth())
+
+    def test_next_search_starts_when_one_finishes(self):
+        futures = [self.scheduler.submit(print, name) for name in ["a", "b", "c"]]
+        self.pool.finish(0, "result a")
+
+        self.assertEqual("result a", futures[0].result(timeout=0))
+        self.assertEqual(["a", "b", "c"], self.submitted_names())
+
+    def test_earliest_deadline_starts_first(self):
+        self.scheduler.submit(print, "a")
+        self.scheduler.submit(print, "b")
+        self.scheduler.submit(print, "late", deadline=200, battle_tag="battle-1")
+        self.scheduler.submit(print, "early", deadline=100, battle_tag="battle-2")
+        self.pool.finish(0)
+
+        self.assertEqual("early", self.submitted_names()[2])
+        self.assertEqual({"battle-1": 1}, self.scheduler.stats()["pending_by_battle"])
+
+    def test_critical_turn_starts_first(self):
+        self.scheduler.submit(print, "a")
+        self.scheduler.submit(print, "b")
+        self.scheduler.submit(print, "calm", deadline=100)
+        self.scheduler.submit(print, "critical", deadline=100, criticality=1)
+        self.pool.finish(0)
+
+        self.assertEqual("critical", self.submitted_names()[2])
+
+    def test_background_searches_wait_for_everything_else(self):
+        self.scheduler.submit(print, "a")
+        self.scheduler.submit(print, "b")
+        self.scheduler.submit(print, "ponder", deadline=0, background=True)
+        self.scheduler.submit(print, "search", deadline=100)
+        self.pool.finish(0)
+
+        self.assertEqual("search", self.submitted_names()[2])
+
+    def test_cancelled_search_never_starts(self):
+        self.scheduler.submit(print, "a")
+        self.scheduler.submit(print, "b")
+        self.scheduler.submit(print, "c").cancel()
+        self.scheduler.submit(print, "d")
+        self.pool.finish(0)
+
+        self.assertEqual(["a", "b", "d"], self.submitted_names())
+
+    def test_worker_exception_is_passed_on(self):
+        fut = self.scheduler.submit(print, "a")
+        self.pool.submitted[0][1].set_exception(RuntimeError("worker died"))
+
+        self.assertIsInstance(fut.exception(timeout=0), RuntimeError)
+        self.assertEqual(0, self.scheduler.stats()["in_flight"])
+
+
+class TestTurnCriticality(unittest.TestCase):
+    def test_criticality_is_the_fraction_of_fainted_pokemon(self):
+        battle = Battle(None)
+        battle.user.active = Pokemon("pikachu", 100)
+        battle.user.reserve = [Pokemon("charmander", 100)]
+        battle.opponent.active = Pokemon("squirtle", 100)
+        battle.opponent.reserve = [Pokemon("bulbasaur", 100)]
+        self.assertEqual(0, turn_criticality(battle))
+
+        battle.user.reserve[0].hp = 0
+        battle.opponent.reserve[0].hp = 0
+        self.assertEqual(0.5, turn_criticality(battle))
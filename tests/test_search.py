@@ -0,0 +1,478 @@
+import time
+import unittest
+from concurrent.futures import CancelledError, Future
+from concurrent.futures.process import BrokenProcessPool
+from unittest import mock
+
+from config import FoulPlayConfig
+from config import SearchAggregation
+from config import SearchBackend
+from constants import BattleType
+from data.pkmn_sets import RandomBattleTeamDatasets
+from fp.battle import Battle
+from fp.battle import Pokemon
+from fp.search import main
+from fp.search import ponder
+from fp.search import scheduler
+from fp.search.main import _search_all_moves
+from fp.search.main import _search_sampled
+from fp.search.main import collect_searches
+from fp.search.main import deduplicate_states
+from fp.search.main import find_best_move
+from fp.search.main import iter_states
+from fp.search.main import next_world_index
+from fp.search.main import search_endgame
+from fp.search.main import search_states
+from fp.search.main import search_time_after_deduplication
+from fp.search.main import worlds_for_uncertainty
+from fp.search.endgame import EndgameTable
+from fp.search.endgame import ExpectiminimaxSummary
+from fp.search.lead_cache import LeadPolicy
+from fp.search.scheduler import _SearchScheduler
+from fp.search.telemetry import SearchTelemetry
+from fp.search.transposition import TranspositionTable
+from tests.search_helpers import summary
+
+
+class RestartingWorkerPool:
+    """
+    Finishes every search as soon as it is submitted, except searches of the states
+    in `cancelled`, which are cancelled as if the pool was restarted before they ran
+    """
+
+    def __init__(self, cancelled=()):
+        self.cancelled = set(cancelled)
+        self.submitted = []
+
+    def submit(self, fn, *args):
+        fut = Future()
+        if args and args[0] in self.cancelled:
+            fut.cancel()
+        elif args:
+            fut.set_result(summary({"tackle": 10}))
+        self.submitted.append(args)
+        return fut
+
+
+class TestSearchStates(unittest.TestCase):
+    def setUp(self):
+        self.original_parallelism = getattr(FoulPlayConfig, "parallelism", None)
+        self.original_search_workers = FoulPlayConfig.search_workers
+        FoulPlayConfig.parallelism = 2
+        FoulPlayConfig.search_workers = []
+        TranspositionTable.clear()
+        self.addCleanup(TranspositionTable.clear)
+
+    def tearDown(self):
+        FoulPlayConfig.parallelism = self.original_parallelism
+        FoulPlayConfig.search_workers = self.original_search_workers
+
+    def use_pool(self, pool):
+        search_scheduler = _SearchScheduler()
+        for patcher in [
+            mock.patch.object(scheduler, "SearchWorkerPool", pool),
+            mock.patch.object(main, "SearchScheduler", search_scheduler),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        return search_scheduler
+
+    def test_searches_cancelled_by_a_pool_restart_are_dropped(self):
+        search_scheduler = self.use_pool(RestartingWorkerPool(cancelled=["state b"]))
+        # another battle's search holds one worker, so this battle's searches queue
+        other_battle = search_scheduler.submit(print, battle_tag="battle-2")
+
+        mcts_results = search_states([("state a", 0.5), ("state b", 0.5)], 100)
+
+        self.assertEqual([(0.5, 0)], [(c, i) for _, c, i in mcts_results])
+        self.assertFalse(other_battle.done())
+
+    def test_state_sampled_again_is_one_world_with_both_chances(self):
+        self.use_pool(RestartingWorkerPool())
+
+        mcts_results = search_states(
+            [("state a", 0.25), ("state b", 0.25), ("state a", 0.5)], 100
+        )
+
+        self.assertEqual([(0.75, 0), (0.25, 1)], [(c, i) for _, c, i in mcts_results])
+
+    def test_time_planned_for_repeated_states_is_given_to_the_others(self):
+        pool = RestartingWorkerPool()
+        self.use_pool(pool)
+
+        # 4 states take 2 waves of 2 workers, the 2 distinct ones only take 1
+        mcts_results = search_states(
+            [
+                ("state a", 0.25),
+                ("state b", 0.25),
+                ("state a", 0.25),
+                ("state b", 0.25),
+            ],
+            100,
+        )
+
+        self.assertEqual(
+            [("state a", 100), ("state b", 100), ("state a", 100), ("state b", 100)],
+            [args[:2] for args in pool.submitted],
+        )
+        # both searches of a state are merged into its world
+        self.assertEqual(
+            [20, 20], [mcts_result.total_visits for mcts_result, _, _ in mcts_results]
+        )
+
+    def test_no_follow_up_search_without_repeated_states(self):
+        pool = RestartingWorkerPool()
+        self.use_pool(pool)
+
+        search_states([("state a", 0.5), ("state b", 0.5)], 100)
+
+        self.assertEqual(["state a", "state b"], [args[0] for args in pool.submitted])
+
+
+class TestCollectSearches(unittest.TestCase):
+    def setUp(self):
+        self.collected = []
+
+    def collect(self, fut, result):
+        self.collected.append(result)
+
+    def test_cancelled_searches_are_dropped(self):
+        finished, cancelled = Future(), Future()
+        finished.set_result("a")
+        # as the scheduler does when the worker pool restarts
+        cancelled.set_exception(CancelledError())
+
+        num_collected = collect_searches({finished: 0, cancelled: 1}, self.collect)
+
+        self.assertEqual(1, num_collected)
+        self.assertEqual(["a"], self.collected)
+
+    def test_waiting_for_the_first_search_after_the_deadline_is_bounded(self):
+        never_finishes = Future()
+
+        started = time.monotonic()
+        num_collected = collect_searches(
+            {never_finishes: 0},
+            self.collect,
+            deadline=time.monotonic(),
+            late_ms=50,
+        )
+
+        self.assertEqual(0, num_collected)
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertTrue(never_finishes.cancelled())
+
+    def test_searches_left_are_cancelled_when_stopping_early(self):
+        finished, running = Future(), Future()
+        finished.set_result("a")
+
+        collect_searches(
+            {finished: 0, running: 1}, self.collect, stop_early=lambda: True
+        )
+
+        self.assertEqual(["a"], self.collected)
+        self.assertTrue(running.cancelled())
+
+
+class TestSearchEndgame(unittest.TestCase):
+    def setUp(self):
+        self.battle = Battle("battle-gen9randombattle-1")
+        self.result = ExpectiminimaxSummary(["tackle"], ["growl"], [0.5], 3)
+        self.worker_pool = mock.Mock()
+        self.scheduler = mock.Mock()
+        self.scheduler.submit.side_effect = self.submit
+        self.outcomes = []
+        for patcher in [
+            mock.patch.object(
+                main, "prepare_states", return_value=([("state a", 1)], 100)
+            ),
+            mock.patch.object(main, "SearchScheduler", self.scheduler),
+            mock.patch.object(main, "SearchWorkerPool", self.worker_pool),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        EndgameTable.clear()
+        self.addCleanup(EndgameTable.clear)
+
+    def submit(self, fn, *args, **kwargs):
+        fut = Future()
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, BaseException):
+            fut.set_exception(outcome)
+        else:
+            fut.set_result(outcome)
+        return fut
+
+    def test_search_is_retried_once_after_a_worker_dies(self):
+        self.outcomes = [BrokenProcessPool(), self.result]
+
+        policy = search_endgame(self.battle)
+
+        self.assertEqual({"tackle": 0.5}, policy)
+        self.worker_pool.restart.assert_called_once()
+
+    def test_no_policy_when_every_search_was_cancelled(self):
+        self.outcomes = [CancelledError()]
+        telemetry = SearchTelemetry()
+
+        self.assertEqual({}, search_endgame(self.battle, telemetry=telemetry))
+        self.assertIsNone(telemetry.search_depth)
+
+
+class TestIterStates(unittest.TestCase):
+    def setUp(self):
+        self.original_particles = FoulPlayConfig.search_belief_particles
+        FoulPlayConfig.search_belief_particles = 16
+        self.battle = Battle("battle-gen9randombattle-1")
+        self.battle.battle_type = BattleType.RANDOM_BATTLE
+        self.beliefs = mock.Mock()
+        self.beliefs.sample_battles.return_value = iter([])
+        self.random_battles = mock.Mock(return_value=iter([]))
+        for patcher in [
+            mock.patch.object(main, "Beliefs", self.beliefs),
+            mock.patch.object(main, "iter_random_battles", self.random_battles),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        FoulPlayConfig.search_belief_particles = self.original_particles
+
+    def test_battles_are_drawn_from_the_belief(self):
+        list(iter_states(self.battle, 4))
+
+        self.beliefs.sample_battles.assert_called_once()
+        self.random_battles.assert_not_called()
+
+    def test_battles_are_sampled_from_scratch_without_the_belief(self):
+        list(iter_states(self.battle, 4, use_belief=False))
+
+        self.beliefs.sample_battles.assert_not_called()
+        self.random_battles.assert_called_once()
+
+
+class TestExtraWave(unittest.TestCase):
+    def setUp(self):
+        self.original_parallelism = getattr(FoulPlayConfig, "parallelism", None)
+        FoulPlayConfig.parallelism = 2
+        self.battle = Battle("battle-gen9randombattle-1")
+        # the two worlds disagree on what to do
+        self.disagreeing = [
+            (summary({"tackle": 90, "growl": 10}), 0.5, 0),
+            (summary({"tackle": 10, "growl": 90}), 0.5, 1),
+        ]
+        patcher = mock.patch.object(
+            main, "_search_sampled", return_value=self.disagreeing
+        )
+        self.search_sampled = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        FoulPlayConfig.parallelism = self.original_parallelism
+
+    def test_extra_wave_without_a_deadline_gets_the_time_held_back(self):
+        # 4 battles take 2 waves of 2 workers, a quarter of each is held back
+        mcts_results = _search_all_moves(self.battle, 4, 100)
+
+        self.assertEqual(
+            [(4, 75), (2, 50)],
+            [c.args[1:3] for c in self.search_sampled.call_args_list],
+        )
+        self.assertEqual(4, len(mcts_results))
+        self.assertAlmostEqual(1, sum(chance for _, chance, _ in mcts_results))
+
+    def test_time_held_back_is_not_spent_when_the_worlds_agree(self):
+        agreeing = [
+            (summary({"tackle": 90, "growl": 10}), 0.5, 0),
+            (summary({"tackle": 90, "growl": 10}), 0.5, 1),
+        ]
+        self.search_sampled.return_value = agreeing
+
+        self.assertEqual(agreeing, _search_all_moves(self.battle, 4, 100))
+        self.search_sampled.assert_called_once()
+
+    def test_no_extra_wave_when_nothing_was_searched(self):
+        self.search_sampled.return_value = []
+
+        self.assertEqual(
+            [], _search_all_moves(self.battle, 2, 100, deadline=time.monotonic() + 10)
+        )
+        self.search_sampled.assert_called_once()
+
+    def test_next_world_index(self):
+        self.assertEqual(2, next_world_index(self.disagreeing))
+        self.assertEqual(0, next_world_index([]))
+
+
+class TestWorldsForUncertainty(unittest.TestCase):
+    def setUp(self):
+        self.original_parallelism = getattr(FoulPlayConfig, "parallelism", None)
+        FoulPlayConfig.parallelism = 4
+        RandomBattleTeamDatasets.initialize("gen9")
+        self.battle = Battle("battle-gen9randombattle-1")
+        self.battle.battle_type = BattleType.RANDOM_BATTLE
+        team = ["garchomp", "dragapult", "corviknight", "gholdengo", "kingambit"]
+        self.battle.opponent.active = Pokemon("greattusk", 80)
+        self.battle.opponent.reserve = [Pokemon(name, 80) for name in team]
+
+    def tearDown(self):
+        FoulPlayConfig.parallelism = self.original_parallelism
+
+    def test_fewer_worlds_as_the_opponent_team_is_revealed_and_fainted(self):
+        num_worlds = []
+        for fainted in range(len(self.battle.opponent.reserve) + 1):
+            for pkmn in self.battle.opponent.reserve[:fainted]:
+                pkmn.hp = 0
+            num_worlds.append(worlds_for_uncertainty(self.battle, 16, 100)[0])
+
+        self.assertEqual(sorted(num_worlds, reverse=True), num_worlds)
+        self.assertLess(num_worlds[-1], num_worlds[0])
+        # more than two different amounts over the battle
+        self.assertGreater(len(set(num_worlds)), 2)
+
+    def test_unrevealed_opponents_sample_the_most_worlds(self):
+        self.battle.opponent.reserve = []
+
+        self.assertEqual((16, 100), worlds_for_uncertainty(self.battle, 16, 100))
+
+
+class TestDeduplicateStates(unittest.TestCase):
+    def setUp(self):
+        self.original_parallelism = getattr(FoulPlayConfig, "parallelism", None)
+        FoulPlayConfig.parallelism = 2
+
+    def tearDown(self):
+        FoulPlayConfig.parallelism = self.original_parallelism
+
+    def test_same_states_are_merged_summing_their_chances(self):
+        states = deduplicate_states(
+            [("state a", 0.25), ("state b", 0.25), ("state a", 0.25), ("state c", 0.25)]
+        )
+
+        self.assertEqual(
+            [("state a", 0.5), ("state b", 0.25), ("state c", 0.25)], states
+        )
+
+    def test_freed_waves_are_given_to_the_distinct_states(self):
+        # 8 states take 4 waves of 2 workers, the 3 distinct ones only take 2
+        self.assertEqual(200, search_time_after_deduplication(8, 3, 100))
+
+    def test_no_time_is_freed_when_the_number_of_waves_is_the_same(self):
+        self.assertEqual(100, search_time_after_deduplication(4, 3, 100))
+
+
+class TestSearchSampledRetry(unittest.TestCase):
+    def setUp(self):
+        self.original_parallelism = getattr(FoulPlayConfig, "parallelism", None)
+        FoulPlayConfig.parallelism = 2
+        self.battle = Battle("battle-gen9randombattle-1")
+        self.states = [("state a", 0.5), ("state b", 0.5)]
+        self.mcts_results = [(summary({"tackle": 10}), 1, 0)]
+        self.worker_pool = mock.Mock()
+        for patcher in [
+            mock.patch.object(main, "iter_states", return_value=iter(self.states)),
+            mock.patch.object(main, "SearchWorkerPool", self.worker_pool),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        FoulPlayConfig.parallelism = self.original_parallelism
+
+    def test_search_is_retried_once_after_a_worker_dies(self):
+        searched = []
+
+        def search_states(states, *args, **kwargs):
+            searched.append(list(states))
+            if len(searched) == 1:
+                raise BrokenProcessPool()
+            return self.mcts_results
+
+        with mock.patch.object(main, "search_states", side_effect=search_states):
+            mcts_results = _search_sampled(
+                self.battle, 2, 100, telemetry=SearchTelemetry()
+            )
+
+        self.assertEqual(self.mcts_results, mcts_results)
+        self.worker_pool.restart.assert_called_once()
+        # the retry searches the battles already sampled instead of sampling again
+        self.assertEqual([self.states, self.states], searched)
+
+    def test_sampling_is_not_counted_as_search_time(self):
+        def iter_states(battle, num_battles, telemetry, **kwargs):
+            for state in self.states:
+                with telemetry.phase("sampling"):
+                    time.sleep(0.05)
+                yield state
+
+        telemetry = SearchTelemetry()
+        with mock.patch.object(main, "iter_states", side_effect=iter_states):
+            with mock.patch.object(
+                main, "search_states", side_effect=lambda states, *_, **__: list(states)
+            ):
+                _search_sampled(self.battle, 2, 100, telemetry=telemetry)
+
+        self.assertGreaterEqual(telemetry.phases_ms["sampling"], 100)
+        self.assertLess(telemetry.phases_ms["search"], 50)
+
+    def test_search_is_not_retried_twice(self):
+        with mock.patch.object(main, "search_states", side_effect=BrokenProcessPool()):
+            with self.assertRaises(BrokenProcessPool):
+                _search_sampled(self.battle, 2, 100, telemetry=SearchTelemetry())
+
+
+class TestFindBestMove(unittest.TestCase):
+    def setUp(self):
+        self.original_ponder = FoulPlayConfig.ponder
+        self.original_aggregation = FoulPlayConfig.search_aggregation
+        FoulPlayConfig.ponder = True
+        FoulPlayConfig.search_aggregation = SearchAggregation.visit_weighted
+        self.battle = Battle("battle-gen9randombattle-1")
+        self.mcts_results = [(summary({"tackle": 90, "growl": 10}), 1, 0)]
+        self.ponderer = mock.Mock()
+        self.ponderer.collect.return_value = []
+        self.search_battle = mock.Mock(return_value=self.mcts_results)
+        self.search_endgame = mock.Mock(return_value={})
+        self.lead_cache = mock.Mock()
+        self.lead_cache.lookup.return_value = None
+        self.backend = mock.Mock(return_value=SearchBackend.mcts)
+        for patcher in [
+            mock.patch.object(main, "search_battle", self.search_battle),
+            mock.patch.object(main, "search_endgame", self.search_endgame),
+            mock.patch.object(main, "search_backend", self.backend),
+            mock.patch.object(main, "LeadCache", self.lead_cache),
+            mock.patch.object(main, "TelemetrySink", mock.Mock()),
+            mock.patch.object(ponder, "Ponderers", mock.Mock()),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        ponder.Ponderers.for_battle.return_value = self.ponderer
+
+    def tearDown(self):
+        FoulPlayConfig.ponder = self.original_ponder
+        FoulPlayConfig.search_aggregation = self.original_aggregation
+
+    def test_pondering_starts_from_the_chosen_move(self):
+        choice = find_best_move(self.battle)
+
+        self.assertEqual("tackle", choice)
+        self.ponderer.collect.assert_called_once_with(self.battle)
+        self.ponderer.start.assert_called_once_with(
+            self.battle, "tackle", self.mcts_results
+        )
+
+    def test_trusted_lead_policy_is_used_without_searching(self):
+        self.battle.team_preview = True
+        self.lead_cache.lookup.return_value = LeadPolicy(
+            {"switch pikachu": 1}, 100, SearchAggregation.visit_weighted, ""
+        )
+
+        self.assertEqual("switch pikachu", find_best_move(self.battle))
+        self.search_battle.assert_not_called()
+
+    def test_endgame_without_results_is_searched_with_mcts(self):
+        self.backend.return_value = SearchBackend.expectiminimax
+
+        self.assertEqual("tackle", find_best_move(self.battle))
+        self.ponderer.cancel.assert_called_once()
+        self.search_battle.assert_called_once()
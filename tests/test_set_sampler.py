@@ -0,0 +1,62 @@
+import random
+import unittest
+
+from fp.search.set_sampler import WeightedSampler
+from fp.search.set_sampler import _SetSamplers
+
+
+class TestWeightedSampler(unittest.TestCase):
+    def test_draws_the_same_as_random_choices(self):
+        items = ["a", "b", "c", "d"]
+        weights = [5, 1, 0, 3]
+        sampler = WeightedSampler(items, weights)
+
+        expected_rng = random.Random(1)
+        rng = random.Random(1)
+        for _ in range(200):
+            self.assertEqual(
+                expected_rng.choices(items, weights=weights)[0], sampler.sample(rng)
+            )
+
+    def test_item_without_weight_is_never_drawn(self):
+        sampler = WeightedSampler(["a", "b"], [0, 1])
+        rng = random.Random(0)
+        self.assertEqual({"b"}, {sampler.sample(rng) for _ in range(100)})
+
+    def test_sampling_without_weights_raises(self):
+        with self.assertRaises(ValueError):
+            WeightedSampler(["a"], [0]).sample()
+
+
+class TestSetSamplers(unittest.TestCase):
+    def setUp(self):
+        self.samplers = _SetSamplers()
+        self.sets = [[1], [2], [3]]
+
+    def get(self, turn_key, sets):
+        return self.samplers.get(turn_key, "pikachu", sets, lambda s: s[0])
+
+    def test_sampler_is_reused_within_a_turn(self):
+        sampler = self.get(("battle-1", 3), self.sets)
+        self.assertIs(sampler, self.get(("battle-1", 3), list(self.sets)))
+        self.assertEqual(1, self.samplers.hits)
+
+    def test_sampler_is_reused_for_the_same_sets_in_another_order(self):
+        sampler = self.get(("battle-1", 3), self.sets)
+        self.assertIs(sampler, self.get(("battle-1", 3), self.sets[::-1]))
+
+    def test_sampler_is_rebuilt_when_the_sets_change(self):
+        sampler = self.get(("battle-1", 3), self.sets)
+        self.assertIsNot(sampler, self.get(("battle-1", 3), self.sets[1:]))
+
+    def test_sampler_is_rebuilt_on_a_new_turn(self):
+        sampler = self.get(("battle-1", 3), self.sets)
+        self.assertIsNot(sampler, self.get(("battle-1", 4), self.sets))
+
+    def test_battles_have_their_own_samplers(self):
+        sampler = self.get(("battle-1", 3), self.sets)
+        self.assertIsNot(sampler, self.get(("battle-2", 3), self.sets))
+
+    def test_sampler_is_not_cached_without_a_turn(self):
+        self.assertIsNot(self.get(None, self.sets), self.get(None, self.sets))
+        self.assertEqual(0, self.samplers.misses)
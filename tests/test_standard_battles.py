@@ -0,0 +1,105 @@
+import random
+import unittest
+from unittest import mock
+
+from data.pkmn_sets import RAW_COUNT
+from data.pkmn_sets import TEAMMATES
+from data.pkmn_sets import _SmogonSets
+from fp.search import standard_battles
+from fp.search.standard_battles import _TeammateSamplers
+from fp.search.standard_battles import teammate_likelihoods
+
+
+def smogon_sets(all_pkmn_counts: dict) -> _SmogonSets:
+    smogon_sets = _SmogonSets()
+    smogon_sets.all_pkmn_counts = all_pkmn_counts
+    smogon_sets.teammate_rates = smogon_sets._get_teammate_rates()
+    return smogon_sets
+
+
+def random_pkmn_counts(rng, num_pkmn: int) -> dict:
+    names = ["pkmn{}".format(i) for i in range(num_pkmn)]
+    return {
+        name: {
+            RAW_COUNT: rng.randint(1, 100),
+            TEAMMATES: {
+                teammate: rng.randint(1, 5)
+                for teammate in rng.sample(names, rng.randint(0, 10))
+                if teammate != name
+            },
+        }
+        for name in names
+    }
+
+
+def brute_force_likelihoods(revealed: list[str], all_pkmn_counts: dict) -> dict:
+    """Scores every pokemon from the raw counts, leaving out the unlikely ones"""
+    likelihoods = {}
+    for pkmn in all_pkmn_counts:
+        if pkmn in revealed:
+            continue
+        rates = [
+            all_pkmn_counts[r][TEAMMATES].get(pkmn, 0) / all_pkmn_counts[r][RAW_COUNT]
+            for r in set(revealed)
+        ]
+        if sum(rates) > 0:
+            likelihoods[pkmn] = sum(rates) / len(rates)
+    return dict(sorted(likelihoods.items(), key=lambda x: x[1], reverse=True))
+
+
+class TestTeammateLikelihoods(unittest.TestCase):
+    def test_likelihoods_are_the_same_as_scoring_every_pokemon(self):
+        rng = random.Random(0)
+        for _ in range(50):
+            counts = random_pkmn_counts(rng, 30)
+            revealed = rng.sample(list(counts), rng.randint(1, 5))
+
+            expected = brute_force_likelihoods(revealed, counts)
+            likelihoods = teammate_likelihoods(
+                revealed, smogon_sets(counts).teammate_rates
+            )
+            self.assertEqual(list(expected.items()), list(likelihoods.items()))
+
+    def test_teammates_without_stats_are_left_out(self):
+        counts = {
+            "tyranitar": {RAW_COUNT: 10, TEAMMATES: {"excadrill": 5, "missingno": 5}},
+            "excadrill": {RAW_COUNT: 10, TEAMMATES: {}},
+        }
+        self.assertEqual(
+            {"excadrill": 0.5},
+            teammate_likelihoods(["tyranitar"], smogon_sets(counts).teammate_rates),
+        )
+
+
+class TestTeammateSamplers(unittest.TestCase):
+    def setUp(self):
+        self.smogon_sets = smogon_sets(
+            {
+                "tyranitar": {RAW_COUNT: 10, TEAMMATES: {"excadrill": 5, "latios": 1}},
+                "excadrill": {RAW_COUNT: 10, TEAMMATES: {"tyranitar": 5}},
+                "latios": {RAW_COUNT: 20, TEAMMATES: {}},
+            }
+        )
+        patcher = mock.patch.object(standard_battles, "SmogonSets", self.smogon_sets)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.samplers = _TeammateSamplers()
+
+    def test_sampler_is_memoized_for_the_same_revealed_pokemon(self):
+        sampler = self.samplers.get({"tyranitar"})
+        self.assertIs(sampler, self.samplers.get({"tyranitar"}))
+        self.assertEqual(["excadrill", "latios"], sampler.items)
+
+    def test_sampler_is_rebuilt_when_the_stats_change(self):
+        sampler = self.samplers.get({"tyranitar"})
+        self.smogon_sets.teammate_rates = self.smogon_sets._get_teammate_rates()
+        self.assertIsNot(sampler, self.samplers.get({"tyranitar"}))
+
+    def test_revealed_pokemon_are_never_sampled(self):
+        sampler = self.samplers.get({"tyranitar", "excadrill"})
+        rng = random.Random(0)
+        self.assertEqual({"latios"}, {sampler.sample(rng) for _ in range(50)})
+
+    def test_most_used_pokemon_are_sampled_without_teammate_stats(self):
+        sampler = self.samplers.get({"latios"})
+        self.assertEqual(["tyranitar", "excadrill"], sampler.items)
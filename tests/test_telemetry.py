@@ -0,0 +1,117 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+
+from config import FoulPlayConfig
+from fp.search.telemetry import SearchTelemetry
+from fp.search.telemetry import _TelemetrySink
+from fp.search.telemetry import policy_entropy
+from tests.search_helpers import summary
+
+
+class TestPolicyEntropy(unittest.TestCase):
+    def test_single_move_has_no_entropy(self):
+        self.assertEqual(0, policy_entropy({"tackle": 0.7}))
+
+    def test_uniform_policy_over_four_moves_has_two_bits(self):
+        self.assertAlmostEqual(
+            2, policy_entropy({"tackle": 1, "growl": 1, "leer": 1, "ember": 1})
+        )
+
+
+class TestSearchTelemetry(unittest.TestCase):
+    def test_phases_accumulate(self):
+        telemetry = SearchTelemetry()
+        with telemetry.phase("search"):
+            pass
+        first = telemetry.phases_ms["search"]
+        with telemetry.phase("search"):
+            pass
+
+        self.assertGreaterEqual(telemetry.phases_ms["search"], first)
+
+    def test_excluded_phases_are_not_counted_twice(self):
+        telemetry = SearchTelemetry()
+        with telemetry.phase("search", exclude=["sampling"]):
+            with telemetry.phase("sampling"):
+                time.sleep(0.05)
+
+        self.assertGreaterEqual(telemetry.phases_ms["sampling"], 50)
+        self.assertLess(telemetry.phases_ms["search"], 25)
+
+    def test_iterations_per_second_comes_from_engine_time(self):
+        telemetry = SearchTelemetry()
+        telemetry.add_world(
+            summary({"tackle": 5000}, search_ms=100), 0.5, 0, 100, cached=False
+        )
+
+        self.assertEqual(50000, telemetry.worlds[0].iterations_per_second)
+        self.assertEqual(5000, telemetry.worlds[0].iterations)
+
+    def test_ipc_is_search_time_not_spent_in_the_engine(self):
+        telemetry = SearchTelemetry(parallelism=2)
+        telemetry.phases_ms["search"] = 130
+        for i in range(4):
+            telemetry.add_world(
+                summary({"tackle": 1000}, search_ms=50), 0.25, i, 50, cached=False
+            )
+        telemetry.add_world(
+            summary({"tackle": 1000}, search_ms=50), 0.25, 4, 50, cached=True
+        )
+
+        telemetry.estimate_ipc()
+
+        # 4 searches of 50ms on 2 workers is 100ms of the 130ms
+        self.assertAlmostEqual(30, telemetry.phases_ms["ipc"])
+
+
+class TestTelemetrySink(unittest.TestCase):
+    def setUp(self):
+        self.original_telemetry_file = FoulPlayConfig.search_telemetry_file
+        self.directory = tempfile.TemporaryDirectory()
+        FoulPlayConfig.search_telemetry_file = os.path.join(
+            self.directory.name, "telemetry.jsonl"
+        )
+        self.sink = _TelemetrySink()
+
+    def tearDown(self):
+        FoulPlayConfig.search_telemetry_file = self.original_telemetry_file
+        self.directory.cleanup()
+
+    def test_records_are_appended_as_json_lines(self):
+        for turn in range(2):
+            telemetry = SearchTelemetry(battle_tag="battle-1", turn=turn)
+            telemetry.add_world(
+                summary({"tackle": 1000}, search_ms=10), 1, 0, 10, cached=False
+            )
+            self.sink.emit(telemetry)
+
+        with open(FoulPlayConfig.search_telemetry_file) as f:
+            records = [json.loads(line) for line in f]
+
+        self.assertEqual([0, 1], [r["turn"] for r in records])
+        self.assertEqual(1000, records[0]["worlds"][0]["iterations"])
+
+    def test_callbacks_receive_every_record(self):
+        received = []
+        self.sink.add_callback(received.append)
+        telemetry = SearchTelemetry(battle_tag="battle-1", turn=1)
+
+        self.sink.emit(telemetry)
+
+        self.assertEqual([telemetry], received)
+
+    def test_failing_callback_does_not_stop_the_others(self):
+        received = []
+
+        def fail(_):
+            raise RuntimeError("callback failed")
+
+        self.sink.add_callback(fail)
+        self.sink.add_callback(received.append)
+
+        self.sink.emit(SearchTelemetry())
+
+        self.assertEqual(1, len(received))
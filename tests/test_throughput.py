@@ -0,0 +1,85 @@
+import unittest
+
+from config import FoulPlayConfig
+from data import all_move_json
+from fp.search.throughput import LIVE_OBSERVATIONS_TO_TRUST
+from fp.search.throughput import MAX_ITERATION_BUDGET_MS
+from fp.search.throughput import SearchThroughput
+from fp.search.throughput import _SearchThroughput
+from fp.search.throughput import base_search_time_ms
+from fp.search.throughput import reference_battles
+
+
+class TestSearchThroughput(unittest.TestCase):
+    def setUp(self):
+        self.throughput = _SearchThroughput()
+
+    def test_unknown_throughput_has_no_budget(self):
+        self.assertIsNone(self.throughput.time_budget_ms(10000))
+
+    def test_calibrated_throughput_is_used_before_any_search(self):
+        self.throughput.calibrated = 50000
+
+        self.assertEqual(200, self.throughput.time_budget_ms(10000))
+
+    def test_first_live_observation_is_taken_as_is(self):
+        self.throughput.observe(5000, 100)
+
+        self.assertEqual(50000, self.throughput.live)
+
+    def test_live_throughput_takes_over_from_calibration(self):
+        self.throughput.calibrated = 50000
+        self.throughput.observe(2500, 100)
+
+        self.assertGreater(self.throughput.iterations_per_second(), 25000)
+        self.assertLess(self.throughput.iterations_per_second(), 50000)
+
+        for _ in range(LIVE_OBSERVATIONS_TO_TRUST):
+            self.throughput.observe(2500, 100)
+
+        self.assertEqual(25000, self.throughput.iterations_per_second())
+
+    def test_budget_is_capped(self):
+        self.throughput.calibrated = 1
+
+        self.assertEqual(
+            MAX_ITERATION_BUDGET_MS, self.throughput.time_budget_ms(1000000)
+        )
+
+
+class TestBaseSearchTimeMs(unittest.TestCase):
+    def setUp(self):
+        self.original_search_time_ms = getattr(FoulPlayConfig, "search_time_ms", None)
+        self.original_calibrated = SearchThroughput.calibrated
+        FoulPlayConfig.search_time_ms = 100
+
+    def tearDown(self):
+        FoulPlayConfig.search_time_ms = self.original_search_time_ms
+        FoulPlayConfig.search_iterations = None
+        SearchThroughput.calibrated = self.original_calibrated
+
+    def test_search_time_ms_without_an_iteration_target(self):
+        SearchThroughput.calibrated = 50000
+
+        self.assertEqual(100, base_search_time_ms())
+
+    def test_iteration_target_is_converted_to_time(self):
+        FoulPlayConfig.search_iterations = 25000
+        SearchThroughput.calibrated = 50000
+
+        self.assertEqual(500, base_search_time_ms())
+
+    def test_search_time_ms_until_throughput_is_known(self):
+        FoulPlayConfig.search_iterations = 25000
+        SearchThroughput.calibrated = None
+
+        self.assertEqual(100, base_search_time_ms())
+
+
+class TestReferenceBattles(unittest.TestCase):
+    def test_reference_pokemon_have_full_sets(self):
+        for battle in reference_battles():
+            for battler in [battle.user, battle.opponent]:
+                for pkmn in [battler.active] + battler.reserve:
+                    self.assertEqual(4, len(pkmn.moves))
+                    self.assertTrue(all(m.name in all_move_json for m in pkmn.moves))
@@ -0,0 +1,82 @@
+import unittest
+
+from fp.battle import Battle
+from fp.battle import Pokemon
+from fp.search.time_bank import TimeBank
+from fp.search.time_bank import expected_remaining_turns
+from fp.search.time_bank import SAFETY_MARGIN_SECONDS
+from fp.search.time_bank import MIN_TURN_BUDGET_MS
+
+
+class TestTimeBank(unittest.TestCase):
+    def setUp(self):
+        self.battle = Battle(None)
+        self.battle.user.active = Pokemon("pikachu", 100)
+        self.battle.user.reserve = [Pokemon("charmander", 100) for _ in range(5)]
+        self.battle.opponent.active = Pokemon("caterpie", 100)
+        self.time_bank = TimeBank()
+
+    def test_no_budget_when_the_timer_is_not_running(self):
+        self.assertIsNone(self.time_bank.plan_turn_budget_ms(self.battle, now=0))
+        self.assertIsNone(self.time_bank.deadline(self.battle, now=0))
+
+    def test_budget_never_exceeds_time_left_this_turn(self):
+        self.time_bank.observe(10, 1000, now=0)
+
+        budget_ms = self.time_bank.plan_turn_budget_ms(self.battle, now=0)
+
+        self.assertEqual((10 - SAFETY_MARGIN_SECONDS) * 1000, budget_ms)
+
+    def test_budget_accounts_for_time_elapsed_since_the_observation(self):
+        self.time_bank.observe(10, 1000, now=0)
+
+        budget_ms = self.time_bank.plan_turn_budget_ms(self.battle, now=2)
+
+        self.assertEqual((10 - 2 - SAFETY_MARGIN_SECONDS) * 1000, budget_ms)
+
+    def test_budget_spreads_the_bank_over_the_remaining_turns(self):
+        self.time_bank.turn_increment_seconds = 0
+        self.time_bank.observe(150, 65, now=0)
+
+        budget_ms = self.time_bank.plan_turn_budget_ms(self.battle, now=0)
+
+        expected_ms = int(
+            (65 - SAFETY_MARGIN_SECONDS) / expected_remaining_turns(self.battle) * 1000
+        )
+        self.assertEqual(expected_ms, budget_ms)
+
+    def test_budget_has_a_floor(self):
+        self.time_bank.observe(1, 1, now=0)
+
+        budget_ms = self.time_bank.plan_turn_budget_ms(self.battle, now=0)
+
+        self.assertEqual(MIN_TURN_BUDGET_MS, budget_ms)
+
+    def test_deadline_is_relative_to_now(self):
+        self.time_bank.observe(10, 1000, now=100)
+
+        deadline = self.time_bank.deadline(self.battle, now=100)
+
+        self.assertEqual(100 + 10 - SAFETY_MARGIN_SECONDS, deadline)
+
+    def test_turn_increment_is_learned_from_consecutive_observations(self):
+        self.time_bank.turn_increment_seconds = 10
+        self.time_bank.observe(100, 100, now=0)
+        self.time_bank.record_spent(20)
+        self.time_bank.observe(100, 100, now=30)
+
+        # 20 seconds were spent and the bank did not change: 20 were added
+        self.assertEqual(15, self.time_bank.turn_increment_seconds)
+
+    def test_reset_stops_planning(self):
+        self.time_bank.observe(100, 100, now=0)
+        self.time_bank.reset()
+
+        self.assertIsNone(self.time_bank.plan_turn_budget_ms(self.battle, now=0))
+
+    def test_fewer_pokemon_alive_means_fewer_expected_turns(self):
+        full_health_turns = expected_remaining_turns(self.battle)
+        for pkmn in self.battle.user.reserve:
+            pkmn.hp = 0
+
+        self.assertLess(expected_remaining_turns(self.battle), full_health_turns)
@@ -0,0 +1,105 @@
+import os
+import tempfile
+import unittest
+
+from config import FoulPlayConfig
+from fp.search.transposition import MctsMoveSummary
+from fp.search.transposition import _TranspositionTable
+from tests.search_helpers import summary
+
+
+class TestMctsSummary(unittest.TestCase):
+    def test_merge_sums_visits_and_scores_of_the_same_moves(self):
+        merged = summary({"tackle": 10, "growl": 30}, {"tackle": 20}).merge(
+            summary({"tackle": 20, "switch raichu": 40}, {"tackle": 20})
+        )
+
+        self.assertEqual(100, merged.total_visits)
+        self.assertEqual(
+            {
+                "tackle": (15, 30),
+                "growl": (15, 30),
+                "switch raichu": (20, 40),
+            },
+            {o.move_choice: (o.total_score, o.visits) for o in merged.side_one},
+        )
+        self.assertEqual([MctsMoveSummary("tackle", 20, 40)], merged.side_two)
+
+    def test_merge_does_not_modify_either_summary(self):
+        a = summary({"tackle": 10})
+        b = summary({"tackle": 20})
+        a.merge(b)
+
+        self.assertEqual(summary({"tackle": 10}), a)
+        self.assertEqual(summary({"tackle": 20}), b)
+
+
+class TestTranspositionTable(unittest.TestCase):
+    def setUp(self):
+        self.original_cache_size = FoulPlayConfig.search_cache_size
+        FoulPlayConfig.search_cache_size = 2
+        self.table = _TranspositionTable()
+
+    def tearDown(self):
+        FoulPlayConfig.search_cache_size = self.original_cache_size
+
+    def test_miss_searches_the_whole_budget(self):
+        self.assertEqual((None, 100), self.table.lookup("state", 100))
+        self.assertEqual(1, self.table.misses)
+
+    def test_hit_when_the_cached_search_was_at_least_as_long(self):
+        self.table.store("state", 100, summary({"tackle": 10}))
+
+        self.assertEqual((summary({"tackle": 10}), 0), self.table.lookup("state", 50))
+        self.assertEqual(1, self.table.hits)
+
+    def test_partial_hit_only_searches_the_difference(self):
+        self.table.store("state", 100, summary({"tackle": 10}))
+
+        self.assertEqual(
+            (summary({"tackle": 10}), 150), self.table.lookup("state", 250)
+        )
+        self.assertEqual(1, self.table.partial_hits)
+
+    def test_least_recently_used_state_is_evicted(self):
+        self.table.store("a", 100, summary({"tackle": 1}))
+        self.table.store("b", 100, summary({"tackle": 2}))
+        self.table.lookup("a", 100)
+        self.table.store("c", 100, summary({"tackle": 3}))
+
+        self.assertEqual(2, len(self.table))
+        self.assertIsNone(self.table.lookup("b", 100)[0])
+        self.assertIsNotNone(self.table.lookup("a", 100)[0])
+        self.assertIsNotNone(self.table.lookup("c", 100)[0])
+
+    def test_size_of_zero_disables_the_cache(self):
+        FoulPlayConfig.search_cache_size = 0
+        self.table.store("state", 100, summary({"tackle": 10}))
+
+        self.assertEqual(0, len(self.table))
+        self.assertEqual((None, 100), self.table.lookup("state", 100))
+
+    def test_save_and_load_round_trip(self):
+        self.table.store("state", 100, summary({"tackle": 10}))
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "search_cache.json")
+            self.table.save(path)
+
+            loaded = _TranspositionTable()
+            loaded.load(path)
+
+        self.assertEqual((summary({"tackle": 10}), 0), loaded.lookup("state", 100))
+
+    def test_loading_a_file_that_is_not_a_search_cache_leaves_the_cache_empty(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "search_cache.json")
+            with open(path, "w") as f:
+                f.write('[["not hex", 100, {}]]')
+            self.table.load(path)
+
+        self.assertEqual(0, len(self.table))
+
+    def test_loading_a_missing_file_leaves_the_cache_empty(self):
+        self.table.load("/this/file/does/not/exist")
+
+        self.assertEqual(0, len(self.table))
@@ -0,0 +1,62 @@
+import unittest
+
+from constants import BattleType
+from data.pkmn_sets import RandomBattleTeamDatasets
+from fp.battle import Battle
+from fp.battle import Pokemon
+from fp.search.uncertainty import UNREVEALED_POKEMON_BITS
+from fp.search.uncertainty import entropy
+from fp.search.uncertainty import opponent_uncertainty_bits
+from fp.search.uncertainty import policy_spread
+from tests.search_helpers import summary
+
+
+class TestEntropy(unittest.TestCase):
+    def test_uniform_weights(self):
+        self.assertAlmostEqual(2, entropy([3, 3, 3, 3]))
+
+    def test_certain_outcome_has_no_entropy(self):
+        self.assertEqual(0, entropy([5]))
+        self.assertEqual(0, entropy([]))
+
+
+class TestOpponentUncertaintyBits(unittest.TestCase):
+    def setUp(self):
+        RandomBattleTeamDatasets.initialize("gen9")
+        self.battle = Battle("battle-gen9randombattle-1")
+        self.battle.battle_type = BattleType.RANDOM_BATTLE
+        self.battle.opponent.active = Pokemon("garchomp", 77)
+        self.battle.opponent.reserve = [Pokemon("dragapult", 76)]
+
+    def test_unrevealed_pokemon_add_a_fixed_amount(self):
+        self.assertGreaterEqual(
+            opponent_uncertainty_bits(self.battle), 4 * UNREVEALED_POKEMON_BITS
+        )
+
+    def test_fainted_pokemon_are_not_uncertain(self):
+        bits = opponent_uncertainty_bits(self.battle)
+        self.battle.opponent.reserve[0].hp = 0
+        self.assertLessEqual(opponent_uncertainty_bits(self.battle), bits)
+
+
+class TestPolicySpread(unittest.TestCase):
+    def test_worlds_that_agree_have_no_spread(self):
+        results = [
+            (summary({"a": 80, "b": 20}), 0.5, 0),
+            (summary({"a": 8, "b": 2}), 0.5, 1),
+        ]
+        self.assertAlmostEqual(0, policy_spread(results))
+
+    def test_worlds_that_disagree_completely(self):
+        results = [
+            (summary({"a": 10, "b": 0}), 0.5, 0),
+            (summary({"a": 0, "b": 10}), 0.5, 1),
+        ]
+        self.assertAlmostEqual(0.5, policy_spread(results))
+
+    def test_worlds_are_weighted_by_chance(self):
+        results = [
+            (summary({"a": 10, "b": 0}), 0.75, 0),
+            (summary({"a": 0, "b": 10}), 0.25, 1),
+        ]
+        self.assertAlmostEqual(0.375, policy_spread(results))
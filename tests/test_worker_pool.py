@@ -0,0 +1,65 @@
+import os
+import time
+import unittest
+from unittest import mock
+
+from config import FoulPlayConfig
+from fp.search import worker_pool
+from fp.search.worker_pool import _SearchWorkerPool
+
+
+def _initialize_worker(cpu_queue=None):
+    pass
+
+
+def _slow_ping():
+    time.sleep(1)
+    return True
+
+
+class TestSearchWorkerPool(unittest.TestCase):
+    def setUp(self):
+        self.original_parallelism = getattr(FoulPlayConfig, "parallelism", None)
+        FoulPlayConfig.parallelism = 1
+        # the real initializer imports the search engine
+        patcher = mock.patch.object(
+            worker_pool, "_initialize_worker", _initialize_worker
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.pool = _SearchWorkerPool()
+        self.addCleanup(self.pool.shutdown)
+
+    def tearDown(self):
+        FoulPlayConfig.parallelism = self.original_parallelism
+
+    def break_pool(self):
+        self.pool.get_executor().submit(os._exit, 1).exception(timeout=5)
+
+    def test_restart_starts_a_new_pool(self):
+        executor = self.pool.get_executor()
+        self.pool.restart()
+
+        self.assertIsNot(executor, self.pool.get_executor())
+        self.assertEqual(4, self.pool.submit(abs, -4).result(timeout=5))
+
+    def test_healthy_pool_passes_the_health_check(self):
+        executor = self.pool.get_executor()
+
+        self.assertTrue(self.pool.health_check())
+        self.assertIs(executor, self.pool.get_executor())
+
+    def test_broken_pool_fails_the_health_check_and_is_respawned(self):
+        self.break_pool()
+
+        self.assertFalse(self.pool.health_check())
+        self.assertTrue(self.pool.health_check())
+
+    def test_stuck_pool_fails_the_health_check(self):
+        with mock.patch.object(worker_pool, "_ping", _slow_ping):
+            self.assertFalse(self.pool.health_check(timeout=0.05))
+
+    def test_submitting_to_a_broken_pool_respawns_it(self):
+        self.break_pool()
+
+        self.assertEqual(4, self.pool.submit(abs, -4).result(timeout=5))
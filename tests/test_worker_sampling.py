@@ -0,0 +1,63 @@
+import pickle
+import random
+import unittest
+
+from data.pkmn_sets import RandomBattleTeamDatasets
+from fp.battle import Battle
+from fp.battle import Pokemon
+from fp.search.worker_sampling import _SamplingDatasets
+from fp.search.worker_sampling import datasets_key
+from fp.search.worker_sampling import sampling_chunks
+
+
+class TestSamplingChunks(unittest.TestCase):
+    def test_battles_are_split_evenly(self):
+        chunks = sampling_chunks(10, 4, rng=random.Random(1))
+        self.assertEqual([3, 3, 2, 2], [n for _, n in chunks])
+
+    def test_no_more_chunks_than_battles(self):
+        self.assertEqual(2, len(sampling_chunks(2, 8)))
+
+    def test_every_chunk_has_its_own_seed(self):
+        chunks = sampling_chunks(8, 4, rng=random.Random(1))
+        self.assertEqual(4, len({seed for seed, _ in chunks}))
+        self.assertEqual(chunks, sampling_chunks(8, 4, rng=random.Random(1)))
+
+
+class TestSamplingDatasets(unittest.TestCase):
+    def setUp(self):
+        RandomBattleTeamDatasets.initialize("gen9")
+
+    def tearDown(self):
+        RandomBattleTeamDatasets.initialize("gen9")
+
+    def test_installing_published_datasets_restores_them(self):
+        datasets = _SamplingDatasets()
+        key, path = datasets.publish()
+        RandomBattleTeamDatasets.initialize("gen8")
+        self.assertNotEqual(key, datasets_key())
+
+        datasets.install(key, path)
+
+        self.assertEqual("gen9", RandomBattleTeamDatasets.pkmn_mode)
+        self.assertEqual(key, datasets_key())
+
+    def test_publishing_the_same_datasets_twice_writes_them_once(self):
+        datasets = _SamplingDatasets()
+        self.assertEqual(datasets.publish(), datasets.publish())
+
+
+class TestBattleCanBeSentToAWorker(unittest.TestCase):
+    def test_battle_pickles(self):
+        battle = Battle("battle-gen9randombattle-1")
+        battle.user.active = Pokemon("pikachu", 80)
+        battle.user.active.boosts["attack"] += 1
+        battle.opponent.active = Pokemon("garchomp", 77)
+
+        unpickled = pickle.loads(pickle.dumps(battle))
+
+        self.assertEqual(1, unpickled.user.active.boosts["attack"])
+        self.assertEqual(0, unpickled.user.active.boosts["defense"])
+        self.assertEqual(
+            battle.opponent.active.speed_range, unpickled.opponent.active.speed_range
+        )